@@ -0,0 +1,68 @@
+"""
+A benchmark of password verification of logins (bcrypt) by the number of hashing processes
+and the cost factor: logins per second of a burst of concurrent logins and the latency
+of a light request (e.g. a quiz answer) served by another thread during the burst.
+
+Zero processes means hashing inline on request threads (as before "auth.hashing").
+
+Usage (no database is required):
+    python -m benchmarks.auth_login_throughput
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+from threading import Event, Thread
+from time import perf_counter, sleep
+#
+from src.auth.hashing import PasswordHasher, hash_password
+
+
+def measure_light_requests(stop, latencies):
+    """
+    Serves light requests (a small Python computation) until the burst stops.
+
+    :param threading.Event stop: the end of the burst
+    :param list latencies: latencies of the requests, seconds
+    """
+    while not stop.is_set():
+        started = perf_counter()
+        sum(number * number for number in range(2000))
+        latencies.append(perf_counter() - started)
+        sleep(0.005)
+
+
+def bench_logins(max_workers, rounds, num_logins=64, num_threads=8):
+    """
+    Measures a burst of concurrent logins.
+
+    :param int max_workers: the number of hashing processes (0: inline)
+    :param int rounds: the cost factor
+    :param int num_logins: the number of logins of the burst
+    :param int num_threads: the number of request threads
+    :return tuple: logins per second, median latency of light requests (ms)
+    """
+    hasher = PasswordHasher(rounds, max_workers, queue_size=num_logins, timeout=600)
+    password_hash = hash_password("password", rounds)
+    hasher.verify(password_hash, "password")  # starts the pool of processes
+    stop, latencies = Event(), []
+    light_requests = Thread(target=measure_light_requests, args=(stop, latencies))
+    light_requests.start()
+    started = perf_counter()
+    with ThreadPoolExecutor(num_threads) as threads:
+        results = list(threads.map(lambda _: hasher.verify(password_hash, "password"),
+                                   range(num_logins)))
+    seconds = perf_counter() - started
+    stop.set()
+    light_requests.join()
+    assert all(results)
+    if hasher._executor:  # pylint: disable=W0212
+        hasher._executor.shutdown()  # pylint: disable=W0212
+    return num_logins / seconds, median(latencies) * 1000
+
+
+if __name__ == "__main__":
+    print("cost | processes | logins/s | light request, ms")
+    for cost in (10, 12):
+        for workers in (0, 1, 2, 4):
+            rate, latency = bench_logins(workers, cost)
+            print(f"{cost:4} | {workers:9} | {rate:8.1f} | {latency:17.2f}")
@@ -0,0 +1,130 @@
+"""
+A benchmark of delivery of a burst of emails (e.g. password resets) to a local SMTP server
+(aiosmtpd) by the number of outbox workers and the batch size: emails per second,
+SMTP connections and the peak number of threads of the process.
+
+"threads" is the delivery of every email by a new thread on a new connection
+(as before "main.outbox").
+
+Usage (no database is required, aiosmtpd is):
+    python -m benchmarks.mail_outbox_throughput
+"""
+
+import socket
+import threading
+from time import perf_counter, sleep
+#
+from aiosmtpd.controller import Controller
+from flask import Flask
+from flask_mail import Message
+#
+from src import mail
+from src.main.outbox import mail_outbox
+
+
+class CountingHandler:
+    """
+    Counts accepted emails, every email takes "delay" seconds to accept.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.num_emails = 0
+
+    async def handle_DATA(self, server, session, envelope):  # pylint: disable=C0103,W0613
+        self.num_emails += 1
+        if self.delay:
+            sleep(self.delay)  # blocks the server like a slow relay
+        return "250 Message accepted for delivery"
+
+
+def make_app(port, num_workers, batch_size):
+    """
+    Creates a minimal app delivering emails to a local SMTP server.
+
+    :param int port: the port of the server
+    :param int num_workers: the number of outbox workers
+    :param int batch_size: emails per SMTP connection
+    :return flask.Flask: an instance of the Flask App
+    """
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_OUTBOX_WORKERS=num_workers, MAIL_OUTBOX_BATCH_SIZE=batch_size,
+                      MAIL_OUTBOX_SIZE=10000)
+    mail.init_app(app)
+    mail_outbox.init_app(app)
+    return app
+
+
+def send_by_threads(app, messages):
+    """
+    Delivers every email by a new thread.
+
+    :param flask.Flask app: an instance of the Flask App
+    :param list messages: emails
+    """
+    def send(message):
+        with app.app_context():
+            mail.send(message)
+
+    threads = [threading.Thread(target=send, args=(message,)) for message in messages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def bench_delivery(num_workers, batch_size, num_emails=500, delay=0.001):
+    """
+    Measures a burst of emails.
+
+    :param int num_workers: the number of outbox workers (0: a thread per email)
+    :param int batch_size: emails per SMTP connection
+    :param int num_emails: the number of emails of the burst
+    :param float delay: seconds the server takes per email
+    :return tuple: emails per second, connections, the peak number of threads
+    """
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+    handler = CountingHandler(delay)
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    app = make_app(port, num_workers, batch_size)
+    messages = [Message(subject="Password reset request", sender="snaketests.app@gmail.com",
+                        recipients=[f"user{number}@doe.com"], body="Text")
+                for number in range(num_emails)]
+    peak_threads, stop = [threading.active_count()], threading.Event()
+
+    def watch():
+        while not stop.is_set():
+            peak_threads.append(threading.active_count())
+            sleep(0.001)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    started = perf_counter()
+    with app.app_context():
+        if num_workers:
+            for message in messages:
+                mail_outbox.send(message)
+            mail_outbox.flush()
+            connections = mail_outbox.get_stats()["connections"]
+        else:
+            send_by_threads(app, messages)
+            connections = num_emails
+    seconds = perf_counter() - started
+    stop.set()
+    watcher.join()
+    mail_outbox.stop()
+    controller.stop()
+    assert handler.num_emails == num_emails
+    return num_emails / seconds, connections, max(peak_threads)
+
+
+if __name__ == "__main__":
+    print("workers | batch | emails/s | connections | peak threads")
+    for workers, batch in ((0, 1), (1, 20), (2, 20), (2, 100), (4, 20)):
+        rate, num_connections, threads = bench_delivery(workers, batch)
+        label = "threads" if not workers else workers
+        print(f"{label:>7} | {batch:5} | {rate:8.1f} | {num_connections:11} | {threads:12}")
@@ -3,6 +3,7 @@ A module with configurations for Flask App instance.
 """
 
 import os
+import tempfile
 #
 from dotenv import load_dotenv
 
@@ -33,9 +34,46 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') or True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_OUTBOX_SIZE = int(os.environ.get('MAIL_OUTBOX_SIZE') or 1000)  # queued emails per process
+    MAIL_OUTBOX_WORKERS = int(os.environ.get('MAIL_OUTBOX_WORKERS') or 2)  # SMTP connections
+    MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE') or 20)  # per connection
+    MAIL_OUTBOX_RETRIES = int(os.environ.get('MAIL_OUTBOX_RETRIES') or 3)
+    MAIL_OUTBOX_BACKOFF_SEC = float(os.environ.get('MAIL_OUTBOX_BACKOFF_SEC') or 1)  # doubled
+    MAIL_OUTBOX_IDLE_SEC = int(os.environ.get('MAIL_OUTBOX_IDLE_SEC') or 5)  # closes a connection
     #
     TABLES_PER_PAGE = 5
     POSTS_PER_PAGE = 10
+    POSTS_API_PAGE_SIZE = 100  # the maximal number of posts per page of PostsAPI
+    API_STREAM_CHUNK_SIZE = 1000  # rows per fetch and per chunk of streamed REST collections
+    API_BATCH_SIZE = int(os.environ.get('API_BATCH_SIZE') or 500)  # items per bulk REST request
+    FEEDBACK_LATEST_POSTS = 3  # posts of the feedback panel of a test
+    FEEDBACK_TOP_AUTHORS = 3  # authors of the feedback panel of a test
+    #
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS') or 12)  # cost of password hashes
+    AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS') or 2)  # processes, 0: inline
+    AUTH_HASH_QUEUE_SIZE = int(os.environ.get('AUTH_HASH_QUEUE_SIZE') or 16)  # waiting hashes
+    AUTH_HASH_TIMEOUT_SEC = int(os.environ.get('AUTH_HASH_TIMEOUT_SEC') or 5)
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)  # proxies setting X-Forwarded-For
+    AUTH_THROTTLE_IP_LIMIT = int(os.environ.get('AUTH_THROTTLE_IP_LIMIT') or 20)  # logins/window
+    AUTH_THROTTLE_ACCOUNT_LIMIT = int(os.environ.get('AUTH_THROTTLE_ACCOUNT_LIMIT') or 5)
+    AUTH_THROTTLE_WINDOW_SEC = int(os.environ.get('AUTH_THROTTLE_WINDOW_SEC') or 300)
+    AUTH_THROTTLE_SLOTS = 4096  # buckets of the table (24 bytes each)
+    AUTH_THROTTLE_FILE = os.environ.get('AUTH_THROTTLE_FILE') or \
+        os.path.join(tempfile.gettempdir(), 'quiz_login_throttle.bin')  # shared by workers
+    AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE') or 1024)  # users per process
+    AUTH_USER_CACHE_REVALIDATE_SEC = int(os.environ.get('AUTH_USER_CACHE_REVALIDATE_SEC') or 5)
+    AUTH_USER_CACHE_EPOCH_SLOTS = 4096  # invalidation counters (8 bytes each)
+    AUTH_USER_CACHE_EPOCH_FILE = os.environ.get('AUTH_USER_CACHE_EPOCH_FILE') or \
+        os.path.join(tempfile.gettempdir(), 'quiz_user_epochs.bin')  # shared by workers
+    QUIZ_CACHE_SIZE = int(os.environ.get('QUIZ_CACHE_SIZE') or 256)  # compiled tests per process
+    QUIZ_CACHE_REVALIDATE_SEC = int(os.environ.get('QUIZ_CACHE_REVALIDATE_SEC') or 5)
+    QUIZ_STATELESS_PROGRESS = os.environ.get('QUIZ_STATELESS_PROGRESS') == 'True'  # signed tokens
+    QUIZ_PROGRESS_TOKEN_MAX_AGE = int(os.environ.get('QUIZ_PROGRESS_TOKEN_MAX_AGE') or 4 * 3600)
+    QUIZ_PROGRESS_STEP_SLOTS = 65536  # steps of progress tokens of results (16 bytes each)
+    QUIZ_PROGRESS_STEP_FILE = os.environ.get('QUIZ_PROGRESS_STEP_FILE') or \
+        os.path.join(tempfile.gettempdir(), 'quiz_progress_steps.bin')  # shared by workers
+    QUIZ_LEADERBOARD_SIZE = int(os.environ.get('QUIZ_LEADERBOARD_SIZE') or 10)  # top-N per test
+    QUIZ_TYPEAHEAD_SIZE = 10  # tests suggested by the test picker
     #
     RECAPTCHA_PUBLIC_KEY = os.environ.get('RECAPTCHA_PUBLIC_KEY')
     RECAPTCHA_PRIVATE_KEY = os.environ.get('RECAPTCHA_PRIVATE_KEY')
@@ -32,6 +32,16 @@ target_metadata = current_app.extensions['migrate'].db.metadata
 # ... etc.
 
 
+# full-text search objects of posts are maintained by hand (see "src.posts.search")
+UNMAPPED_SEARCH_OBJECTS = ("search_vector", "ix_post_search_vector", "post_fts")
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Skip database objects which are not mapped by models."""
+    return not (reflected and compare_to is None and
+                (name in UNMAPPED_SEARCH_OBJECTS or name.startswith("post_fts_")))
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -46,7 +56,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -78,6 +89,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
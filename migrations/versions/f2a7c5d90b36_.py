@@ -0,0 +1,51 @@
+"""empty message
+
+Revision ID: f2a7c5d90b36
+Revises: e8b4d61a2c95
+Create Date: 2026-10-18 20:14:06.518342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c5d90b36'
+down_revision = 'e8b4d61a2c95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # full-text search of posts (see "src.posts.search"), not detected by autogenerate
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                   "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED")
+        op.create_index('ix_post_search_vector', 'post', [sa.text('search_vector')],
+                        unique=False, postgresql_using='gin')
+    elif op.get_bind().dialect.name == "sqlite":
+        op.execute("CREATE VIRTUAL TABLE post_fts USING fts5("
+                   "title, content, content='post', content_rowid='id')")
+        op.execute("CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN "
+                   "INSERT INTO post_fts(rowid, title, content) "
+                   "VALUES (new.id, new.title, new.content); END")
+        op.execute("CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN "
+                   "INSERT INTO post_fts(post_fts, rowid, title, content) "
+                   "VALUES ('delete', old.id, old.title, old.content); END")
+        op.execute("CREATE TRIGGER post_fts_update AFTER UPDATE ON post BEGIN "
+                   "INSERT INTO post_fts(post_fts, rowid, title, content) "
+                   "VALUES ('delete', old.id, old.title, old.content); "
+                   "INSERT INTO post_fts(rowid, title, content) "
+                   "VALUES (new.id, new.title, new.content); END")
+        op.execute("INSERT INTO post_fts(post_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index('ix_post_search_vector', table_name='post')
+        op.drop_column('post', 'search_vector')
+    elif op.get_bind().dialect.name == "sqlite":
+        for trigger in ("post_fts_insert", "post_fts_delete", "post_fts_update"):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE post_fts")
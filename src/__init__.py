@@ -9,18 +9,17 @@ import uuid
 #
 from flask import Flask
 from flask_admin import Admin
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_migrate import Migrate
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 #
 from config import Config
 
 admin = Admin(name="SnakeTests", template_mode="bootstrap4")
 db = SQLAlchemy()
-bcrypt = Bcrypt()
 login_manager = LoginManager()
 login_manager.login_view = "auth.login_page"
 login_manager.login_message_category = "info"
@@ -39,13 +38,17 @@ def instantiate_app(config_class=Config):  # application factory
     """
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if app.config.get("PROXY_FIX_X_FOR"):  # client IPs (e.g. of the login throttle) behind proxies
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
     # ORM #
     db.init_app(app)
     # ADMIN #
-    from src.auth.admin import AlteredAdminIndexView, AlteredModelView  # prevents circular import
+    from src.auth.admin import AlteredAdminIndexView, AlteredModelView, \
+        AnswerSheetView, QuestionStatsView  # prevents circular import
     from src.auth.models import User  # prevents circular import
     from src.posts.models import Post  # prevents circular import
-    from src.quiz.models import Option, Result, Test, Question  # prevents circular import
+    from src.quiz.models import Option, Result, Test, Question, \
+        QuestionStats  # prevents circular import
     admin.init_app(app, index_view=AlteredAdminIndexView())
     admin.add_view(AlteredModelView(User, db.session))
     admin.add_view(AlteredModelView(Post, db.session))
@@ -53,18 +56,34 @@ def instantiate_app(config_class=Config):  # application factory
     admin.add_view(AlteredModelView(Result, db.session, category="Quiz"))
     admin.add_view(AlteredModelView(Test, db.session, category="Quiz"))
     admin.add_view(AlteredModelView(Question, db.session, category="Quiz"))
+    admin.add_view(QuestionStatsView(QuestionStats, db.session, category="Quiz"))
+    admin.add_view(AnswerSheetView(name="Answer sheets", category="Quiz"))
     #
-    bcrypt.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
     migrate.init_app(app, db)
+    from src.auth.cache import user_cache  # prevents circular import
+    user_cache.init_app(app)
+    from src.auth.hashing import password_hasher  # prevents circular import
+    password_hasher.init_app(app)
+    from src.auth.throttle import login_throttle  # prevents circular import
+    login_throttle.init_app(app)
+    from src.main.outbox import mail_outbox  # prevents circular import
+    mail_outbox.init_app(app)
+    from src.quiz.cache import test_cache  # prevents circular import
+    test_cache.init_app(app)
+    from src.quiz.tokens import progress_steps  # prevents circular import
+    progress_steps.init_app(app)
     #
     # BluePrints and RESTApi #
     from src.auth import bp as auth_bp  # prevents circular import
     auth_api = Api(auth_bp)
-    from src.auth.rest import UserAPI, UsersAPI  # prevents circular import
+    from src.auth.rest import UserAPI, UserCacheAPI, UsersAPI, \
+        UsersBatchAPI  # prevents circular import
     auth_api.add_resource(UserAPI, "/api/users/<string:user_uuid>")
     auth_api.add_resource(UsersAPI, "/api/users/")
+    auth_api.add_resource(UsersBatchAPI, "/api/users/batch")
+    auth_api.add_resource(UserCacheAPI, "/api/users/cache")
     app.register_blueprint(auth_bp, url_prefix='/auth')
     #
     from src.errors import bp as errors_bp  # prevents circular import
@@ -74,13 +93,17 @@ def instantiate_app(config_class=Config):  # application factory
     app.register_blueprint(main_bp)
     #
     from src.posts import bp as posts_bp  # prevents circular import
-    from src.posts.rest import PostAPI, PostsAPI  # prevents circular import
+    from src.posts.rest import PostAPI, PostsAPI, PostsBatchAPI  # prevents circular import
     posts_api = Api(posts_bp)
     posts_api.add_resource(PostAPI, "/api/posts/<string:post_uuid>")
     posts_api.add_resource(PostsAPI, "/api/posts/")
+    posts_api.add_resource(PostsBatchAPI, "/api/posts/batch")
     app.register_blueprint(posts_bp)
     #
     from src.quiz import bp as quiz_bp  # prevents circular import
+    from src.quiz.rest import LeaderboardAPI  # prevents circular import
+    quiz_api = Api(quiz_bp)
+    quiz_api.add_resource(LeaderboardAPI, "/api/tests/<string:test_uuid>/leaderboard")
     app.register_blueprint(quiz_bp)
     # - #
     # LOGGING #
@@ -129,13 +152,17 @@ def instantiate_test_app(config_class=Config):  # application factory
     """
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if app.config.get("PROXY_FIX_X_FOR"):  # client IPs (e.g. of the login throttle) behind proxies
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
     # ORM #
     db.init_app(app)
     # ADMIN #
-    from src.auth.admin import AlteredAdminIndexView, AlteredModelView  # prevents circular import
+    from src.auth.admin import AlteredAdminIndexView, AlteredModelView, \
+        AnswerSheetView, QuestionStatsView  # prevents circular import
     from src.auth.models import User  # prevents circular import
     from src.posts.models import Post  # prevents circular import
-    from src.quiz.models import Option, Result, Test, Question  # prevents circular import
+    from src.quiz.models import Option, Result, Test, Question, \
+        QuestionStats  # prevents circular import
     admin.init_app(app, index_view=AlteredAdminIndexView())
     admin.add_view(AlteredModelView(User, db.session, endpoint=f"{uuid.uuid4().hex}",))
     admin.add_view(AlteredModelView(Post, db.session, endpoint=f"{uuid.uuid4().hex}",))
@@ -147,17 +174,35 @@ def instantiate_test_app(config_class=Config):  # application factory
                                     category="Quiz"))
     admin.add_view(AlteredModelView(Question, db.session, endpoint=f"{uuid.uuid4().hex}",
                                     category="Quiz"))
-    bcrypt.init_app(app)
+    admin.add_view(QuestionStatsView(QuestionStats, db.session, endpoint=f"{uuid.uuid4().hex}",
+                                     category="Quiz"))
+    admin.add_view(AnswerSheetView(name="Answer sheets", endpoint=f"{uuid.uuid4().hex}",
+                                   category="Quiz"))
     login_manager.init_app(app)
     mail.init_app(app)
     migrate.init_app(app, db)
+    from src.auth.cache import user_cache  # prevents circular import
+    user_cache.init_app(app)
+    from src.auth.hashing import password_hasher  # prevents circular import
+    password_hasher.init_app(app)
+    from src.auth.throttle import login_throttle  # prevents circular import
+    login_throttle.init_app(app)
+    from src.main.outbox import mail_outbox  # prevents circular import
+    mail_outbox.init_app(app)
+    from src.quiz.cache import test_cache  # prevents circular import
+    test_cache.init_app(app)
+    from src.quiz.tokens import progress_steps  # prevents circular import
+    progress_steps.init_app(app)
     #
     # BluePrints and RESTApi #
     from src.auth import bp as auth_bp  # prevents circular import
     auth_api = Api(auth_bp)
-    from src.auth.rest import UserAPI, UsersAPI  # prevents circular import
+    from src.auth.rest import UserAPI, UserCacheAPI, UsersAPI, \
+        UsersBatchAPI  # prevents circular import
     auth_api.add_resource(UserAPI, "/api/users/<string:user_uuid>", endpoint=f"{uuid.uuid4().hex}")
     auth_api.add_resource(UsersAPI, "/api/users/", endpoint=f"{uuid.uuid4().hex}")
+    auth_api.add_resource(UsersBatchAPI, "/api/users/batch", endpoint=f"{uuid.uuid4().hex}")
+    auth_api.add_resource(UserCacheAPI, "/api/users/cache", endpoint=f"{uuid.uuid4().hex}")
     app.register_blueprint(auth_bp, url_prefix='/auth')
     #
     from src.errors import bp as errors_bp  # prevents circular import
@@ -167,12 +212,17 @@ def instantiate_test_app(config_class=Config):  # application factory
     app.register_blueprint(main_bp)
     #
     from src.posts import bp as posts_bp  # prevents circular import
-    from src.posts.rest import PostAPI, PostsAPI  # prevents circular import
+    from src.posts.rest import PostAPI, PostsAPI, PostsBatchAPI  # prevents circular import
     posts_api = Api(posts_bp)
     posts_api.add_resource(PostAPI, "/api/posts/<string:post_uuid>", endpoint=f"{uuid.uuid4().hex}")
     posts_api.add_resource(PostsAPI, "/api/posts/", endpoint=f"{uuid.uuid4().hex}")
+    posts_api.add_resource(PostsBatchAPI, "/api/posts/batch", endpoint=f"{uuid.uuid4().hex}")
     app.register_blueprint(posts_bp)
     #
     from src.quiz import bp as quiz_bp  # prevents circular import
+    from src.quiz.rest import LeaderboardAPI  # prevents circular import
+    quiz_api = Api(quiz_bp)
+    quiz_api.add_resource(LeaderboardAPI, "/api/tests/<string:test_uuid>/leaderboard",
+                          endpoint=f"{uuid.uuid4().hex}")
     app.register_blueprint(quiz_bp)
     return app
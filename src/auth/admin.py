@@ -3,10 +3,22 @@ A module which manages ADMIN panel functionality.
 """
 
 
-from flask import flash
-from flask_admin import AdminIndexView
+from io import TextIOWrapper
+#
+from flask import flash, redirect, url_for
+from flask_admin import AdminIndexView, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user, AnonymousUserMixin
+#
+from src import db
+from src.auth.cache import user_cache
+from src.auth.models import User
+from src.posts.models import FeedbackSummary, Post
+from src.quiz.analysis import reset_test_stats
+from src.quiz.cache import resolve_test_id, test_cache
+from src.quiz.forms import AnswerSheetForm
+from src.quiz.grading import grade_sheet
+from src.quiz.models import LeaderboardEntry, Option, Question, Result, ScoreBin, Test
 
 
 class AdminMixin:  # mixin reduces code duplication
@@ -20,7 +32,10 @@ class AdminMixin:  # mixin reduces code duplication
 
     create_modal = True  # uses modals stead of typical forms
     edit_modal = True
-    form_excluded_columns = ['uuid']  # uuid will not be accessible from the panel
+    form_excluded_columns = ['uuid', 'version',  # uuid and row versions are not editable
+                             'num_questions', 'stats',  # maintained by events/analysis of tests
+                             'answers', 'answer_times', 'answered_at',  # logs of results
+                             'is_analysed']
 
     def is_accessible(self):
         """
@@ -41,8 +56,77 @@ class AlteredModelView(AdminMixin, ModelView):  # restricts access to ORM models
     methods:
       - create_model
       - update_model
+      - delete_model
+      - refresh_leaderboard
+      - get_leaderboard_key
+      - get_feedback_test_id
+      - refresh_feedback
     """
 
+    @staticmethod
+    def refresh_leaderboard(*keys):
+        """
+        Rebuilds leaderboard entries and histograms of scores
+        affected by results changed from the admin panel.
+
+        :param tuple keys: pairs of primary keys of a test and of a user (None is ignored)
+        """
+        keys = set(filter(None, keys))
+        for test_id, user_id in keys:
+            LeaderboardEntry.rebuild(test_id, [user_id])
+        for test_id in {test_id for test_id, _ in keys}:
+            ScoreBin.rebuild(test_id)
+        if keys:
+            db.session.commit()
+
+    @staticmethod
+    def get_leaderboard_key(model):
+        """
+        Finds the leaderboard entry (and the histogram) a "Result" ORM instance affects.
+
+        :param SQLAlchemy().Model model: an instance of an SQL ORM model
+        :return tuple/NoneType: primary keys of a test and of a user/None for other models
+        """
+        return (model.test_id, model.user_id) if isinstance(model, Result) else None
+
+    @staticmethod
+    def get_feedback_test_id(model):
+        """
+        Finds the test whose feedback summary a "Post" or a "Test" ORM instance affects.
+
+        :param SQLAlchemy().Model model: an instance of an SQL ORM model
+        :return int/NoneType: the primary key of a test/None for other models
+        """
+        if isinstance(model, Post):
+            return model.test_id
+        return model.id if isinstance(model, Test) else None
+
+    @staticmethod
+    def refresh_feedback(*test_ids):
+        """
+        Refreshes feedback summaries of tests
+        affected by posts changed from the admin panel.
+
+        :param tuple test_ids: primary keys of tests (None is ignored)
+        """
+        test_ids = set(filter(None, test_ids))
+        if test_ids:
+            FeedbackSummary.refresh(test_ids)
+            db.session.commit()
+
+    @staticmethod
+    def reset_item_stats(model, *test_ids):
+        """
+        Resets item statistics of tests whose questions or answer keys
+        have been changed from the admin panel (see "flask quiz item-stats").
+
+        :param SQLAlchemy().Model model: an instance of an SQL ORM model
+        :param tuple test_ids: primary keys of tests (None is ignored)
+        """
+        if isinstance(model, (Question, Option)):
+            for test_id in set(filter(None, test_ids)):
+                reset_test_stats(test_id)
+
     def create_model(self, form):
         """
         Extends "create_model" method of the ModelView class.
@@ -51,8 +135,13 @@ class AlteredModelView(AdminMixin, ModelView):  # restricts access to ORM models
 
         :param form: the form for creation of an object
         """
-        super().create_model(form=form)
+        model = super().create_model(form=form)
+        if model:
+            test_cache.invalidate_model(model)  # compiled tests must not serve stale questions
+            self.refresh_leaderboard(self.get_leaderboard_key(model))
+            self.refresh_feedback(self.get_feedback_test_id(model))
         flash("Model created", category="success")
+        return model
 
     def update_model(self, form, model):
         """
@@ -63,8 +152,46 @@ class AlteredModelView(AdminMixin, ModelView):  # restricts access to ORM models
         :param FlaskForm form: the form for alteration of an object
         :param SQLAlchemy().Model model: the model of an object to be altered
         """
-        super().update_model(form=form, model=model)
+        previous_test_id = resolve_test_id(model)  # a question/option may move to another test
+        previous_key = self.get_leaderboard_key(model)  # a result may move to another user/test
+        previous_feedback_id = self.get_feedback_test_id(model)  # a post may move to another test
+        previous_username = getattr(model, "username", None)
+        is_updated = super().update_model(form=form, model=model)
+        if is_updated:
+            test_cache.invalidate_test(previous_test_id)
+            if resolve_test_id(model) != previous_test_id:
+                test_cache.invalidate_model(model)
+            self.refresh_leaderboard(previous_key, self.get_leaderboard_key(model))
+            self.refresh_feedback(previous_feedback_id, self.get_feedback_test_id(model))
+            self.reset_item_stats(model, previous_test_id, resolve_test_id(model))
+            if isinstance(model, User):  # profiles and permissions are cached per process
+                user_cache.invalidate(model.id)
+                if model.username != previous_username:  # summaries store usernames of authors
+                    FeedbackSummary.refresh_authors([model.id])
+                    db.session.commit()
         flash("Model altered", category="success")
+        return is_updated
+
+    def delete_model(self, model):
+        """
+        Extends "delete_model" method of the ModelView class.
+        Governs the removal of an existing DB object
+        from the admin panel.
+
+        :param SQLAlchemy().Model model: the model of an object to be removed
+        """
+        test_id = resolve_test_id(model)
+        leaderboard_key = self.get_leaderboard_key(model)
+        feedback_id = self.get_feedback_test_id(model)
+        is_deleted = super().delete_model(model)
+        if is_deleted:
+            test_cache.invalidate_test(test_id)
+            self.refresh_leaderboard(leaderboard_key)
+            self.refresh_feedback(feedback_id)
+            self.reset_item_stats(model, test_id)  # positions of options may shift
+            if isinstance(model, User):
+                user_cache.invalidate(model.id)
+        return is_deleted
 
 
 class AlteredAdminIndexView(AdminMixin, AdminIndexView):  # restricts access to the admin page
@@ -72,3 +199,59 @@ class AlteredAdminIndexView(AdminMixin, AdminIndexView):  # restricts access to
     A class which manages main admin panel page
     and its accessibility.
     """
+
+
+class QuestionStatsView(AlteredModelView):  # statistics are written by "flask quiz item-stats"
+    """
+    A class which displays item statistics
+    of questions in admin panel (read-only).
+    """
+
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = ["question", "num_responses", "difficulty", "discrimination", "option_counts",
+                   "mean_answer_time"]
+    column_default_sort = ("question_id", False)
+
+
+class AnswerSheetView(AdminMixin, BaseView):  # grades paper and offline tests
+    """
+    A class which manages the upload of answer sheets
+    from admin panel.
+
+    methods:
+      - index
+    """
+
+    @expose("/", methods=("GET", "POST"))
+    def index(self):
+        """
+        Grades an uploaded CSV answer sheet and records
+        finished results of its students.
+
+        :return str: an HTML template for the upload page
+        """
+        form = AnswerSheetForm()
+        form.test.choices = [(str(test.uuid), test.title)
+                             for test in Test.query.order_by(Test.title)]
+        if form.validate_on_submit():
+            test = test_cache.get(form.test.data)
+            if test is None:  # deleted after the choices were listed
+                flash("The test does not exist anymore", category="danger")
+                return redirect(url_for(".index"))
+            sheet = TextIOWrapper(form.sheet.data.stream, encoding="utf-8-sig")
+            try:
+                report = grade_sheet(test, sheet, form.chunk_size.data)
+            except (ValueError, UnicodeDecodeError) as error:
+                flash(f"The sheet is rejected: {error}", category="danger")
+            else:
+                if report.unknown_users:
+                    flash(f"Unknown users skipped: {', '.join(report.unknown_users)}",
+                          category="warning")
+                flash(f"{report.num_graded} result(s) recorded, "
+                      f"{report.num_invalid} invalid answer(s), "
+                      f"mean score {report.mean_correct:.2f} out of {test.num_questions}",
+                      category="success")
+                return redirect(url_for(".index"))
+        return self.render("admin/answer_sheet.html", form=form)
@@ -0,0 +1,168 @@
+"""
+This module implements a per-process identity cache
+of "User" ORM instances which serves the user loader
+of Flask-Login on every authenticated request.
+"""
+
+import struct
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+#
+from sqlalchemy.orm import make_transient_to_detached
+#
+from src import db
+from src.auth.models import User
+from src.main.mapped import MappedTable
+
+_EPOCH = struct.Struct("<Q")  # a counter of invalidations
+
+
+def detach_user(user):
+    """
+    Copies the columns of a "User" ORM instance into a detached instance
+    which is never attached to a session (a read-only snapshot).
+
+    :param User user: an instance of "User" ORM model
+    :return User: a detached copy of the user
+    """
+    snapshot = User(**{column.key: getattr(user, column.key)
+                       for column in User.__mapper__.column_attrs})
+    make_transient_to_detached(snapshot)  # as if loaded: no pending changes
+    return snapshot
+
+
+class UserIdentityCache:
+    """
+    A bounded LRU cache of detached snapshots of users keyed by the primary key.
+    Invalidations are published to all processes of a node as epochs:
+    counters of slots (user id modulo the number of slots) in a memory-mapped file,
+    slot 0 counts invalidations of all users. Every hit compares the epochs
+    a snapshot was loaded at with the current ones (a memory read),
+    so that a user changed and invalidated in another worker (e.g. a demoted admin)
+    is reloaded by the next request.
+    A snapshot is trusted for a short period of time;
+    afterwards its row version is compared to the "user.version" column,
+    so that users changed without an invalidation (e.g. on another node) are picked up
+    (stale copies cannot overwrite newer rows either: updates check the version).
+    Requests get a copy of the snapshot merged into their session without a query.
+
+    Methods:
+        - init_app
+        - get
+        - invalidate
+        - get_stats
+    """
+
+    def __init__(self, max_size=1024, revalidate_after=5, num_slots=4096):
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self.num_slots = num_slots
+        self._epochs = MappedTable(None, (num_slots + 1) * _EPOCH.size)
+        self._entries = OrderedDict()  # user id: [snapshot, time of the last version check, epochs]
+        self._stats = {"hits": 0, "misses": 0, "revalidations": 0}
+        self._lock = RLock()
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App
+        and empties the cache.
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        self.max_size = app.config.get("AUTH_USER_CACHE_SIZE", self.max_size)
+        self.revalidate_after = app.config.get("AUTH_USER_CACHE_REVALIDATE_SEC",
+                                               self.revalidate_after)
+        self.num_slots = app.config.get("AUTH_USER_CACHE_EPOCH_SLOTS", self.num_slots)
+        path = None if app.testing else app.config.get("AUTH_USER_CACHE_EPOCH_FILE")
+        self._epochs.configure(path, (self.num_slots + 1) * _EPOCH.size)
+        with self._lock:
+            self._entries.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _count(self, name):
+        """
+        Increments a counter of the cache.
+
+        :param str name: "hits", "misses" or "revalidations"
+        """
+        with self._lock:
+            self._stats[name] += 1
+
+    def _read_epochs(self, user_id):
+        """
+        Reads the epochs of all users and of the slot of a user.
+
+        :param int user_id: the primary key of an instance of "User" ORM model
+        :return tuple: the epochs
+        """
+        table = self._epochs.get()
+        slot = 1 + user_id % self.num_slots
+        return _EPOCH.unpack_from(table, 0)[0], _EPOCH.unpack_from(table, slot * _EPOCH.size)[0]
+
+    def get(self, user_id):
+        """
+        Fetches a user for the session of the current request
+        loading it on a miss, an invalidation or a version change.
+
+        :param int user_id: the primary key of an instance of "User" ORM model
+        :return User/NoneType: a user attached to the session/None if the user does not exist
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                self._entries.move_to_end(user_id)
+        epochs = self._read_epochs(user_id)  # before a load: a concurrent invalidation wins
+        if entry and entry[2] != epochs:
+            entry = None  # invalidated by another process
+        if entry:
+            snapshot, checked_at, _ = entry
+            if monotonic() - checked_at < self.revalidate_after:
+                self._count("hits")
+                return db.session.merge(snapshot, load=False)
+            version = db.session.query(User.version).filter_by(id=user_id).scalar()
+            if version == snapshot.version:
+                entry[1] = monotonic()
+                self._count("revalidations")
+                return db.session.merge(snapshot, load=False)
+        self._count("misses")
+        user = User.query.get(user_id)
+        with self._lock:
+            if user:
+                self._entries[user_id] = [detach_user(user), monotonic(), epochs]
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.pop(user_id, None)
+        return user
+
+    def invalidate(self, *user_ids):
+        """
+        Removes users from the caches of all processes of the node
+        or empties the caches if no primary key is given.
+
+        :param tuple user_ids: primary keys of instances of "User" ORM model
+        """
+        slots = {1 + user_id % self.num_slots for user_id in user_ids} or {0}
+        with self._epochs.locked() as table:
+            for slot in slots:
+                epoch = _EPOCH.unpack_from(table, slot * _EPOCH.size)[0]
+                _EPOCH.pack_into(table, slot * _EPOCH.size, epoch + 1)
+        with self._lock:
+            if not user_ids:
+                self._entries.clear()
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def get_stats(self):
+        """
+        Reports counters of the cache of the current process.
+
+        :return dict: numbers of hits, misses, revalidated hits and cached users
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+user_cache = UserIdentityCache()
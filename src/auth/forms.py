@@ -53,8 +53,7 @@ class RegistrationForm(FlaskForm):
 
         :param StringField input_username: a username input into the field
         """
-        user = User.query.filter_by(username=input_username.data).first()
-        if user:
+        if User.is_taken("username", input_username.data):
             raise ValidationError("A user with such a username already exists. Input another one.")
         for char in input_username.data:
             forbidden_chars = punctuation + " "
@@ -71,8 +70,7 @@ class RegistrationForm(FlaskForm):
 
         :param EmailField input_email: an email address input into the field
         """
-        user = User.query.filter_by(email=input_email.data).first()
-        if user:
+        if User.is_taken("email", input_email.data):
             raise ValidationError("A user with such an email already exists. Input another one.")
 
 
@@ -119,9 +117,8 @@ class ProfileForm(FlaskForm):
 
         :param StringField input_username: a username input into the field
         """
-        if input_username.data != current_user.username:
-            user = User.query.filter_by(username=input_username.data).first()
-            if user:
+        if input_username.data.lower() != current_user.username.lower():
+            if User.is_taken("username", input_username.data):
                 raise ValidationError("A user with that username already exists. "
                                       "Input another one.")
             for char in input_username.data:
@@ -139,9 +136,8 @@ class ProfileForm(FlaskForm):
 
         :param EmailField input_email: an email address input into the field
         """
-        if input_email.data != current_user.email:
-            user = User.query.filter_by(email=input_email.data).first()
-            if user:
+        if input_email.data.lower() != current_user.email.lower():
+            if User.is_taken("email", input_email.data):
                 raise ValidationError("A user with that email already exists. Input another one.")
 
 
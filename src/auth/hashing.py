@@ -0,0 +1,186 @@
+"""
+This module implements bcrypt hashing and verification of passwords
+in a bounded pool of processes, so that bursts of logins and registrations
+do not pin the request threads of workers on CPU-bound hashing.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import BoundedSemaphore, Lock
+#
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+
+def _encode(password):
+    """
+    Encodes a password for bcrypt which reads at most 72 bytes
+    (older versions of bcrypt truncated longer passwords silently).
+
+    :param str password: a raw password
+    :return bytes: the first 72 bytes of the UTF-8 encoded password
+    """
+    return password.encode("utf-8")[:72]
+
+
+def hash_password(password, rounds):
+    """
+    Hashes a password with a new salt (runs in a process of the pool).
+
+    :param str password: a raw password
+    :param int rounds: the cost factor (log2 of the number of rounds)
+    :return str: a bcrypt hash
+    """
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def check_password(password, password_hash):
+    """
+    Verifies a password against a bcrypt hash (runs in a process of the pool).
+
+    :param str password: a raw password
+    :param str password_hash: a bcrypt hash
+    :return bool: an indicator of correspondence
+    """
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode("utf-8"))
+    except ValueError:  # not a bcrypt hash (e.g. a placeholder of an imported user)
+        return False
+
+
+def get_cost(password_hash):
+    """
+    Reads the cost factor of a bcrypt hash ("$2b$<cost>$<salt and hash>").
+
+    :param str password_hash: a bcrypt hash
+    :return int/NoneType: the cost factor/None if the hash is malformed
+    """
+    parts = (password_hash or "").split("$")
+    return int(parts[2]) if len(parts) == 4 and parts[2].isdigit() else None
+
+
+def _get_mp_context():
+    """
+    Chooses how processes of the pool are started: a fork of a threaded worker
+    may inherit locks held by other threads, so they are forked from a clean server process
+    ("spawn" where "forkserver" is unavailable, e.g. on Windows).
+
+    :return multiprocessing.context.BaseContext: a context of processes
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class PasswordHasher:
+    """
+    Dispatches bcrypt hashing and verification to a pool of processes
+    created lazily in every process of the application (workers fork after import).
+    At most "max_workers + queue_size" calls are admitted at a time,
+    further calls and calls which time out are rejected with 503 Service Unavailable.
+    With no workers passwords are hashed inline.
+
+    Methods:
+        - init_app
+        - hash
+        - verify
+        - needs_rehash
+    """
+
+    def __init__(self, rounds=12, max_workers=2, queue_size=16, timeout=5):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._slots = BoundedSemaphore(max_workers + queue_size)
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App
+        and shuts the pool of processes down (a new one is started on demand).
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", self.rounds)
+        self.max_workers = app.config.get("AUTH_HASH_WORKERS", self.max_workers)
+        self.queue_size = app.config.get("AUTH_HASH_QUEUE_SIZE", self.queue_size)
+        self.timeout = app.config.get("AUTH_HASH_TIMEOUT_SEC", self.timeout)
+        with self._lock:
+            if self._executor and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = BoundedSemaphore(self.max_workers + self.queue_size)
+
+    def _get_executor(self):
+        """
+        Starts the pool of processes of the current process on demand.
+
+        :return ProcessPoolExecutor: the pool of processes
+        """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():  # a forked worker
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=_get_mp_context())
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, function, *args):
+        """
+        Runs a function in the pool of processes and waits for its result.
+        Aborts execution (503) if the queue is full or the call times out.
+
+        :param callable function: a module-level function
+        :param tuple args: arguments of the function
+        :return: the result of the function
+        """
+        if not self.max_workers:
+            return function(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise ServiceUnavailable("Too many concurrent logins. Try again later", retry_after=1)
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())  # a timed out call keeps its slot
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ServiceUnavailable("Password check timed out. Try again later",
+                                     retry_after=self.timeout) from None
+
+    def hash(self, password):
+        """
+        Hashes a password with the configured cost factor.
+
+        :param str password: a raw password
+        :return str: a bcrypt hash
+        """
+        return self._run(hash_password, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        """
+        Verifies a password against a bcrypt hash.
+
+        :param str password_hash: a bcrypt hash
+        :param str password: a raw password
+        :return bool: an indicator of correspondence
+        """
+        return self._run(check_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """
+        Verifies if a hash was made with another cost factor than the configured one.
+
+        :param str password_hash: a bcrypt hash
+        :return bool: an indicator of an outdated hash
+        """
+        return get_cost(password_hash) != self.rounds
+
+
+password_hasher = PasswordHasher()
@@ -9,7 +9,8 @@ from flask_login import UserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from sqlalchemy.dialects.postgresql import UUID
 #
-from src import bcrypt, db, login_manager
+from src import db, login_manager
+from src.auth.hashing import password_hasher
 
 
 @login_manager.user_loader   # must be implemented to use the 'flask_login' functions
@@ -17,11 +18,13 @@ def load_user(user_id):
     """
     This function substitutes 4 typical methods
     arising during login/logout procedures.
+    Users are served from the identity cache of the process.
 
     :param int user_id: primary key of a db User instance
     :return User: and instance of User class by id
     """
-    return User.query.get(int(user_id))
+    from src.auth.cache import user_cache  # prevents circular import
+    return user_cache.get(int(user_id))
 
 
 class User(db.Model, UserMixin):
@@ -29,7 +32,7 @@ class User(db.Model, UserMixin):
     An ORM class which represents SQL table "user".
 
     Fields: id, uuid, first name, last name, username, email, image, hashed password,
-            superuser flag, related posts rel.,related test results rel.
+            superuser flag, row version, related posts rel.,related test results rel.
     """
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(UUID(as_uuid=True), default=uuid4, index=True, unique=True)  # PgSQL
@@ -40,9 +43,11 @@ class User(db.Model, UserMixin):
     image = db.Column(db.String(20), unique=False, nullable=False, default='default.png')
     password_hash = db.Column(db.String(60), unique=False, nullable=False)
     is_superuser = db.Column(db.Boolean, unique=False, default=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")  # +1 per ORM update
     posts = db.relationship('Post', backref='author', lazy=True)  # prevents user deletion by Admin
     results = db.relationship('Result', backref='user', cascade="all, delete-orphan",
                               lazy=True, passive_deletes=True)
+    __mapper_args__ = {"version_id_col": version}  # ETags and optimistic concurrency of REST
 
     @property
     def full_name(self):
@@ -53,13 +58,41 @@ class User(db.Model, UserMixin):
         """
         return f"{self.first_name} {self.last_name}"
 
+    @classmethod
+    def find_by_login(cls, login):
+        """
+        Finds a user by a username or an email address (case-insensitive)
+        with a single query on the indexes of lower-cased usernames and emails.
+
+        :param str login: a username or an email address
+        :return User/NoneType: a User instance/None
+        """
+        login = login.lower()
+        username, email = db.func.lower(cls.username), db.func.lower(cls.email)
+        return cls.query.filter(db.or_(username == login, email == login)) \
+            .order_by((username == login).desc()).first()  # usernames first (as before)
+
+    @classmethod
+    def is_taken(cls, field, value):
+        """
+        Verifies if a username or an email address is used by a user
+        regardless of the case (a single probe of a unique index).
+
+        :param str field: "username" or "email"
+        :param str value: a username or an email address
+        :return bool: an indicator of usage
+        """
+        condition = db.func.lower(getattr(cls, field)) == value.lower()
+        return db.session.query(cls.query.filter(condition).exists()).scalar()
+
     def encrypt_password(self, password):
         """
-        Encrypts an input password via bcrypt coding.
+        Encrypts an input password via bcrypt coding
+        (in the pool of processes of "password_hasher").
 
         :param str password: input non-hashed password
         """
-        self.password_hash = bcrypt.generate_password_hash(password=password).decode()
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
         """
@@ -69,7 +102,16 @@ class User(db.Model, UserMixin):
         :param str password: an input password sequence
         :return bool: an indicator of correspondence
         """
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def needs_rehash(self):
+        """
+        Verifies if the password of the user was hashed
+        with another cost factor than the configured one.
+
+        :return bool: an indicator of an outdated hash
+        """
+        return password_hasher.needs_rehash(self.password_hash)
 
     def get_reset_token(self, expires_sec=180):
         """
@@ -106,3 +148,8 @@ class User(db.Model, UserMixin):
         :return str: username and email of a user
         """
         return f"User({self.username}, {self.email})"
+
+
+# case-insensitive uniqueness of logins ("User.find_by_login", "User.is_taken")
+db.Index("ix_user_username_lower", db.func.lower(User.username), unique=True)
+db.Index("ix_user_email_lower", db.func.lower(User.email), unique=True)
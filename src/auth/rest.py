@@ -6,13 +6,20 @@ for CRUD operations with instances of "User" ORM model.
 from string import punctuation
 #
 from flask import abort
-from flask_restful import Resource, reqparse, marshal_with, fields
+from flask_restful import Resource, reqparse, marshal, marshal_with, fields
 from flask_login import current_user
 #
 from sqlalchemy.exc import DataError
-
-from src.main.service import session_create, session_update
+from werkzeug.exceptions import HTTPException
+
+from src import db
+from src.main.service import get_batch, get_collection_etag, get_etag_headers, \
+    get_item_status, is_not_modified, parse_uuid, prefers_ndjson, select_fields, \
+    session_create, session_update_versioned, stream_response, update_versioned_batch, \
+    verify_if_match
+from src.auth.cache import user_cache
 from src.auth.models import User
+from src.posts.models import FeedbackSummary
 
 
 class UserCommonAPI(Resource):
@@ -21,11 +28,17 @@ class UserCommonAPI(Resource):
     used by all its children.
 
     Fields:
+        - get_user_args: a request parser with args for GET methods
         - post_user: a request parser with args for POST method
         - put_user: a request parser with args for PUT method
         - patch_user: a request parser with args for PATCH method
         - object_field: a hash table of object fields representable in API
+        - object_columns: a hash table of columns of the object fields
     """
+    get_user_args = reqparse.RequestParser()
+    get_user_args.add_argument('fields', type=str, location='args',
+                               help="comma-separated names of fields")
+
     post_user = reqparse.RequestParser()
     post_user.add_argument('first_name', type=str, help="first name field", default="")
     post_user.add_argument('last_name', type=str, help="last name field", default="")
@@ -53,8 +66,28 @@ class UserCommonAPI(Resource):
         "username": fields.String,
         "email": fields.String,
     }
+    object_columns = {
+        "uuid": User.uuid,
+        "first_name": User.first_name,
+        "last_name": User.last_name,
+        "username": User.username,
+        "email": User.email,
+    }
 
-    def get_user(self, user_uuid):
+    def get_fields(self, names):
+        """
+        Picks the object fields requested with "fields" argument.
+        Aborts execution if a field is unknown.
+
+        :param str names: comma-separated names of fields, all fields by default
+        :return dict: the requested object fields
+        """
+        try:
+            return select_fields(self.object_fields, names)
+        except ValueError as error:
+            return abort(400, f"Bad request. {error}")
+
+    def get_user(self, user_uuid, object_fields=None):
         """
         Fetches a user from "user" table
         by UUID if the uuid is correct and
@@ -62,16 +95,32 @@ class UserCommonAPI(Resource):
         Aborts execution in case of wrong data input.
 
         :param UUID user_uuid: user's uuid
+        :param dict object_fields: object fields to load (the UUID and the version are always
+                                   loaded), all by default
         :return User user: an instance of "User" ORM model
         """
+        query = User.query
+        if object_fields:
+            query = query.options(db.load_only(User.uuid, User.version,
+                                               *[self.object_columns[name]
+                                                            for name in object_fields]))
         try:
-            user = User.query.filter_by(uuid=user_uuid).first()
+            user = query.filter_by(uuid=user_uuid).first()
             if not user:
                 return abort(404, "A user with this UUID does not exist")
             return user
         except DataError:  # in case UUID is input in inept format
             abort(400, "Bad request. Inept UUID format")
 
+    def get_etag(self, user):
+        """
+        Builds an ETag of a user from its row version.
+
+        :param User user: an instance of ORM "User" model
+        :return str: an unquoted ETag
+        """
+        return f"{user.uuid}.{user.version}"
+
     def verify_authorization(self):
         """
         Verifies if client is authorized to interact with REST API.
@@ -134,8 +183,7 @@ class UserCommonAPI(Resource):
                 return abort(406, f"Not acceptable. Forbidden characters: {forbidden_chars}")
         if username.lower() in ['admin', 'administrator']:
             return abort(406, "Not acceptable. Forbidden name")
-        user = User.query.filter_by(username=username).first()
-        if user:
+        if User.is_taken("username", username):
             return abort(406, "Not acceptable. A user with this username already exists")
 
     def validate_email(self, email):
@@ -151,8 +199,7 @@ class UserCommonAPI(Resource):
         if " " in email or "@" not in email or "." not in email.split("@")[-1] or \
                 (len(email.split("@")[-1]) < 5):
             return abort(406, "Not acceptable. Wrong email format")
-        user = User.query.filter_by(email=email).first()
-        if user:
+        if User.is_taken("email", email):
             return abort(406, "Not acceptable. A user with this email already exists")
 
 
@@ -164,25 +211,30 @@ class UserAPI(UserCommonAPI):
     methods: get, put, patch, delete
     """
 
-    @marshal_with(UserCommonAPI.object_fields, envelope="user")
     def get(self, user_uuid):
         """
         REST API GET method.
+        Only the fields listed in "fields" argument are loaded and returned (all by default).
+        Returns 304 Not Modified if "If-None-Match" header matches the ETag of the user.
 
         :param UUID user_uuid: UUID of a user
-        :return User user: an instance of "User" ORM model
+        :return dict: a representation of an instance of "User" ORM model
         """
         super().verify_authorization()
-        user = super().get_user(user_uuid)
-        if current_user.is_superuser:  # admin may view any profile
-            return user
-        super().verify_identity(user)  # other users may view their own profiles
-        return user
+        object_fields = super().get_fields(super().get_user_args.parse_args()["fields"])
+        user = super().get_user(user_uuid, object_fields)
+        if not current_user.is_superuser:  # admin may view any profile
+            super().verify_identity(user)  # other users may view only their own profiles
+        etag = super().get_etag(user)
+        if is_not_modified(etag):
+            return "", 304, get_etag_headers(etag)
+        return marshal(user, object_fields, envelope="user"), 200, get_etag_headers(etag)
 
     @marshal_with(UserCommonAPI.object_fields)
     def put(self, user_uuid):
         """
         REST API PUT method.
+        Aborts execution (412) if "If-Match" header does not match the ETag of the user.
 
         :param UUID user_uuid: UUID of a user
         :return User user: an instance of "User" ORM model
@@ -190,6 +242,7 @@ class UserAPI(UserCommonAPI):
         super().verify_authorization()
         user = super().get_user(user_uuid)
         super().verify_identity(user)  # users may edit only their own profiles
+        verify_if_match(super().get_etag(user))
         #
         args = super().put_user.parse_args(strict=True)
         super().validate_input(args["username"],
@@ -200,15 +253,20 @@ class UserAPI(UserCommonAPI):
                                )
         user.first_name = args["first_name"]
         user.last_name = args["last_name"]
+        is_renamed = user.username != args["username"]
         user.username = args["username"]
         user.email = args["email"]
-        session_update()
-        return user
+        session_update_versioned(  # feedback summaries store usernames of authors
+            lambda: FeedbackSummary.refresh_authors([user.id] if is_renamed else [])
+        )
+        user_cache.invalidate(user.id)
+        return user, 200, get_etag_headers(super().get_etag(user))
 
     @marshal_with(UserCommonAPI.object_fields)
     def patch(self, user_uuid):
         """
         REST API PATCH method.
+        Aborts execution (412) if "If-Match" header does not match the ETag of the user.
 
         :param UUID user_uuid: UUID of a user
         :return User user: an instance of "User" ORM model
@@ -216,6 +274,7 @@ class UserAPI(UserCommonAPI):
         super().verify_authorization()
         user = super().get_user(user_uuid)
         super().verify_identity(user)  # users may edit only their own profiles
+        verify_if_match(super().get_etag(user))
         #
         args = super().patch_user.parse_args(strict=True)
         if not (args.get("first_name", None) or args.get("last_name", None) or
@@ -232,12 +291,16 @@ class UserAPI(UserCommonAPI):
             user.first_name = args["first_name"]
         if args.get("last_name", None):
             user.last_name = args["last_name"]
+        is_renamed = bool(args.get("username", None)) and user.username != args["username"]
         if args.get("username", None):
             user.username = args["username"]
         if args.get("email", None):
             user.email = args["email"]
-        session_update()
-        return user
+        session_update_versioned(  # feedback summaries store usernames of authors
+            lambda: FeedbackSummary.refresh_authors([user.id] if is_renamed else [])
+        )
+        user_cache.invalidate(user.id)
+        return user, 200, get_etag_headers(super().get_etag(user))
 
     def delete(self, user_uuid):
         """
@@ -260,17 +323,34 @@ class UsersAPI(UserCommonAPI):
     methods: get, post
     """
 
-    @marshal_with(UserCommonAPI.object_fields)
     def get(self):
         """
         REST API GET method.
+        Only the fields listed in "fields" argument are queried and returned (all by default).
+        The collection is streamed from a server-side cursor
+        as a JSON array or as NDJSON ("Accept: application/x-ndjson").
+        Returns 304 Not Modified if "If-None-Match" header matches the ETag
+        (weak for the collection, which differs for JSON and NDJSON: "Vary: Accept").
 
-        :return list: all existing instances of "User" ORM model
+        :return Response/dict: all existing users/the profile of a non-admin user
         """
         super().verify_authorization()
-        if not current_user.is_superuser:
-            return current_user    # users may view only their own profiles
-        return User.query.all()    # admin may view every profile
+        object_fields = super().get_fields(super().get_user_args.parse_args()["fields"])
+        if not current_user.is_superuser:  # users may view only their own profiles
+            etag = super().get_etag(current_user)
+            if is_not_modified(etag):
+                return "", 304, get_etag_headers(etag)
+            return marshal(current_user, object_fields), 200, get_etag_headers(etag)
+        etag = get_collection_etag(User.query, User.id, (User.version,),  # admin: every profile
+                                   "ndjson" if prefers_ndjson() else "json", *object_fields)
+        if is_not_modified(etag):
+            return "", 304, get_etag_headers(etag, weak=True, vary="Accept")
+        response = stream_response(
+            db.session.query(*[self.object_columns[name].label(name) for name in object_fields])
+            .order_by(User.id)
+        )
+        response.headers.extend(get_etag_headers(etag, weak=True, vary="Accept"))
+        return response
 
     @marshal_with(UserCommonAPI.object_fields)
     def post(self):
@@ -299,3 +379,130 @@ class UsersAPI(UserCommonAPI):
         user.encrypt_password(args["password"])
         session_create(user)
         return user
+
+
+class UsersBatchAPI(UserCommonAPI):
+    """
+    REST API class for bulk operations with rows of the table "user":
+    a batch (at most "API_BATCH_SIZE" items) is validated item by item,
+    applied with a set-based statement in one transaction
+    and answered with a status per item.
+
+    methods: patch
+    """
+
+    editable_fields = ("first_name", "last_name", "username", "email")
+
+    def check_item(self, item, user, seen):
+        """
+        Authorizes and validates a patch document of a batch.
+
+        :param dict item: a patch document
+        :param Row user: the row (id, uuid, version) of the patched user, None if absent
+        :param dict seen: sets of UUIDs, usernames and emails of the preceding items
+        :return dict/NoneType: a failure status/None if the item may be applied
+        """
+        value = item.get("uuid")
+        if not user:
+            return get_item_status(value, 404, "A user with this UUID does not exist")
+        if user.uuid in seen["uuid"]:
+            return get_item_status(value, 400, "Bad request. Duplicate item")
+        seen["uuid"].add(user.uuid)
+        if user.uuid != current_user.uuid and not current_user.is_superuser:
+            return get_item_status(value, 403, "Forbidden. Bad credentials")
+        if item.get("version") is not None and not isinstance(item["version"], int):
+            return get_item_status(value, 412, "Precondition failed. The object has been modified")
+        if not any(item.get(name) for name in self.editable_fields):
+            return get_item_status(value, 406, "PATCH method must implement the modification "
+                                               "of at list one field of an object")
+        try:
+            self.validate_input(item.get("username"), item.get("email"), "********",
+                                item.get("first_name"), item.get("last_name"))
+        except HTTPException as error:
+            return get_item_status(value, error.code, error.description)
+        for name in ("username", "email"):  # unique values may not repeat in a batch either
+            if item.get(name) and item[name].lower() in seen[name]:
+                return get_item_status(value, 406, f"Not acceptable. The {name} is repeated "
+                                                   f"in the batch")
+        for name in ("username", "email"):
+            if item.get(name):
+                seen[name].add(item[name].lower())
+        return None
+
+    def patch(self):
+        """
+        REST API PATCH method.
+        Takes a JSON list of patch documents
+        {"uuid", "first_name", "last_name", "username", "email", "version"}
+        ("version" is optional: the user must not have been modified since).
+        Users may patch only their own profiles, admin may patch any profile.
+
+        :return dict: statuses of the items
+        """
+        super().verify_authorization()
+        items = get_batch()
+        uuids = [parse_uuid(item.get("uuid")) if isinstance(item, dict) else None
+                 for item in items]
+        users = {}
+        if any(uuids):
+            users = {row.uuid: row for row in db.session.query(User.id, User.uuid, User.version)
+                     .filter(User.uuid.in_([uuid for uuid in uuids if uuid]))}
+        seen = {"uuid": set(), "username": set(), "email": set()}
+        statuses, params = [], []
+        for item, uuid in zip(items, uuids):
+            if not uuid:
+                statuses.append(get_item_status(item.get("uuid") if isinstance(item, dict)
+                                                else item, 400, "Bad request. Inept UUID format"))
+                continue
+            failure = self.check_item(item, users.get(uuid), seen)
+            statuses.append(failure or get_item_status(item["uuid"], 200))
+            if not failure:
+                version = item.get("version")
+                params.append(dict({f"new_{name}": item.get(name) or None
+                                    for name in self.editable_fields}, user_id=users[uuid].id,
+                                   expected_version=users[uuid].version if version is None
+                                   else version))
+        if params:
+            table = User.__table__
+            updated = update_versioned_batch(
+                table, "user_id",
+                {name: db.func.coalesce(db.bindparam(f"new_{name}"), table.c[name])
+                 for name in self.editable_fields}, params
+            )
+            FeedbackSummary.refresh_authors(  # feedback summaries store usernames of authors
+                param["user_id"] for param, is_updated in zip(params, updated)
+                if is_updated and param["new_username"]
+            )
+            db.session.commit()
+            applied = iter(updated)
+            for status in statuses:
+                if status["status"] == 200 and not next(applied):
+                    status.update(get_item_status(status["uuid"], 412, "Precondition failed. "
+                                                  "The object has been modified"))
+            updated_ids = [param["user_id"] for param, is_updated in zip(params, updated)
+                           if is_updated]
+            if updated_ids:  # no arguments would empty the caches of all users
+                user_cache.invalidate(*updated_ids)
+        return {"results": statuses}
+
+
+class UserCacheAPI(UserCommonAPI):
+    """
+    REST API class for counters of the identity cache of users
+    (of the process serving the request).
+
+    methods: get
+    """
+
+    def get(self):
+        """
+        REST API GET method.
+        Aborts execution if an attempt of access
+        is made by a non-admin user.
+
+        :return dict: numbers of hits, misses, revalidated hits and cached users
+        """
+        super().verify_authorization()
+        if not current_user.is_superuser:
+            return abort(403, "Forbidden. Bad credentials")
+        return {"cache": user_cache.get_stats()}
@@ -8,11 +8,14 @@ from flask import flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_user, login_required, logout_user
 #
 from src.auth import bp
+from src.auth.cache import user_cache
 from src.auth.forms import LoginForm, ProfileForm, RegistrationForm, \
                            ResetPasswordForm, RequestResetForm
 from src.auth.models import User
+from src.auth.throttle import login_throttle
 from src.auth.utils import save_image, send_reset_email
-from src.main.service import session_create, session_update
+from src.main.service import session_commit_versioned, session_create, session_update
+from src.posts.models import FeedbackSummary
 
 
 @bp.route("/register", methods=["GET", "POST"])
@@ -55,14 +58,23 @@ def login_page():
         return redirect(url_for('main.home_page'))
     form = LoginForm()
     if form.validate_on_submit():
-        user_by_username = User.query.filter_by(username=form.username_or_email.data).first()
-        user_by_email = User.query.filter_by(email=form.username_or_email.data).first()
-        user = user_by_username or user_by_email
+        user = User.find_by_login(form.username_or_email.data)
+        account = f"#{user.id}" if user else form.username_or_email.data  # usernames lack "#"
+        retry_after = login_throttle.acquire(request.remote_addr, account)
+        if retry_after:  # rejected before the password check (bcrypt) is made
+            flash(f"Too many login attempts. Try again in {retry_after} s", category="danger")
+            return render_template("auth/login.html", form=form), 429, \
+                {"Retry-After": str(retry_after)}
         # if LOGIN fails
         if not user or not user.verify_password(form.password.data):
             flash('Invalid username or password', category="danger")
             return redirect(url_for('auth.login_page'))  # do not remove: POST-GET-redirect pattern
         # if LOGIN is successful
+        if user.needs_rehash():  # the cost factor has been changed
+            user.encrypt_password(form.password.data)
+            session_update()
+            user_cache.invalidate(user.id)
+        login_throttle.refund(request.remote_addr, account)  # only failed attempts are charged
         login_user(user, remember=form.remember.data)
         next_page = request.args.get('next')  # dictionary
         flash("Successful login", category="primary")
@@ -98,9 +110,15 @@ def profile_page():
             current_user.image = save_image(form.image.data)
         current_user.first_name = form.first_name.data
         current_user.last_name = form.last_name.data
+        is_renamed = current_user.username != form.username.data
         current_user.username = form.username.data
         current_user.email = form.email.data.lower()
-        session_update()  # no 'db.session.add' is required when altering a table row
+        is_committed = session_commit_versioned(  # feedback summaries store usernames of authors
+            lambda: FeedbackSummary.refresh_authors([current_user.id] if is_renamed else []))
+        user_cache.invalidate(current_user.id)  # a snapshot of the cache may be stale, too
+        if not is_committed:
+            flash("The account has been modified concurrently. Try again", category="warning")
+            return redirect(url_for('auth.profile_page'))
         flash("Account updated", category="primary")
         return redirect(url_for('auth.profile_page'))  # do not remove: POST-GET-redirect pattern
     elif request.method == "GET":  # to see current username and email data when the form is loaded
@@ -150,6 +168,7 @@ def reset_password_page(token):
     if form.validate_on_submit():
         user.encrypt_password(form.password.data)
         session_update()  # no 'db.session.add' is required when altering a table row
+        user_cache.invalidate(user.id)
         flash(f"Your password has been successfully updated", category="primary")
         return redirect(url_for("auth.login_page"))
     return render_template("auth/reset_password.html", form=form)
@@ -0,0 +1,142 @@
+"""
+This module implements a throttle of login attempts (token buckets keyed
+by the IP address and by the account) which rejects credential stuffing
+before any bcrypt check is made. Successful attempts are refunded. Buckets live in a memory-mapped file,
+so that limits hold across all worker processes of a node.
+"""
+
+import math
+import struct
+from hashlib import blake2b
+from time import time
+#
+from src.main.mapped import MappedTable
+
+_SLOT = struct.Struct("<Qdd")  # key digest, tokens, time of the last update
+_PROBES = 8  # slots searched for a key (open addressing)
+
+
+def get_key_digest(key):
+    """
+    Hashes a key of a bucket (stable across processes unlike "hash").
+
+    :param str key: a key, e.g. "ip:127.0.0.1"
+    :return int: a non-zero 64-bit digest
+    """
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+class LoginThrottle:
+    """
+    Token buckets of login attempts in a fixed table of slots of a memory-mapped file
+    (an anonymous mapping if no file is configured or the app is tested).
+    A bucket holds up to "limit" attempts and refills them evenly over "window" seconds.
+    Processes of a node serialize updates with an exclusive lock of the file.
+    If all slots probed for a new key are taken, the bucket with the most tokens is evicted
+    (a full bucket is equivalent to a free slot).
+
+    Methods:
+        - init_app
+        - acquire
+        - refund
+        - reset
+    """
+
+    def __init__(self, path=None, num_slots=4096):
+        self.num_slots = num_slots
+        self.limits = {}  # kind of key: (limit, window)
+        self._table = MappedTable(path, num_slots * _SLOT.size)
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App.
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        window = app.config.get("AUTH_THROTTLE_WINDOW_SEC", 300)
+        self.limits = {"ip": (app.config.get("AUTH_THROTTLE_IP_LIMIT", 20), window),
+                       "account": (app.config.get("AUTH_THROTTLE_ACCOUNT_LIMIT", 5), window)}
+        self.num_slots = app.config.get("AUTH_THROTTLE_SLOTS", self.num_slots)
+        path = None if app.testing else app.config.get("AUTH_THROTTLE_FILE", self._table.path)
+        self._table.configure(path, self.num_slots * _SLOT.size)
+
+    def _update(self, keys, changes):
+        """
+        Refills buckets of keys and changes their tokens if no bucket runs out of them
+        (under the locks of the process and of the file).
+
+        :param list keys: pairs (kind of key, value)
+        :param list changes: tokens added to the buckets (-1 consumes a token, None fills a bucket)
+        :return float: seconds until every bucket has the tokens, 0 if the tokens are changed
+        """
+        now = time()
+        with self._table.locked() as table:
+            buckets = [self._find(table, kind, value, now) for kind, value in keys]
+            waits = [-(tokens + change) * window / limit
+                     for (_, tokens, (limit, window)), change in zip(buckets, changes)
+                     if change is not None and tokens + change < 0]
+            if waits:
+                return max(waits)
+            for (slot, tokens, (limit, _)), (kind, value), change in zip(buckets, keys, changes):
+                _SLOT.pack_into(table, slot * _SLOT.size,
+                                get_key_digest(f"{kind}:{value}"),
+                                limit if change is None else min(limit, tokens + change), now)
+            return 0
+
+    def _find(self, table, kind, value, now):
+        """
+        Finds the slot of a bucket and refills its tokens.
+
+        :param mmap.mmap table: the table of buckets
+        :param str kind: "ip" or "account"
+        :param str value: an IP address or an account identifier
+        :param float now: the current time
+        :return tuple: the slot, the tokens, (limit, window)
+        """
+        limit, window = self.limits[kind]
+        digest = get_key_digest(f"{kind}:{value}")
+        start = digest % self.num_slots
+        candidates = []
+        for probe in range(_PROBES):
+            slot = (start + probe) % self.num_slots
+            stored, tokens, updated = _SLOT.unpack_from(table, slot * _SLOT.size)
+            refilled = limit if not stored else \
+                min(limit, tokens + max(now - updated, 0) * limit / window)
+            if stored == digest:
+                return slot, refilled, (limit, window)
+            candidates.append((stored == 0, refilled, -probe, slot))
+        _, _, _, slot = max(candidates)  # a free slot first, then the fullest bucket
+        return slot, limit, (limit, window)
+
+    def acquire(self, ip_address, account):
+        """
+        Counts a login attempt against the buckets of an IP address and of an account.
+        Attempts over a limit are not counted.
+
+        :param str ip_address: the IP address of the client
+        :param str account: a username or an email address (case-insensitive)
+        :return int: 0 if the attempt is allowed/seconds to wait otherwise
+        """
+        keys = [("ip", ip_address or "-"), ("account", (account or "").lower())]
+        return math.ceil(self._update(keys, [-1, -1]))
+
+    def refund(self, ip_address, account):
+        """
+        Returns the token of a successful login attempt to the bucket of an IP address
+        and refills the bucket of an account, so that only failed attempts are charged.
+
+        :param str ip_address: the IP address of the client
+        :param str account: a username or an email address (case-insensitive)
+        """
+        self._update([("ip", ip_address or "-"), ("account", (account or "").lower())], [1, None])
+
+    def reset(self, account):
+        """
+        Refills the bucket of an account.
+
+        :param str account: a username or an email address (case-insensitive)
+        """
+        self._update([("account", (account or "").lower())], [None])
+
+
+login_throttle = LoginThrottle()
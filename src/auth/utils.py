@@ -5,14 +5,13 @@ for project's basic functionality.
 
 import os
 import secrets
-from threading import Thread
 #
 from flask import current_app, render_template
 from flask_login import current_user
 from flask_mail import Message
 from PIL import Image
 #
-from src import mail
+from src.main.outbox import mail_outbox
 
 
 def save_image(image_data):
@@ -36,20 +35,10 @@ def save_image(image_data):
     return filename
 
 
-def send_async_email(app, msg):
-    """
-    This function implements asynchronous delivery of email.
-
-    :param flask.Flask app: an instance of Flask App
-    :param flask_mail.Message msg: a message to send
-    """
-    with app.app_context():
-        mail.send(msg)
-
-
 def send_reset_email(user):
     """
-    This function implements email delivery procedure.
+    This function implements email delivery procedure
+    (the email is queued to the mail outbox).
 
     :param src.auth.models.User user: an instance of ORM User model
     """
@@ -59,4 +48,4 @@ def send_reset_email(user):
                   recipients=[user.email])
     msg.html = render_template('auth/reset_letter.html',
                                user=user, token=token)
-    Thread(target=send_async_email, args=(current_app._get_current_object(), msg)).start()  # pylint: disable=W0212
+    mail_outbox.send(msg)
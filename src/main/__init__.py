@@ -6,4 +6,4 @@ from flask import Blueprint
 
 bp = Blueprint('main', __name__)  # pylint: disable=C0103
 
-from src.main import routes  # cyclic import prevention
+from src.main import commands, routes  # cyclic import prevention
@@ -0,0 +1,27 @@
+"""
+The module registers CLI commands of the BP-registered application "main"
+(run as "flask main <command>").
+"""
+
+import click
+#
+from src.main import bp
+from src.main.outbox import mail_outbox
+
+
+@bp.cli.command("resend-mail")
+@click.option("--limit", default=100, show_default=True,
+              help="The maximal number of emails to resend.")
+@click.option("--timeout", default=60, show_default=True,
+              help="Seconds to wait for the delivery.")
+def resend_mail(limit, timeout):
+    """
+    Puts undelivered emails of the "mail_failure" table back to the mail outbox
+    and waits for their delivery (emails which are not sent stay in the table).
+    """
+    num_requeued = mail_outbox.requeue_failed(limit)
+    if not mail_outbox.flush(timeout):
+        click.echo(f"{mail_outbox.get_stats()['queued']} email(s) are still queued.", err=True)
+    mail_outbox.stop()
+    stats = mail_outbox.get_stats()
+    click.echo(f"{num_requeued} email(s) requeued, {stats['sent']} sent, {stats['failed']} failed again.")
@@ -0,0 +1,104 @@
+"""
+This module implements a table of fixed-size slots in a memory-mapped file
+shared by all worker processes of a node (login throttle buckets,
+invalidation epochs of per-process caches).
+"""
+
+import mmap
+import os
+from contextlib import contextmanager
+from threading import Lock
+#
+try:
+    import fcntl
+except ImportError:  # Windows (development): tables are shared by threads only
+    fcntl = None
+
+
+class MappedTable:
+    """
+    A memory-mapped file of "size" bytes (an anonymous mapping if no path is given)
+    mapped into every process on demand: a forked worker must not share
+    the file description and its lock with its parent.
+    Processes serialize updates with an exclusive lock of the file.
+
+    Methods:
+        - configure
+        - get
+        - locked
+    """
+
+    def __init__(self, path=None, size=0):
+        self.path = path
+        self.size = size
+        self._map = None
+        self._file = None
+        self._pid = None
+        self._lock = Lock()
+
+    def configure(self, path, size):
+        """
+        Changes the file and the size of the table and unmaps the current one.
+
+        :param str path: a path to the file or None (an anonymous mapping)
+        :param int size: the size of the table, bytes
+        """
+        with self._lock:
+            self._close()
+            self.path, self.size = path, size
+
+    def _close(self):
+        """
+        Unmaps the table of the current process.
+        """
+        if self._map is not None and self._pid == os.getpid():
+            self._map.close()
+            if self._file is not None:
+                os.close(self._file)
+        self._map, self._file, self._pid = None, None, None
+
+    def _open(self):
+        """
+        Maps the table into the current process on demand.
+
+        :return mmap.mmap: the table
+        """
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        self._map, self._file = None, None
+        if self.path:
+            self._file = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._file).st_size != self.size:
+                os.ftruncate(self._file, self.size)  # new bytes are zero
+            self._map = mmap.mmap(self._file, self.size)
+        else:
+            self._map = mmap.mmap(-1, self.size)
+        self._pid = os.getpid()
+        return self._map
+
+    def get(self):
+        """
+        Maps the table for reads without the lock of the file
+        (a value read during an update may be torn: use it as a hint only).
+
+        :return mmap.mmap: the table
+        """
+        with self._lock:
+            return self._open()
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the locks of the process and of the file during an update.
+
+        :return mmap.mmap: the table
+        """
+        with self._lock:
+            table = self._open()
+            if self._file is not None and fcntl:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield table
+            finally:
+                if self._file is not None and fcntl:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
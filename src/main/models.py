@@ -0,0 +1,67 @@
+"""
+This module contains SQL ORM model for emails
+which could not be delivered by the mail outbox.
+"""
+
+from datetime import datetime
+#
+from flask_mail import Message
+#
+from src import db
+
+
+class MailFailure(db.Model):
+    """
+    An ORM class which represents SQL table "mail_failure":
+    an email which was not delivered after all retries
+    (or did not fit into the outbox) kept for a later delivery.
+
+    Fields: id, time of failure, sender, recipients, subject, text and HTML bodies,
+            number of delivery attempts, the last error
+
+    Methods:
+        - from_message
+        - to_message
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    failed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sender = db.Column(db.String(120))
+    recipients = db.Column(db.JSON, nullable=False)
+    subject = db.Column(db.String(255))
+    body = db.Column(db.Text())
+    html = db.Column(db.Text())
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text())
+
+    @classmethod
+    def from_message(cls, message, attempts, error):
+        """
+        Copies an email into a new instance.
+
+        :param flask_mail.Message message: an email
+        :param int attempts: the number of delivery attempts
+        :param str error: the last error
+        :return MailFailure: an instance of the model (not added to the session)
+        """
+        sender = message.sender
+        if isinstance(sender, tuple):  # (name, address)
+            sender = f"{sender[0]} <{sender[1]}>"
+        return cls(sender=sender, recipients=list(message.recipients), subject=message.subject,
+                   body=message.body, html=message.html, attempts=attempts, error=error)
+
+    def to_message(self):
+        """
+        Recreates the email.
+
+        :return flask_mail.Message: an email
+        """
+        return Message(subject=self.subject, sender=self.sender, recipients=list(self.recipients),
+                       body=self.body, html=self.html)
+
+    def __repr__(self):
+        """
+        Readable representation of an instance.
+
+        :return str: the subject and the recipients of the email
+        """
+        return f"MailFailure({self.subject}, {', '.join(self.recipients)})"
@@ -0,0 +1,311 @@
+"""
+The module implements the mail outbox: a bounded queue of emails
+drained by a fixed pool of worker threads which reuse SMTP connections
+for batches of emails, retry failed deliveries with exponential backoff
+and keep undelivered emails in the "mail_failure" table.
+"""
+
+import atexit
+import os
+import smtplib
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from datetime import datetime
+from time import monotonic, sleep
+#
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+#
+from src import db, mail
+from src.main.models import MailFailure
+
+
+class MailOutbox:
+    """
+    A bounded queue of emails and a pool of threads delivering them.
+    A worker keeps its SMTP connection open for up to "batch_size" emails
+    while the queue is not empty and closes it when idle.
+    A failed delivery is retried on a new connection after
+    "backoff", 2 * "backoff", 4 * "backoff"... seconds;
+    emails failing all retries, refused by the server or not fitting
+    into the queue are saved to the "mail_failure" table
+    (in a session of its own, the session of the calling request is left intact).
+    A requeued email stays in the table until it is delivered.
+    Workers are started by the first email of every process (workers fork after import).
+
+    Methods:
+        - init_app
+        - send
+        - flush
+        - stop
+        - requeue_failed
+        - get_stats
+    """
+
+    def __init__(self, max_size=1000, num_workers=2, batch_size=20, retries=3, backoff=1.0,
+                 idle_timeout=5):
+        self.max_size = max_size
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._app = None
+        self._queue = Queue(max_size)
+        self._workers = []
+        self._pid = None
+        self._stats = {"sent": 0, "retried": 0, "failed": 0, "connections": 0}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App,
+        stops workers of a previous app and empties the outbox.
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        self.stop()
+        self.max_size = app.config.get("MAIL_OUTBOX_SIZE", self.max_size)
+        self.num_workers = app.config.get("MAIL_OUTBOX_WORKERS", self.num_workers)
+        self.batch_size = app.config.get("MAIL_OUTBOX_BATCH_SIZE", self.batch_size)
+        self.retries = app.config.get("MAIL_OUTBOX_RETRIES", self.retries)
+        self.backoff = app.config.get("MAIL_OUTBOX_BACKOFF_SEC", self.backoff)
+        self.idle_timeout = app.config.get("MAIL_OUTBOX_IDLE_SEC", self.idle_timeout)
+        with self._lock:
+            self._app = app
+            self._queue = Queue(self.max_size)
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _count(self, name, amount=1):
+        """
+        Increments a counter of the outbox.
+
+        :param str name: "sent", "retried", "failed" or "connections"
+        :param int amount: the increment
+        """
+        with self._lock:
+            self._stats[name] += amount
+
+    def _start(self):
+        """
+        Starts the workers of the current process on demand.
+        """
+        with self._lock:
+            if self._workers and self._pid == os.getpid():
+                return
+            if self._pid is None:
+                atexit.register(self.stop)  # queued emails are delivered on shutdown
+            self._workers = [Thread(target=self._work, args=(self._queue,), daemon=True,
+                                    name=f"mail-outbox-{number}")
+                             for number in range(self.num_workers)]
+            self._pid = os.getpid()
+        for worker in self._workers:
+            worker.start()
+
+    def send(self, message):
+        """
+        Puts an email into the outbox without waiting for its delivery.
+        If the outbox is full, the email is saved to the "mail_failure" table.
+
+        :param flask_mail.Message message: an email
+        """
+        self._put(message, None)
+
+    def _put(self, message, failure_id):
+        """
+        Puts an email into the outbox or records it as undelivered if the outbox is full.
+
+        :param flask_mail.Message message: an email
+        :param int failure_id: the primary key of its "MailFailure" row (None for a new email)
+        :return bool: False if the outbox is full
+        """
+        self._start()
+        try:
+            self._queue.put_nowait((message, failure_id))
+        except Full:
+            if failure_id is None:  # a requeued email is still in the table
+                self._record(message, None, 0, "The outbox is full")
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Waits until all emails of the outbox are delivered or saved.
+
+        :param float timeout: the maximal waiting time, seconds (no limit by default)
+        :return bool: False if the time is over
+        """
+        queue = self._queue
+        deadline = None if timeout is None else monotonic() + timeout
+        with queue.all_tasks_done:
+            while queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=10):
+        """
+        Delivers the queued emails and stops the workers of the current process.
+
+        :param float timeout: the maximal waiting time of every worker, seconds
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+            if self._pid != os.getpid():
+                return
+        for _ in workers:
+            self._queue.put(None)  # after the queued emails
+        for worker in workers:
+            worker.join(timeout)
+
+    def requeue_failed(self, limit=100):
+        """
+        Puts emails of the "mail_failure" table back to the outbox
+        (from the oldest failure). A row is deleted only after its email is sent,
+        so emails which are not delivered before the outbox stops stay in the table
+        (an email is delivered at least once).
+
+        :param int limit: the maximal number of emails
+        :return int: the number of requeued emails
+        """
+        with Session(db.engine) as session:
+            failures = [(failure.to_message(), failure.id) for failure in
+                        session.query(MailFailure).order_by(MailFailure.id).limit(limit)]
+        num_requeued = 0
+        for message, failure_id in failures:
+            if not self._put(message, failure_id):
+                break
+            num_requeued += 1
+        return num_requeued
+
+    def get_stats(self):
+        """
+        Reports counters of the outbox of the current process.
+
+        :return dict: numbers of sent, retried and failed emails, opened connections
+                      and queued emails
+        """
+        with self._lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def _connect(self):
+        """
+        Opens an SMTP connection with the settings of the app.
+
+        :return flask_mail.Connection: an open connection
+        """
+        connection = mail.connect().__enter__()  # pylint: disable=C2801
+        self._count("connections")
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        """
+        Closes an SMTP connection ignoring errors of broken connections.
+
+        :param flask_mail.Connection connection: an open connection or None
+        """
+        if connection is None:
+            return
+        try:
+            connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _deliver(self, connection, message):
+        """
+        Sends an email retrying failed attempts on new connections.
+
+        :param flask_mail.Connection connection: an open connection or None
+        :param flask_mail.Message message: an email
+        :return tuple: a connection (None if closed), an error (None if the email is sent),
+                       the number of attempts
+        """
+        error, attempts = None, 0
+        while attempts <= self.retries:
+            if attempts:
+                self._count("retried")
+                sleep(self.backoff * 2 ** (attempts - 1))
+            attempts += 1
+            try:
+                connection = connection or self._connect()
+                connection.send(message)
+                return connection, None, attempts
+            except smtplib.SMTPRecipientsRefused as refused:  # not to be retried
+                return connection, refused, attempts
+            except (smtplib.SMTPException, OSError) as failure:
+                self._close(connection)
+                connection, error = None, failure
+            except Exception as failure:  # pylint: disable=W0703  # e.g. a malformed email
+                self._close(connection)
+                return None, failure, attempts
+        return connection, error, attempts
+
+    def _record(self, message, failure_id, attempts, error):
+        """
+        Updates the "mail_failure" table after a delivery in a separate session:
+        saves an undelivered email, counts attempts of a requeued one
+        or deletes the row of a requeued email which is sent.
+
+        :param flask_mail.Message message: an email
+        :param int failure_id: the primary key of its "MailFailure" row (None for a new email)
+        :param int attempts: the number of delivery attempts
+        :param error: the reason of the failure (None if the email is sent)
+        """
+        if error is not None:
+            self._count("failed")
+        elif failure_id is None:
+            return
+        try:
+            with Session(db.engine) as session:
+                failure = session.get(MailFailure, failure_id) if failure_id else None
+                if error is None:
+                    if failure:
+                        session.delete(failure)
+                elif failure:
+                    failure.attempts += attempts
+                    failure.error, failure.failed_at = str(error), datetime.utcnow()
+                else:
+                    session.add(MailFailure.from_message(message, attempts, str(error)))
+                session.commit()
+        except SQLAlchemyError:
+            current_app.logger.exception("A delivery of an email is not recorded: %s",
+                                         message.subject)
+
+    def _work(self, queue):
+        """
+        Delivers emails of a queue in batches until a stop signal (None).
+
+        :param queue.Queue queue: the queue of the outbox
+        """
+        with self._app.app_context():
+            connection, num_sent = None, 0
+            while True:
+                try:
+                    item = queue.get(timeout=self.idle_timeout)
+                except Empty:
+                    self._close(connection)
+                    connection = None
+                    continue
+                if item is None:
+                    self._close(connection)
+                    queue.task_done()
+                    return
+                message, failure_id = item
+                if connection is not None and num_sent >= self.batch_size:
+                    self._close(connection)  # the next batch on a new connection
+                    connection = None
+                if connection is None:
+                    num_sent = 0
+                connection, error, attempts = self._deliver(connection, message)
+                if error is None:
+                    num_sent += 1
+                    self._count("sent")
+                self._record(message, failure_id, attempts, error)
+                queue.task_done()
+
+
+mail_outbox = MailOutbox()
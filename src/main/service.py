@@ -1,8 +1,25 @@
 """
 The module encapsulates functions
-for basic CRUD operation with data structures.
+for basic CRUD operation with data structures,
+keyset (cursor) pagination of queries,
+sparse, streamed representations of REST collections,
+conditional requests (ETags of row versions)
+and bulk REST operations.
 """
 
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime
+from hashlib import sha1
+from itertools import islice
+from uuid import UUID
+#
+from flask import Response, abort, current_app, request, stream_with_context
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.http import quote_etag
+#
 from src import db
 
 
@@ -24,6 +41,38 @@ def session_update():
     db.session.commit()
 
 
+def session_commit_versioned(before_commit=None):
+    """
+    Commits changes of rows with version counters
+    (rolled back if a row has been modified by a concurrent transaction).
+
+    :param callable before_commit: a function called in the same transaction
+                                   after the changes are flushed (e.g. a refresh of summaries)
+    :return bool: True if the changes are committed/False if they are rolled back
+    """
+    try:
+        db.session.flush()
+        if before_commit:
+            before_commit()
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def session_update_versioned(before_commit=None):
+    """
+    Implements UPDATE CRUD operation of rows with version counters.
+    Aborts execution (412) if a row has been modified by a concurrent transaction.
+
+    :param callable before_commit: a function called in the same transaction
+                                   after the changes are flushed (e.g. a refresh of summaries)
+    """
+    if not session_commit_versioned(before_commit):
+        abort(412, "Precondition failed. The object has been modified concurrently")
+
+
 def session_delete(row):
     """
     Implements DELETE CRUD operation.
@@ -34,3 +83,334 @@ def session_delete(row):
     """
     db.session.delete(row)
     db.session.commit()
+
+
+class KeysetPage:
+    """
+    A page of rows fetched by "paginate_keyset".
+
+    Fields: items, cursor of the next (older) page, cursor of the previous (newer) page
+    """
+    __slots__ = ("items", "next_cursor", "prev_cursor")
+
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def encode_cursor(row, columns, backwards=False):
+    """
+    Encodes the key of a row into an opaque URL-safe cursor.
+
+    :param SQLAlchemy().Model row: an instance of an SQL ORM model
+    :param tuple columns: columns of the key
+    :param bool backwards: the cursor points to rows preceding the row
+    :return str: a cursor
+    """
+    key = [getattr(row, column.key) for column in columns]
+    key = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    return urlsafe_b64encode(json.dumps([int(backwards), key]).encode()).decode()
+
+
+def _coerce_key_value(column, value):
+    """
+    Converts a decoded value of a cursor to the Python type of a key column.
+    Raises ValueError if the value does not match the type.
+
+    :param sqlalchemy.Column column: a column of the key
+    :param value: a value decoded from JSON
+    :return: the value of the Python type of the column
+    """
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if isinstance(value, bool):  # JSON booleans are integers in Python
+        raise ValueError("The cursor does not match the key")
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, python_type):
+        raise ValueError("The cursor does not match the key")
+    return value
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decodes a cursor created by "encode_cursor".
+    Raises ValueError if the cursor is malformed
+    or its values do not match the types of the key columns.
+
+    :param str cursor: a cursor
+    :param tuple columns: columns of the key
+    :return tuple: a direction flag (True: backwards), the key
+    """
+    try:
+        backwards, key = json.loads(urlsafe_b64decode(cursor.encode()))
+        if len(key) != len(columns):
+            raise ValueError("The cursor does not match the key")
+        return bool(backwards), [_coerce_key_value(column, value)
+                                 for column, value in zip(columns, key)]
+    except (Base64Error, TypeError, UnicodeError, json.JSONDecodeError) as error:
+        raise ValueError("Malformed cursor") from error
+
+
+def paginate_keyset(query, columns, cursor=None, per_page=10):
+    """
+    Fetches a page of a query ordered by descending key columns
+    with a row-value comparison instead of OFFSET and without COUNT(*),
+    so that deep pages are as cheap as the first one
+    (provided an index on the key columns exists).
+    Raises ValueError if the cursor is malformed.
+
+    :param flask_sqlalchemy.BaseQuery query: a query without ORDER BY
+    :param tuple columns: columns of a unique key (e.g. date and id)
+    :param str cursor: a cursor of a page, the first page by default
+    :param int per_page: the maximal number of rows of a page
+    :return KeysetPage: a page
+    """
+    backwards = False
+    if cursor:
+        backwards, key = decode_cursor(cursor, columns)
+        key = db.tuple_(*[db.literal(value, column.type) for column, value in zip(columns, key)])
+        query = query.filter(db.tuple_(*columns) > key if backwards
+                             else db.tuple_(*columns) < key)
+    order = [column.asc() if backwards else column.desc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()  # the extra row: one more page exists
+    is_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    has_next, has_prev = (bool(cursor), is_more) if backwards else (is_more, bool(cursor))
+    return KeysetPage(
+        rows,
+        encode_cursor(rows[-1], columns) if rows and has_next else None,
+        encode_cursor(rows[0], columns, backwards=True) if rows and has_prev else None,
+    )
+
+
+def select_fields(object_fields, names=None):
+    """
+    Picks fields of a REST representation requested
+    by a comma-separated list of names (a sparse fieldset).
+    Raises ValueError if a name is unknown.
+
+    :param dict object_fields: all fields of the representation
+    :param str names: names of fields, all fields by default
+    :return dict: the requested fields in the order of the representation
+    """
+    if not names:
+        return object_fields
+    requested = {name.strip() for name in names.split(",")} - {""}
+    unknown = requested - set(object_fields)
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {sorted(unknown)}")
+    return {name: field for name, field in object_fields.items() if name in requested}
+
+
+def stream_rows(query, ndjson=False, chunk_size=1000):
+    """
+    Serializes rows of a query of labelled columns into JSON chunk by chunk
+    (an array or NDJSON: an object per line). Rows are read through a server-side
+    cursor, so neither the rows nor the body are ever held in memory as a whole.
+
+    :param flask_sqlalchemy.BaseQuery query: a query of columns labelled by field names
+    :param bool ndjson: NDJSON instead of an array
+    :param int chunk_size: the number of rows per fetch and per chunk of the body
+    :return generator: chunks of the body
+    """
+    rows = (json.dumps(row._asdict(), default=str) for row in query.yield_per(chunk_size))
+    if not ndjson:
+        yield "["
+    separator = ""
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        if ndjson:
+            yield "".join(f"{row}\n" for row in chunk)
+        else:
+            yield separator + ",".join(chunk)
+            separator = ","
+    if not ndjson:
+        yield "]"
+
+
+def prefers_ndjson():
+    """
+    Checks if the client of a request prefers NDJSON ("application/x-ndjson") to JSON.
+
+    :return bool: an indicator of the preference
+    """
+    return request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"],
+                                               default="application/json") \
+        == "application/x-ndjson"
+
+
+def stream_response(query):
+    """
+    Streams a REST collection as a chunked response:
+    NDJSON if the client prefers it, a JSON array otherwise.
+
+    :param flask_sqlalchemy.BaseQuery query: a query of columns labelled by field names
+    :return flask.Response: a streamed response
+    """
+    ndjson = prefers_ndjson()
+    chunks = stream_rows(query, ndjson, current_app.config["API_STREAM_CHUNK_SIZE"])
+    return Response(stream_with_context(chunks),
+                    mimetype="application/x-ndjson" if ndjson else "application/json")
+
+
+def hash_etag(*parts):
+    """
+    Builds an ETag from parts of a representation
+    (versions of rows, arguments and the media type of the request).
+
+    :param parts: values converted to strings
+    :return str: an unquoted ETag
+    """
+    return sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_collection_etag(query, id_column, version_columns, *representation):
+    """
+    Builds an ETag of a collection of rows with version counters
+    from the number of rows, the greatest id (changed by insertions),
+    the sums of versions (changed by updates of the rows and of joined rows)
+    and the parts of the representation (a media type, requested fields...).
+    The aggregate reads the whole collection: use it for streamed collections only,
+    pages are tagged with "hash_etag" of their own rows.
+
+    :param flask_sqlalchemy.BaseQuery query: a query of the rows
+    :param id_column: the primary key column
+    :param tuple version_columns: version counter columns
+    :param representation: parts of the representation
+    :return str: an ETag (to be sent as a weak one)
+    """
+    aggregates = query.with_entities(
+        db.func.count(id_column), db.func.max(id_column),
+        *[db.func.coalesce(db.func.sum(column), 0) for column in version_columns],
+    ).one()
+    return hash_etag(*aggregates, *representation)
+
+
+def get_etag_headers(etag, weak=False, vary=None):
+    """
+    Builds headers of a response carrying an ETag.
+
+    :param str etag: an unquoted ETag
+    :param bool weak: the ETag is weak
+    :param str vary: request headers selecting the representation (e.g. "Accept")
+    :return dict: headers
+    """
+    headers = {"ETag": quote_etag(etag, weak)}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def is_not_modified(etag):
+    """
+    Checks if "If-None-Match" header of a request matches an ETag
+    (the client's copy is up to date: 304 Not Modified can be returned).
+
+    :param str etag: an unquoted ETag of the current representation
+    :return bool: an indicator of the match
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def verify_if_match(etag):
+    """
+    Verifies "If-Match" header of a modifying request (optimistic concurrency).
+    Aborts execution (412) if the header is present and does not match the ETag.
+
+    :param str etag: an unquoted ETag of the current representation
+    """
+    if request.if_match and not request.if_match.contains(etag):
+        abort(412, "Precondition failed. The object has been modified")
+
+
+def get_batch():
+    """
+    Reads a JSON list of items of a bulk REST operation from a request.
+    Aborts execution if the body is not a list (400)
+    or the list is longer than "API_BATCH_SIZE" (413).
+
+    :return list: the items
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        abort(400, "Bad request. A JSON list of items is required")
+    if len(items) > current_app.config["API_BATCH_SIZE"]:
+        abort(413, f"Payload too large. At most {current_app.config['API_BATCH_SIZE']} "
+                   f"items per batch")
+    return items
+
+
+def parse_uuid(value):
+    """
+    Converts an item of a bulk REST operation into a UUID.
+
+    :param value: a UUID string (any JSON value may be sent)
+    :return UUID/NoneType: the UUID/None if the value is not a UUID
+    """
+    try:
+        return UUID(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+
+def get_item_status(uuid, code, message=None):
+    """
+    Builds a status of an item of a bulk REST operation.
+
+    :param uuid: the UUID of the item as sent by the client
+    :param int code: an HTTP status code of the item
+    :param str message: a hint, if any
+    :return dict: the status
+    """
+    status = {"uuid": uuid, "status": code}
+    if message:
+        status["message"] = message
+    return status
+
+
+def update_versioned_batch(table, key, values, params):
+    """
+    Applies an UPDATE to rows of a bulk REST operation
+    only where "version" still equals the version expected by each item
+    ("WHERE id = :<key> AND version = :expected_version"), incrementing the version.
+    The batch is sent with a single executemany; if fewer rows match
+    (rows modified concurrently), it is rolled back to a savepoint
+    and repeated item by item to find the rows which did not match.
+
+    :param sqlalchemy.Table table: a table with "id" and "version" columns
+    :param str key: the name of the parameter with the primary key of a row
+    :param dict values: new values of columns (SQL expressions of parameters of the items)
+    :param list params: parameters of the items, each with "expected_version"
+    :return list: indicators of updated rows in the order of the items
+    """
+    if not params:
+        return []
+    statement = table.update().where(
+        table.c.id == db.bindparam(key),
+        table.c.version == db.bindparam("expected_version")
+    ).values(version=table.c.version + 1, **values)
+    savepoint = db.session.begin_nested()
+    if db.session.execute(statement, params).rowcount == len(params):
+        savepoint.commit()
+        return [True] * len(params)
+    savepoint.rollback()
+    return [db.session.execute(statement, param).rowcount == 1 for param in params]
+
+
+def upsert(table):
+    """
+    Creates an INSERT statement of the current dialect
+    which supports "ON CONFLICT" clauses.
+
+    :param sqlalchemy.Table table: a table
+    :return sqlalchemy.sql.Insert: an INSERT statement
+    """
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite  # SQLite: tests
+    return dialect.insert(table)
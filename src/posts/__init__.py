@@ -6,4 +6,4 @@ from flask import Blueprint
 
 bp = Blueprint('posts', __name__)  # pylint: disable=C0103
 
-from src.posts import routes  # cyclic import prevention
+from src.posts import commands, routes  # cyclic import prevention
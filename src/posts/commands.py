@@ -0,0 +1,20 @@
+"""
+The module registers CLI commands of the BP-registered application "posts"
+(run as "flask posts <command>").
+"""
+
+import click
+#
+from src.posts import bp
+from src.posts.models import FeedbackSummary
+from src.quiz.summaries import find_test_id, rebuild_summary
+
+
+@bp.cli.command("rebuild-feedback")
+@click.option("--test", "test_uuid", type=click.UUID, help="Rebuild a single test.")
+@click.option("--check", is_flag=True, help="Report differences without writing them.")
+def rebuild_feedback(test_uuid, check):
+    """
+    Reconstructs feedback summaries of tests from posts.
+    """
+    rebuild_summary(FeedbackSummary, find_test_id(test_uuid), check)
@@ -5,17 +5,32 @@ in the process of creation, viewing and editing.
 """
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, TextAreaField, SelectField
-from wtforms.validators import DataRequired
+from wtforms import IntegerField, StringField, SubmitField, TextAreaField
+from wtforms.validators import DataRequired, ValidationError
+from wtforms.widgets import HiddenInput
+#
+from src.quiz.cache import get_test
 
 
 class PostForm(FlaskForm):
     """
     A class which renders a form for "Post" creataion.
 
-    Fields: title, related test, content(text)
+    Fields: title, related test (id chosen with the typeahead picker), content(text)
     """
     title = StringField('Title', validators=[DataRequired()])
-    test = SelectField('Test', choices=[], validators=[DataRequired()])
+    test = IntegerField('Test', widget=HiddenInput(),
+                        validators=[DataRequired(message="Choose a test from the list")])
     content = TextAreaField('Content', validators=[DataRequired()])
     submit = SubmitField('Confirm')
+
+    def validate_test(self, input_test):  # do not make @static
+        """
+        This method verifies that the chosen test exists
+        (by the primary key).
+        Raises ValidationErrors otherwise.
+
+        :param IntegerField input_test: the id of a test chosen with the picker
+        """
+        if not get_test(input_test.data):
+            raise ValidationError("Choose a test from the list")
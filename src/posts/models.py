@@ -1,21 +1,31 @@
 """
-This module contains SQL ORM model for "Post" instances.
+This module contains SQL ORM models for "Post" instances
+and for summaries of feedback of tests.
 """
 
 from datetime import datetime
 from uuid import uuid4
 #
+from flask import current_app
 from sqlalchemy.dialects.postgresql import UUID
 #
 from src import db
+from src.auth.models import User
+from src.main.service import paginate_keyset, upsert
+from src.quiz.models import Test
 
 
 class Post(db.Model):
     """
     An ORM class which represents SQL table "post".
 
-    Fields: id, uuid, title, content, post date, author, related test.
+    Fields: id, uuid, title, content, post date, author, related test, row version.
     """
+    __table_args__ = (
+        db.Index("ix_post_post_date_id", "post_date", "id"),  # keyset pagination of the feed
+        db.Index("ix_post_test_id_post_date", "test_id", "post_date"),  # feedback summaries
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(UUID(as_uuid=True), default=uuid4, index=True, unique=True)  # PgSQL
     title = db.Column(db.String(60), nullable=False)
@@ -23,6 +33,39 @@ class Post(db.Model):
     post_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # no (): curr.time
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # err: admin user del
     test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")  # +1 per ORM update
+    __mapper_args__ = {"version_id_col": version}  # ETags and optimistic concurrency of REST
+    search_snippet = None  # highlighted matches of a search ("posts.search.search_posts")
+
+    @classmethod
+    def with_related(cls, query=None):
+        """
+        Loads the author and the test of posts of a query
+        in the same SELECT (only the displayed columns and the versions of ETags),
+        so that rendering of posts issues no query per post.
+
+        :param flask_sqlalchemy.BaseQuery query: a query of posts, all posts by default
+        :return flask_sqlalchemy.BaseQuery: the query with eager loading
+        """
+        return (query or cls.query).options(
+            db.joinedload(cls.author).load_only(User.username, User.uuid, User.image,
+                                                User.version),
+            db.joinedload(cls.test).load_only(Test.title, Test.version),
+        )
+
+    @classmethod
+    def get_page(cls, query=None, cursor=None, per_page=10):
+        """
+        Fetches a page of posts (with their authors and tests) from the newest
+        to the oldest with keyset pagination on the post date and the id.
+        Raises ValueError if the cursor is malformed.
+
+        :param flask_sqlalchemy.BaseQuery query: a query of posts, all posts by default
+        :param str cursor: a cursor of a page, the first page by default
+        :param int per_page: the maximal number of posts of a page
+        :return KeysetPage: a page of posts
+        """
+        return paginate_keyset(cls.with_related(query), (cls.post_date, cls.id), cursor, per_page)
 
     def __repr__(self):
         """
@@ -31,3 +74,127 @@ class Post(db.Model):
         :return str: title and date of publication of the post
         """
         return f"Post({self.title}, {self.post_date})"
+
+
+class FeedbackSummary(db.Model):
+    """
+    An ORM class which represents SQL table "feedback_summary":
+    the feedback panel of a test (tests without posts have no summary).
+    Summaries are refreshed as posts are created, edited and removed
+    and may be rebuilt from the "post" table.
+
+    Fields: related test, number of posts, latest posts (uuid, title, author, date),
+            top authors (username, number of posts)
+
+    Methods:
+        - refresh
+        - refresh_authors
+        - rebuild
+    """
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), primary_key=True)
+    num_posts = db.Column(db.Integer, default=0, nullable=False)
+    latest_posts = db.Column(db.JSON, default=list, nullable=False)
+    top_authors = db.Column(db.JSON, default=list, nullable=False)
+
+    @classmethod
+    def refresh(cls, test_ids):
+        """
+        Recomputes summaries of tests from their posts with three set-based queries
+        (pending changes of the session are flushed first).
+        The rows of the summaries are created if missing and locked beforehand
+        (in the order of tests), so concurrent refreshes of a test are serialized
+        and the later one counts the posts committed by the earlier one.
+        Summaries of tests without posts are removed.
+        The caller commits.
+
+        :param iterable test_ids: primary keys of tests (None is ignored)
+        """
+        test_ids = sorted({test_id for test_id in test_ids if test_id is not None})
+        if not test_ids:
+            return
+        table = cls.__table__
+        db.session.execute(upsert(table).values([
+            {"test_id": test_id, "num_posts": 0, "latest_posts": [], "top_authors": []}
+            for test_id in test_ids
+        ]).on_conflict_do_nothing(index_elements=[table.c.test_id]))
+        db.session.query(cls.test_id).filter(cls.test_id.in_(test_ids)) \
+            .order_by(cls.test_id).with_for_update().all()  # SELECT ... FOR UPDATE
+        num_latest = current_app.config['FEEDBACK_LATEST_POSTS']
+        num_authors = current_app.config['FEEDBACK_TOP_AUTHORS']
+        counts = dict(db.session.query(Post.test_id, db.func.count(Post.id))
+                      .filter(Post.test_id.in_(test_ids)).group_by(Post.test_id))
+        latest = db.session.query(
+            Post.test_id, Post.uuid, Post.title, Post.post_date, Post.user_id,
+            db.func.row_number().over(partition_by=Post.test_id,
+                                      order_by=(Post.post_date.desc(), Post.id.desc()))
+            .label("place"),
+        ).filter(Post.test_id.in_(test_ids)).subquery()
+        authors = db.session.query(
+            Post.test_id, Post.user_id, db.func.count(Post.id).label("num_posts"),
+            db.func.row_number().over(partition_by=Post.test_id,
+                                      order_by=(db.func.count(Post.id).desc(), Post.user_id))
+            .label("place"),
+        ).filter(Post.test_id.in_(test_ids)).group_by(Post.test_id, Post.user_id).subquery()
+        summaries = {test_id: {"test_id": test_id, "num_posts": num_posts,
+                               "latest_posts": [], "top_authors": []}
+                     for test_id, num_posts in counts.items()}
+        for row in db.session.query(latest, User.username) \
+                .join(User, User.id == latest.c.user_id).filter(latest.c.place <= num_latest) \
+                .order_by(latest.c.test_id, latest.c.place):
+            summaries[row.test_id]["latest_posts"].append({
+                "uuid": str(row.uuid), "title": row.title, "username": row.username,
+                "post_date": row.post_date.isoformat(),
+            })
+        for row in db.session.query(authors, User.username) \
+                .join(User, User.id == authors.c.user_id).filter(authors.c.place <= num_authors) \
+                .order_by(authors.c.test_id, authors.c.place):
+            summaries[row.test_id]["top_authors"].append({"username": row.username,
+                                                       "num_posts": row.num_posts})
+        db.session.execute(table.delete().where(table.c.test_id.in_(test_ids))
+                           .where(table.c.test_id.notin_(list(summaries))))  # tests without posts
+        for summary in summaries.values():
+            statement = upsert(table).values(**summary)
+            excluded = statement.excluded
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.test_id],
+                set_={"num_posts": excluded.num_posts, "latest_posts": excluded.latest_posts,
+                      "top_authors": excluded.top_authors},
+            ))
+
+    @classmethod
+    def refresh_authors(cls, user_ids):
+        """
+        Recomputes summaries of tests the users have posted feedback on
+        (the usernames of authors are stored in summaries: call it on renames).
+        The caller commits.
+
+        :param iterable user_ids: primary keys of users
+        """
+        user_ids = list(user_ids)
+        if user_ids:
+            cls.refresh([test_id for test_id, in db.session.query(Post.test_id)
+                         .filter(Post.user_id.in_(user_ids)).distinct()])
+
+    @classmethod
+    def rebuild(cls, test_id=None):
+        """
+        Recreates summaries from the "post" table.
+        The caller commits.
+
+        :param int test_id: the primary key of a test, all tests by default
+        """
+        if test_id is not None:
+            cls.refresh([test_id])
+            return
+        cls.query.delete(synchronize_session=False)
+        test_ids = [test_id for test_id, in db.session.query(Post.test_id).distinct()]
+        for start in range(0, len(test_ids), 1000):
+            cls.refresh(test_ids[start:start + 1000])
+
+    def __repr__(self):
+        """
+        Readable representation of an instance.
+
+        :return str: the id of the related test and the number of posts
+        """
+        return f"FeedbackSummary(test id:{self.test_id}, {self.num_posts} posts)"
@@ -3,14 +3,22 @@ The module implements REST-friendly API
 for CRUD operations with instances of "Post" ORM model.
 """
 
-from flask import abort
-from flask_restful import Resource, reqparse, marshal_with, fields
+from uuid import UUID
+#
+from flask import abort, current_app, request, url_for
+from flask_restful import Resource, reqparse, marshal, marshal_with, fields
 from flask_login import current_user
 #
 from sqlalchemy.exc import DataError
 
-from src.main.service import session_update, session_delete
-from src.posts.models import Post
+from src import db
+from src.auth.models import User
+from src.main.service import get_batch, get_collection_etag, get_etag_headers, \
+    get_item_status, hash_etag, is_not_modified, parse_uuid, prefers_ndjson, select_fields, \
+    session_update_versioned, stream_response, update_versioned_batch, verify_if_match
+from src.posts.models import FeedbackSummary, Post
+from src.posts.search import search_posts
+from src.quiz.models import Test
 
 
 class PostCommonAPI(Resource):
@@ -19,10 +27,23 @@ class PostCommonAPI(Resource):
     used by all its children.
 
     Fields:
+        - get_post_args: a request parser with args for GET method
+        - get_posts: a request parser with args for GET method of the collection
         - put_post: a request parser with args for PUT method
         - patch_post: a request parser with args for PATCH method
         - object_field: a hash table of object fields representable in API
+        - object_columns: a hash table of columns of the object fields
     """
+    get_post_args = reqparse.RequestParser()
+    get_post_args.add_argument('fields', type=str, location='args',
+                               help="comma-separated names of fields")
+
+    get_posts = get_post_args.copy()
+    get_posts.add_argument('cursor', type=str, location='args', help="cursor of a page")
+    get_posts.add_argument('limit', type=int, location='args', help="number of posts per page")
+    get_posts.add_argument('q', type=str, location='args', help="words to search for")
+    get_posts.add_argument('test', type=UUID, location='args', help="UUID of a related test")
+
     put_post = reqparse.RequestParser()
     put_post.add_argument('title', type=str, help="title field required", required=True)
     put_post.add_argument('content', type=str, help="content field required", required=True)
@@ -37,9 +58,44 @@ class PostCommonAPI(Resource):
         "content": fields.String,
         "user": fields.String(attribute="author.username"),
         "test": fields.String(attribute="test.title"),
+        "snippet": fields.String(attribute="search_snippet"),
+    }
+    object_columns = {  # a snippet exists in search results only
+        "uuid": Post.uuid,
+        "title": Post.title,
+        "content": Post.content,
+        "user": User.username,
+        "test": Test.title,
     }
 
-    def get_post(self, post_uuid):
+    def get_fields(self, names):
+        """
+        Picks the object fields requested with "fields" argument.
+        Aborts execution if a field is unknown.
+
+        :param str names: comma-separated names of fields, all fields by default
+        :return dict: the requested object fields
+        """
+        try:
+            return select_fields(self.object_fields, names)
+        except ValueError as error:
+            return abort(400, f"Bad request. {error}")
+
+    def load_fields(self, query, object_fields):
+        """
+        Restricts columns of posts loaded by a query to the ones of the object fields
+        (and the ones required for authorization, pagination and ETags).
+
+        :param flask_sqlalchemy.BaseQuery query: a query of posts
+        :param dict object_fields: the requested object fields
+        :return flask_sqlalchemy.BaseQuery: the restricted query
+        """
+        columns = [self.object_columns[name] for name in object_fields
+                   if name in self.object_columns and self.object_columns[name].class_ is Post]
+        return query.options(db.load_only(Post.uuid, Post.user_id, Post.post_date, Post.version,
+                                          *columns))
+
+    def get_post(self, post_uuid, object_fields=None):
         """
         Fetches a post from "post" table
         by UUID if the uuid is correct and
@@ -47,16 +103,30 @@ class PostCommonAPI(Resource):
         Aborts execution in case of wrong data input.
 
         :param UUID post_uuid: uuid of the post
+        :param dict object_fields: object fields to load, all by default
         :return Post post: an instance of "Post" ORM model
         """
+        query = Post.with_related()
+        if object_fields:
+            query = self.load_fields(query, object_fields)
         try:
-            post = Post.query.filter_by(uuid=post_uuid).first()
+            post = query.filter_by(uuid=post_uuid).first()
             if not post:
                 return abort(404, "A post with this UUID does not exist")
             return post
         except DataError:  # in case UUID is input in inept format
             abort(400, "Bad request. Inept UUID format")
 
+    def get_etag(self, post):
+        """
+        Builds an ETag of a post from the row versions of the post,
+        of its author and of its test (their username and title are rendered too).
+
+        :param Post post: an instance of ORM "Post" model
+        :return str: an unquoted ETag
+        """
+        return f"{post.uuid}.{post.version}.{post.author.version}.{post.test.version}"
+
     def verify_authorization(self):
         """
         Verifies if client is authorized to interact with REST API.
@@ -84,25 +154,30 @@ class PostAPI(PostCommonAPI):
     methods: get, put, patch, delete
     """
 
-    @marshal_with(PostCommonAPI.object_fields, envelope="post")
     def get(self, post_uuid):
         """
         REST API GET method.
+        Only the fields listed in "fields" argument are loaded and returned (all by default).
+        Returns 304 Not Modified if "If-None-Match" header matches the ETag of the post.
 
         :param UUID post_uuid: UUID of a post
-        :return Post post: an instance of "Post" ORM model
+        :return dict: a representation of an instance of "Post" ORM model
         """
         super().verify_authorization()
-        post = super().get_post(post_uuid)
-        if current_user.is_superuser:  # admin may view all posts
-            return post
-        super().verify_authorship(post)  # other users may view their own posts
-        return post
+        object_fields = super().get_fields(super().get_post_args.parse_args()["fields"])
+        post = super().get_post(post_uuid, object_fields)
+        if not current_user.is_superuser:  # admin may view all posts
+            super().verify_authorship(post)  # other users may view only their own posts
+        etag = super().get_etag(post)
+        if is_not_modified(etag):
+            return "", 304, get_etag_headers(etag)
+        return marshal(post, object_fields, envelope="post"), 200, get_etag_headers(etag)
 
     @marshal_with(PostCommonAPI.object_fields)
     def put(self, post_uuid):
         """
         REST API PUT method.
+        Aborts execution (412) if "If-Match" header does not match the ETag of the post.
 
         :param UUID post_uuid: UUID of a post
         :return Post post: an instance of "Post" ORM model
@@ -110,17 +185,19 @@ class PostAPI(PostCommonAPI):
         super().verify_authorization()
         post = super().get_post(post_uuid)
         super().verify_authorship(post)  # only authors may edit their own posts
+        verify_if_match(super().get_etag(post))
         #
         args = super().put_post.parse_args(strict=True)
         post.title = args["title"]
         post.content = args["content"]
-        session_update()
-        return post
+        session_update_versioned(lambda: FeedbackSummary.refresh([post.test_id]))
+        return post, 200, get_etag_headers(super().get_etag(post))
 
     @marshal_with(PostCommonAPI.object_fields)
     def patch(self, post_uuid):
         """
         REST API PATCH method.
+        Aborts execution (412) if "If-Match" header does not match the ETag of the post.
 
         :param UUID post_uuid: UUID of a post
         :return Post post: an instance of "Post" ORM model
@@ -128,6 +205,7 @@ class PostAPI(PostCommonAPI):
         super().verify_authorization()
         post = super().get_post(post_uuid)
         super().verify_authorship(post)  # only authors may edit their own posts
+        verify_if_match(super().get_etag(post))
         #
         args = super().patch_post.parse_args(strict=True)
         if not (args.get("title", None) or args.get("content", None)):
@@ -137,12 +215,13 @@ class PostAPI(PostCommonAPI):
             post.title = args["title"]
         if args.get("content", None):
             post.content = args["content"]
-        session_update()
-        return post
+        session_update_versioned(lambda: FeedbackSummary.refresh([post.test_id]))
+        return post, 200, get_etag_headers(super().get_etag(post))
 
     def delete(self, post_uuid):
         """
         REST API DELETE method.
+        Aborts execution (412) if "If-Match" header does not match the ETag of the post.
 
         :param UUID post_uuid: UUID of a post
         :return str: status hint
@@ -150,8 +229,10 @@ class PostAPI(PostCommonAPI):
         super().verify_authorization()
         post = super().get_post(post_uuid)
         super().verify_authorship(post)  # only authors may edit their own posts
+        verify_if_match(super().get_etag(post))
         #
-        session_delete(post)
+        db.session.delete(post)
+        session_update_versioned(lambda: FeedbackSummary.refresh([post.test_id]))
         return "deletion successful", 200
 
 
@@ -163,19 +244,86 @@ class PostsAPI(PostCommonAPI):
     methods: get, post
     """
 
-    @marshal_with(PostCommonAPI.object_fields)
     def get(self):
         """
         REST API GET method.
+        Posts are returned from the newest to the oldest by pages of "limit" posts
+        (at most "POSTS_API_PAGE_SIZE"); the "Link" header of a page
+        refers to the next page ("cursor" argument).
+        Posts may be filtered by a related test ("test" argument)
+        and searched for words ("q" argument): then they are returned
+        from the most relevant with highlighted snippets.
+        Only the fields listed in "fields" argument are returned (all by default).
+        Clients preferring NDJSON ("Accept: application/x-ndjson") get all the posts
+        at once streamed from a server-side cursor (an export) instead of pages.
+        Returns 304 Not Modified if "If-None-Match" header matches the weak ETag
+        of the page (built from the posts of the page) or of the export
+        (the representations differ: "Vary: Accept").
 
-        :return list: all existing instances of "Post" ORM model
+        :return list/Response: representations of a page of posts/a stream of all posts
         """
         super().verify_authorization()
         if current_user.is_superuser:
-            posts = Post.query.all()
+            query = Post.query
         else:
-            posts = Post.query.filter_by(user_id=current_user.id).all()
-        return posts
+            query = Post.query.filter_by(user_id=current_user.id)
+        args = super().get_posts.parse_args()
+        object_fields = super().get_fields(args["fields"])
+        if args["test"]:
+            test = Test.query.filter_by(uuid=args["test"]).first()
+            if not test:
+                return abort(404, "A test with this UUID does not exist")
+            query = query.filter_by(test_id=test.id)
+        if prefers_ndjson():
+            if args["q"]:
+                return abort(400, "Bad request. Search results cannot be exported")
+            etag = get_collection_etag(query.join(Post.author).join(Post.test), Post.id,
+                                       (Post.version, User.version, Test.version),
+                                       "ndjson", *object_fields)
+            if is_not_modified(etag):
+                return "", 304, get_etag_headers(etag, weak=True, vary="Accept")
+            response = stream_response(self.export_query(query, object_fields))
+            response.headers.extend(get_etag_headers(etag, weak=True, vary="Accept"))
+            return response
+        query = super().load_fields(query, object_fields)
+        max_limit = current_app.config['POSTS_API_PAGE_SIZE']
+        limit = min(max(args["limit"] or max_limit, 1), max_limit)
+        try:
+            if args["q"]:
+                page = search_posts(args["q"], query, args["cursor"], limit)
+            else:
+                page = Post.get_page(query, args["cursor"], limit)
+        except ValueError:
+            return abort(400, "Bad request. Inept cursor")
+        etag = hash_etag("json", args["q"], page.next_cursor, *object_fields,
+                         *[self.get_etag(post) for post in page.items])
+        headers = get_etag_headers(etag, weak=True, vary="Accept")
+        if is_not_modified(etag):
+            return "", 304, headers
+        if page.next_cursor:
+            next_url = url_for(request.endpoint, cursor=page.next_cursor, limit=args["limit"],
+                               q=args["q"], test=args["test"], fields=args["fields"],
+                               _external=True)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return marshal(page.items, object_fields), 200, headers
+
+    def export_query(self, query, object_fields):
+        """
+        Builds a query of columns of the object fields of posts
+        (related tables are joined only if their fields are requested)
+        from the newest to the oldest post.
+
+        :param flask_sqlalchemy.BaseQuery query: a query of posts
+        :param dict object_fields: the requested object fields
+        :return flask_sqlalchemy.BaseQuery: a query of columns labelled by field names
+        """
+        query = query.with_entities(*[self.object_columns[name].label(name)
+                                      for name in object_fields if name in self.object_columns])
+        if "user" in object_fields:
+            query = query.join(Post.author)
+        if "test" in object_fields:
+            query = query.join(Post.test)
+        return query.order_by(Post.post_date.desc(), Post.id.desc())
 
     def post(self):
         """
@@ -189,3 +337,129 @@ class PostsAPI(PostCommonAPI):
         if not current_user.is_superuser:
             return abort(403, "Forbidden. Bad credentials")
         return "This feature is not implemented"  # FEEDBACK THROUGH REST API is inconvenient
+
+
+class PostsBatchAPI(PostCommonAPI):
+    """
+    REST API class for bulk operations with rows of the table "post":
+    a batch (at most "API_BATCH_SIZE" items) is authorized item by item,
+    applied with set-based statements in one transaction
+    and answered with a status per item.
+
+    methods: patch, delete
+    """
+
+    def get_batch_posts(self, uuids):
+        """
+        Fetches keys of posts of a batch with a single query.
+
+        :param list uuids: UUIDs of the posts (None is ignored)
+        :return dict: rows (id, uuid, user_id, test_id, version) by UUID
+        """
+        uuids = [uuid for uuid in uuids if uuid]
+        if not uuids:
+            return {}
+        return {row.uuid: row for row in db.session.query(Post.id, Post.uuid, Post.user_id,
+                                                          Post.test_id, Post.version)
+                .filter(Post.uuid.in_(uuids))}
+
+    def check_item(self, value, uuid, posts, seen, may_moderate=False):
+        """
+        Authorizes an item of a batch.
+
+        :param value: the UUID of the item as sent by the client
+        :param UUID uuid: the parsed UUID (None if inept)
+        :param dict posts: rows of the posts of the batch by UUID
+        :param set seen: UUIDs of the preceding items
+        :param bool may_moderate: admin may process posts of other users
+        :return dict/NoneType: a failure status/None if the item is authorized
+        """
+        if not uuid:
+            return get_item_status(value, 400, "Bad request. Inept UUID format")
+        if uuid in seen:
+            return get_item_status(value, 400, "Bad request. Duplicate item")
+        seen.add(uuid)
+        post = posts.get(uuid)
+        if not post:
+            return get_item_status(value, 404, "A post with this UUID does not exist")
+        if post.user_id != current_user.id and not (may_moderate and current_user.is_superuser):
+            return get_item_status(value, 403, "Forbidden. Bad credentials")
+        return None
+
+    def patch(self):
+        """
+        REST API PATCH method.
+        Takes a JSON list of patch documents {"uuid", "title", "content", "version"}
+        ("version" is optional: the post must not have been modified since).
+        Authors may patch only their own posts.
+
+        :return dict: statuses of the items
+        """
+        super().verify_authorization()
+        items = get_batch()
+        uuids = [parse_uuid(item.get("uuid")) if isinstance(item, dict) else None
+                 for item in items]
+        posts, seen = self.get_batch_posts(uuids), set()
+        statuses, params, test_ids = [], [], []
+        for item, uuid in zip(items, uuids):
+            value = item.get("uuid") if isinstance(item, dict) else item
+            failure = self.check_item(value, uuid, posts, seen)
+            if failure:
+                statuses.append(failure)
+                continue
+            post, title, content = posts[uuid], item.get("title"), item.get("content")
+            version = post.version if item.get("version") is None else item["version"]
+            if not isinstance(version, int):
+                statuses.append(get_item_status(value, 412, "Precondition failed. "
+                                                            "The object has been modified"))
+            elif not (title or content):
+                statuses.append(get_item_status(value, 406, "PATCH method must implement the "
+                                                            "modification of at list one field"))
+            elif not all(isinstance(field, str) for field in (title, content) if field):
+                statuses.append(get_item_status(value, 415, "Unsupported media type. "
+                                                            "All fields must be string"))
+            else:
+                statuses.append(get_item_status(value, 200))
+                params.append({"post_id": post.id, "expected_version": version,
+                               "new_title": title or None, "new_content": content or None})
+                test_ids.append(post.test_id)
+        if params:
+            table = Post.__table__
+            updated = update_versioned_batch(table, "post_id", {
+                "title": db.func.coalesce(db.bindparam("new_title"), table.c.title),
+                "content": db.func.coalesce(db.bindparam("new_content"), table.c.content),
+            }, params)
+            FeedbackSummary.refresh({test_id for test_id, is_updated in zip(test_ids, updated)
+                                     if is_updated})
+            db.session.commit()
+            applied = iter(updated)
+            for status in statuses:
+                if status["status"] == 200 and not next(applied):
+                    status.update(get_item_status(status["uuid"], 412, "Precondition failed. "
+                                                  "The object has been modified"))
+        return {"results": statuses}
+
+    def delete(self):
+        """
+        REST API DELETE method.
+        Takes a JSON list of UUIDs of posts.
+        Authors may delete their own posts, admin may delete any post (moderation).
+
+        :return dict: statuses of the items
+        """
+        super().verify_authorization()
+        items = get_batch()
+        uuids = [parse_uuid(value) for value in items]
+        posts, seen = self.get_batch_posts(uuids), set()
+        statuses, ids, test_ids = [], [], set()
+        for value, uuid in zip(items, uuids):
+            failure = self.check_item(value, uuid, posts, seen, may_moderate=True)
+            statuses.append(failure or get_item_status(value, 200))
+            if not failure:
+                ids.append(posts[uuid].id)
+                test_ids.add(posts[uuid].test_id)
+        if ids:
+            Post.query.filter(Post.id.in_(ids)).delete(synchronize_session=False)
+            FeedbackSummary.refresh(test_ids)
+            db.session.commit()
+        return {"results": statuses}
@@ -4,12 +4,17 @@ of the BP-registered application "posts"
 during client-server interaction through HTML templates.
 """
 
+from uuid import UUID
+#
 from flask import abort, current_app, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 #
-from src.main.service import session_create, session_update, session_delete
+from src import db
+from src.main.service import session_commit_versioned, session_update
 from src.posts import bp
-from src.posts.models import Post
+from src.posts.models import FeedbackSummary, Post
+from src.posts.search import search_posts
+from src.quiz.cache import get_test
 from src.quiz.models import Test
 from src.posts.forms import PostForm
 
@@ -23,17 +28,18 @@ def post_create_page():
     :return str: an HTML template for home page/post page
     """
     form = PostForm()
-    form.test.choices = [test.title for test in Test.query.all()]
     if form.validate_on_submit():
-        test = Test.query.filter_by(title=form.test.data).first()  # tests may share similar name
         post = Post(title=form.title.data, content=form.content.data,
-                    test_id=test.id, author=current_user)
-        session_create(post)
+                    test_id=form.test.data, author=current_user)
+        db.session.add(post)
+        FeedbackSummary.refresh([post.test_id])  # the feedback panel of the test
+        session_update()
         flash('Thank you fot the feedback', category="success")
         return redirect(url_for("main.home_page"))  # do not remove: POST-GET-redirect pattern
     return render_template("posts/post_create_or_update.html",
                            form=form,
-                           operation="Create a new")
+                           operation="Create a new",
+                           test=get_test(form.test.data))
 
 
 @bp.route("/posts", methods=["GET", "POST"])
@@ -41,13 +47,22 @@ def post_create_page():
 def post_list_view_page():
     """
     The function manages posts display procedure.
+    Posts may be filtered by a related test ("test" argument)
+    and searched for words ("q" argument) from the most relevant.
 
     :return str: an HTML template for posts (list) page
     """
-    posts = Post.query.order_by(Post.post_date.desc()).paginate(
-        per_page=current_app.config['POSTS_PER_PAGE']
-    )
-    return render_template("posts/post_list_view.html", posts=posts)
+    terms = request.args.get("q", "").strip()
+    test_uuid = request.args.get("test", type=UUID)
+    test = Test.query.filter_by(uuid=test_uuid).first() if test_uuid else None
+    query = Post.query.filter_by(test_id=test.id) if test else None
+    cursor, per_page = request.args.get("cursor"), current_app.config['POSTS_PER_PAGE']
+    try:
+        posts = search_posts(terms, query, cursor, per_page) if terms \
+            else Post.get_page(query, cursor, per_page)
+    except ValueError:
+        abort(400)
+    return render_template("posts/post_list_view.html", posts=posts, terms=terms, test=test)
 
 
 @bp.route("/posts/<uuid:post_uuid>", methods=["GET", "POST"])
@@ -63,23 +78,26 @@ def post_update_page(post_uuid):
     if post.author != current_user:  # in case of attempt to change the post by another user
         abort(403)
     form = PostForm()
-    form.test.choices = [test.title for test in Test.query.all()]
     if form.validate_on_submit():
-        test = Test.query.filter_by(title=form.test.data).first()  # tests may share similar name
-        post.test_id = test.id
+        previous_test_id = post.test_id  # the post may move to another test
+        post.test_id = form.test.data
         post.title = form.title.data
         post.content = form.content.data
-        session_update()  # no 'db.session.add' is required when altering a table row
+        if not session_commit_versioned(  # no 'db.session.add' is required when altering a row
+                lambda: FeedbackSummary.refresh([previous_test_id, post.test_id])):
+            flash("The post has been modified concurrently. Try again", category="warning")
+            return redirect(url_for('posts.post_update_page', post_uuid=post_uuid))
         flash("The post has been successfully updated", category="success")
         return redirect(url_for('posts.post_list_view_page', post_id=post.id))
     elif request.method == "GET":
         form.title.data = post.title
         form.content.data = post.content
-        form.test.data = post.test.title
+        form.test.data = post.test_id
     return render_template("posts/post_create_or_update.html",
                            form=form,
                            operation="Update your",
-                           post=post)
+                           post=post,
+                           test=get_test(form.test.data))
 
 
 @bp.route("/posts/delete/<uuid:post_uuid>", methods=["POST"])  # no 'GET' template
@@ -94,6 +112,9 @@ def post_delete(post_uuid):
     post = Post.query.filter_by(uuid=post_uuid).first()
     if post.author != current_user:  # in case of attempt to change the post by another user
         abort(403)
-    session_delete(post)
+    db.session.delete(post)
+    if not session_commit_versioned(lambda: FeedbackSummary.refresh([post.test_id])):
+        flash("The post has been modified concurrently. Try again", category="warning")
+        return redirect(url_for("posts.post_list_view_page"))
     flash("The post has been successfully deleted", category="success")
     return redirect(url_for("posts.post_list_view_page"))
@@ -0,0 +1,114 @@
+"""
+The module implements full-text search over posts ranked by relevance.
+
+PostgreSQL: a generated "post.search_vector" tsvector column
+(the title weighs more than the content) with a GIN index.
+SQLite (local and development runs): an external-content FTS5 table
+"post_fts" kept in sync with "post" by triggers.
+Both are created together with the "post" table (and by a migration).
+"""
+
+import re
+#
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event
+
+from src import db
+from src.main.service import paginate_keyset
+from src.posts.models import Post
+
+_MARK_START, _MARK_STOP = "\ue000", "\ue001"  # private-use characters absent from posts
+
+_PG_DDL = (
+    "ALTER TABLE post ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_post_search_vector ON post USING GIN (search_vector)",
+)
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5("
+    "title, content, content='post', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+)
+
+for statement in _PG_DDL:
+    event.listen(Post.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in _SQLITE_DDL:
+    event.listen(Post.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Post.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS post_fts").execute_if(dialect="sqlite"))
+
+
+def highlight(snippet):
+    """
+    Escapes a snippet of a post and marks the matched words.
+
+    :param str snippet: a snippet with matches between private-use markers
+    :return Markup: safe HTML with matches in <mark> tags
+    """
+    return Markup(escape(snippet or "")
+                  .replace(_MARK_START, Markup("<mark>"))
+                  .replace(_MARK_STOP, Markup("</mark>")))
+
+
+def _get_search_columns(terms):
+    """
+    Builds the dialect-specific parts of a search query.
+
+    :param str terms: words to search for
+    :return tuple: a match condition, a relevance expression, a snippet expression,
+                   a joined table (None for PostgreSQL)
+    """
+    if db.engine.dialect.name == "postgresql":
+        vector = db.literal_column("post.search_vector")
+        ts_query = db.func.websearch_to_tsquery("english", terms)
+        return (vector.op("@@")(ts_query),
+                db.func.ts_rank(vector, ts_query, type_=db.Float),
+                db.func.ts_headline("english", Post.content, ts_query,
+                                    f"StartSel={_MARK_START}, StopSel={_MARK_STOP}, "
+                                    f"MaxWords=30, MinWords=10"),
+                None)
+    # FTS5 syntax is not exposed: every word is quoted and all words are required
+    match = " ".join(f'"{word}"' for word in re.findall(r"\w+", terms))
+    fts = db.table("post_fts", db.column("rowid"))
+    fts_name = db.literal_column("post_fts")
+    return (fts_name.op("MATCH")(match),
+            -db.func.bm25(fts_name, 10.0, 1.0, type_=db.Float),  # bm25: lower is better
+            db.func.snippet(fts_name, 1, _MARK_START, _MARK_STOP, "...", 16),
+            fts)
+
+
+def search_posts(terms, query=None, cursor=None, per_page=10):
+    """
+    Fetches a page of posts matching words of a search query
+    from the most to the least relevant (keyset pagination on relevance and id).
+    Highlighted snippets of contents are put into "search_snippet" of the posts.
+    Raises ValueError if the cursor is malformed.
+
+    :param str terms: words to search for
+    :param flask_sqlalchemy.BaseQuery query: a query of posts, all posts by default
+    :param str cursor: a cursor of a page, the first page by default
+    :param int per_page: the maximal number of posts of a page
+    :return KeysetPage: a page of posts
+    """
+    if not re.search(r"\w", terms or ""):
+        return paginate_keyset(Post.query.filter(db.false()), (Post.post_date, Post.id))
+    condition, relevance, snippet, fts = _get_search_columns(terms)
+    relevance, post_id = relevance.label("relevance"), Post.id.label("post_id")
+    query = (query or Post.query).add_columns(relevance, post_id, snippet.label("snippet"))
+    if fts is not None:
+        query = query.join(fts, fts.c.rowid == Post.id)
+    query = query.filter(condition)
+    page = paginate_keyset(Post.with_related(query), (relevance, post_id), cursor, per_page)
+    for row in page.items:
+        row.Post.search_snippet = highlight(row.snippet)
+    page.items = [row.Post for row in page.items]
+    return page
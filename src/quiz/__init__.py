@@ -6,4 +6,4 @@ from flask import Blueprint
 
 bp = Blueprint('quiz', __name__)  # pylint: disable=C0103
 
-from src.quiz import routes  # cyclic import prevention
+from src.quiz import commands, routes  # cyclic import prevention
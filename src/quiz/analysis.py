@@ -0,0 +1,159 @@
+"""
+This module implements item analysis of tests: proportion correct (difficulty),
+point-biserial correlation of a question with the total score (discrimination),
+distribution of selected options and average time to answer of every question.
+
+Statistics are computed by a batch job ("flask quiz item-stats") with NumPy
+over answer logs of finished results and stored in "question_stats".
+The job is incremental: only results not yet analysed are read
+and their sums are added to the stored ones.
+"""
+
+from math import sqrt
+#
+import numpy as np
+#
+from src import db
+from src.quiz.grading import build_answer_mask, unpack_answer_times, unpack_answers
+from src.quiz.models import Question, QuestionStats, Result
+
+
+def accumulate(answer_mask, answers, scores, seconds=None):
+    """
+    Computes sums of a batch of complete answer logs per question.
+
+    :param numpy.ndarray answer_mask: a matrix built with "quiz.grading.build_answer_mask"
+    :param numpy.ndarray answers: option positions (results x questions)
+    :param numpy.ndarray scores: total numbers of correct answers of the results
+    :param numpy.ndarray seconds: times to answer (results x questions, 0 if unknown),
+                                  no times by default
+    :return dict: arrays of sums per question
+    """
+    if seconds is None:
+        seconds = np.zeros(answers.shape, dtype=np.uint16)
+    num_questions, width = answer_mask.shape
+    positions = np.where(answers >= width, 0, answers).astype(np.int64)
+    correct = answer_mask[np.arange(num_questions), positions]  # results x questions
+    scores = scores.astype(np.int64)
+    option_counts = np.bincount((positions + np.arange(num_questions) * width).ravel(),
+                                minlength=num_questions * width).reshape(num_questions, width)
+    return {
+        "num_responses": np.full(num_questions, len(scores), dtype=np.int64),
+        "num_correct": correct.sum(axis=0),
+        "sum_scores": np.full(num_questions, scores.sum(), dtype=np.int64),
+        "sum_scores_sq": np.full(num_questions, (scores ** 2).sum(), dtype=np.int64),
+        "sum_scores_correct": (correct * scores[:, np.newaxis]).sum(axis=0),
+        "option_counts": option_counts,
+        "num_timed": (seconds > 0).sum(axis=0),
+        "sum_answer_time": seconds.astype(np.int64).sum(axis=0),
+    }
+
+
+def point_biserial(num, num_correct, sum_scores, sum_scores_sq, sum_scores_correct):
+    """
+    Computes the point-biserial correlation of a question with the total score from sums.
+
+    :param int num: the number of responses
+    :param int num_correct: the number of correct responses
+    :param int sum_scores: the sum of total scores
+    :param int sum_scores_sq: the sum of squared total scores
+    :param int sum_scores_correct: the sum of total scores of correct responses
+    :return float/NoneType: the correlation/None if either variable has no variance
+    """
+    denominator = (num * sum_scores_sq - sum_scores ** 2) * (num * num_correct - num_correct ** 2)
+    if denominator <= 0:
+        return None
+    return (num * sum_scores_correct - sum_scores * num_correct) / sqrt(denominator)
+
+
+def _update_stats(stats, sums, column):
+    """
+    Adds sums of a question to its stored statistics and recalculates derived values.
+
+    :param QuestionStats stats: stored statistics of a question
+    :param dict sums: sums built with "accumulate"
+    :param int column: the index of the question in the sums
+    """
+    for name in ("num_responses", "num_correct", "sum_scores", "sum_scores_sq",
+                 "sum_scores_correct", "num_timed", "sum_answer_time"):
+        setattr(stats, name, (getattr(stats, name) or 0) + int(sums[name][column]))
+    counts = sums["option_counts"][column].tolist()
+    stored = list(stats.option_counts or [])
+    stored += [0] * (len(counts) - len(stored))
+    stats.option_counts = [value + (counts[position] if position < len(counts) else 0)
+                           for position, value in enumerate(stored)]
+    stats.difficulty = stats.num_correct / stats.num_responses if stats.num_responses else None
+    stats.discrimination = point_biserial(stats.num_responses, stats.num_correct,
+                                          stats.sum_scores, stats.sum_scores_sq,
+                                          stats.sum_scores_correct)
+    stats.mean_answer_time = stats.sum_answer_time / stats.num_timed if stats.num_timed else None
+
+
+def analyse_test(test_snapshot, batch_size=1000, progress=None):
+    """
+    Adds finished results of a test which have not been analysed yet to item statistics.
+    Each batch is committed together with the flags of its results.
+    Results without a complete answer log are flagged without being counted.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the test
+    :param int batch_size: the number of results per batch
+    :param callable progress: called with the number of analysed results after each batch
+    :return tuple: numbers of counted and of skipped results
+    """
+    table = Result.__table__
+    answer_mask = build_answer_mask(test_snapshot, [question.order_number
+                                                    for question in test_snapshot.questions])
+    question_ids = [question.id for question in test_snapshot.questions]
+    num_counted = num_skipped = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.answers, table.c.answer_times,
+                      table.c.num_correct_answers)
+            .where(table.c.test_id == test_snapshot.id,
+                   table.c.state == Result.State.FINISHED,
+                   table.c.is_analysed.is_(False))
+            .order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        complete = [row for row in rows
+                    if row.answers is not None and len(row.answers) == test_snapshot.num_questions]
+        if complete and question_ids:
+            sums = accumulate(answer_mask,
+                              unpack_answers([row.answers for row in complete],
+                                             test_snapshot.num_questions),
+                              np.array([row.num_correct_answers for row in complete]),
+                              unpack_answer_times([row.answer_times for row in complete],
+                                                  test_snapshot.num_questions))
+            stored = {stats.question_id: stats for stats in
+                      QuestionStats.query.filter(QuestionStats.question_id.in_(question_ids))}
+            for column, question_id in enumerate(question_ids):
+                stats = stored.get(question_id)
+                if not stats:
+                    stats = QuestionStats(question_id=question_id)
+                    db.session.add(stats)
+                _update_stats(stats, sums, column)
+        db.session.execute(table.update().where(table.c.id.in_([row.id for row in rows]))
+                           .values(is_analysed=True))
+        db.session.commit()
+        num_counted += len(complete)
+        num_skipped += len(rows) - len(complete)
+        if progress:
+            progress(num_counted + num_skipped)
+    return num_counted, num_skipped
+
+
+def reset_test_stats(test_id):
+    """
+    Removes item statistics of a test and unflags its results,
+    so that the next run recalculates them from scratch
+    (e.g. after questions or the answer key were changed).
+
+    :param int test_id: the primary key of an instance of "Test" ORM model
+    """
+    question_ids = db.select(Question.id).where(Question.test_id == test_id).scalar_subquery()
+    QuestionStats.query.filter(QuestionStats.question_id.in_(question_ids)) \
+        .delete(synchronize_session=False)
+    Result.query.filter_by(test_id=test_id, is_analysed=True) \
+        .update({Result.is_analysed: False}, synchronize_session=False)
+    db.session.commit()
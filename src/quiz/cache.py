@@ -0,0 +1,285 @@
+"""
+This module implements a per-process cache of compiled
+snapshots of "Test" ORM instances which serves
+the hot path of taking a test (result update)
+and lookups of tests for test pickers of forms.
+"""
+
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+#
+from src import db
+from src.quiz.models import Option, Question, Test
+
+
+class OptionSnapshot:
+    """
+    A read-only copy of an "Option" ORM instance.
+
+    Fields: id, text, flag of correctness
+    """
+    __slots__ = ("id", "text", "is_correct")
+
+    def __init__(self, pk, text, is_correct):
+        self.id = pk  # pylint: disable=C0103
+        self.text = text
+        self.is_correct = is_correct
+
+
+class QuestionSnapshot:
+    """
+    A read-only copy of a "Question" ORM instance
+    with its options.
+
+    Fields: id, order number, text, options, ids of correct options,
+            positions of options (counted from 1) by option id
+    """
+    __slots__ = ("id", "order_number", "text", "options", "correct_option_ids", "option_positions")
+
+    def __init__(self, pk, order_number, text, options):
+        self.id = pk  # pylint: disable=C0103
+        self.order_number = order_number
+        self.text = text
+        self.options = tuple(options)
+        self.correct_option_ids = frozenset(option.id for option in self.options
+                                            if option.is_correct)
+        self.option_positions = {option.id: position
+                                 for position, option in enumerate(self.options, start=1)}
+
+
+class TestSnapshot:
+    """
+    A compiled read-only copy of a "Test" ORM instance
+    with its questions ordered by the order number.
+
+    Fields: id, uuid, title, version, questions, number of questions,
+            answer key (ids of correct options by question id)
+
+    Methods:
+        - get_question
+        - is_correct
+        - get_position
+    """
+    __slots__ = ("id", "uuid", "title", "version", "questions", "num_questions", "answer_key",
+                 "_by_order", "_by_id")
+
+    def __init__(self, pk, test_uuid, title, version, questions):
+        self.id = pk  # pylint: disable=C0103
+        self.uuid = test_uuid
+        self.title = title
+        self.version = version
+        self.questions = tuple(questions)
+        self.num_questions = len(self.questions)
+        self.answer_key = {question.id: question.correct_option_ids for question in self.questions}
+        self._by_order = {question.order_number: question for question in self.questions}
+        self._by_id = {question.id: question for question in self.questions}
+
+    def get_question(self, order_number):
+        """
+        Fetches a question of the test by its order number.
+
+        :param int order_number: the order number of a question
+        :return QuestionSnapshot/NoneType: a question/None
+        """
+        return self._by_order.get(order_number)
+
+    def is_correct(self, question_id, option_id):
+        """
+        Grades an answer against the answer key in constant time.
+
+        :param int question_id: the primary key of a question
+        :param int option_id: the primary key of a selected option
+        :return bool: an indicator of correctness
+        """
+        return option_id in self.answer_key.get(question_id, ())
+
+    def get_position(self, question_id, option_id):
+        """
+        Finds the position of an option among the options of its question.
+
+        :param int question_id: the primary key of a question
+        :param int option_id: the primary key of an option
+        :return int: the position counted from 1/0 if the option is unknown
+        """
+        question = self._by_id.get(question_id)
+        return question.option_positions.get(option_id, 0) if question else 0
+
+
+def compile_test(test_uuid):
+    """
+    Loads a test with its questions and options
+    in three queries and compiles them into a snapshot.
+
+    :param UUID test_uuid: the UUID of an instance of "Test" ORM model
+    :return TestSnapshot/NoneType: a compiled test/None if the test does not exist
+    """
+    test = db.session.query(Test.id, Test.uuid, Test.title, Test.version) \
+        .filter_by(uuid=test_uuid).first()
+    if not test:
+        return None
+    options = {}
+    for option in db.session.query(Option.id, Option.text, Option.is_correct, Option.question_id) \
+            .join(Question).filter(Question.test_id == test.id).order_by(Option.id):
+        options.setdefault(option.question_id, []).append(
+            OptionSnapshot(option.id, option.text, option.is_correct)
+        )
+    questions = [QuestionSnapshot(question.id, question.order_number, question.text,
+                                  options.get(question.id, ()))
+                 for question in db.session.query(Question.id, Question.order_number, Question.text)
+                 .filter_by(test_id=test.id).order_by(Question.order_number, Question.id)]
+    return TestSnapshot(test.id, test.uuid, test.title, test.version, questions)
+
+
+class TestSnapshotCache:
+    """
+    A bounded LRU cache of compiled tests keyed by test UUID.
+    A cached snapshot is trusted for a short period of time;
+    afterwards its version stamp is compared to the "test.version" column,
+    so that edits made in another process are picked up as well.
+
+    Methods:
+        - init_app
+        - get
+        - invalidate
+        - invalidate_test
+        - invalidate_model
+    """
+
+    def __init__(self, max_size=256, revalidate_after=5):
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()  # str(uuid): [snapshot, time of the last version check]
+        self._lock = RLock()
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App
+        and empties the cache.
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        self.max_size = app.config.get("QUIZ_CACHE_SIZE", self.max_size)
+        self.revalidate_after = app.config.get("QUIZ_CACHE_REVALIDATE_SEC", self.revalidate_after)
+        self.invalidate()
+
+    def get(self, test_uuid):
+        """
+        Fetches a compiled test from the cache
+        compiling it on a miss or on a version change.
+
+        :param UUID test_uuid: the UUID of an instance of "Test" ORM model
+        :return TestSnapshot/NoneType: a compiled test/None if the test does not exist
+        """
+        key = str(test_uuid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+        if entry:
+            snapshot, checked_at = entry
+            if monotonic() - checked_at < self.revalidate_after:
+                return snapshot
+            version = db.session.query(Test.version).filter_by(id=snapshot.id).scalar()
+            if version == snapshot.version:
+                entry[1] = monotonic()
+                return snapshot
+        snapshot = compile_test(test_uuid)
+        with self._lock:
+            if snapshot:
+                self._entries[key] = [snapshot, monotonic()]
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.pop(key, None)
+        return snapshot
+
+    def invalidate(self, test_uuid=None):
+        """
+        Removes a compiled test from the cache
+        or empties the cache if no UUID is given.
+
+        :param UUID test_uuid: the UUID of an instance of "Test" ORM model
+        """
+        with self._lock:
+            if test_uuid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(test_uuid), None)
+
+    def invalidate_test(self, test_id):
+        """
+        Increments the version stamp of a test in the DB
+        (other processes revalidate their copies against it)
+        and removes the test from the local cache.
+
+        :param int test_id: the primary key of an instance of "Test" ORM model
+        """
+        if test_id is None:
+            return
+        db.session.query(Test).filter_by(id=test_id).update(
+            {Test.version: Test.version + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        with self._lock:
+            for key, (snapshot, _) in list(self._entries.items()):
+                if snapshot.id == test_id:
+                    del self._entries[key]
+
+    def invalidate_model(self, model):
+        """
+        Invalidates the test a "Test", "Question" or "Option"
+        ORM instance belongs to. Other instances are ignored.
+
+        :param SQLAlchemy().Model model: an instance of an SQL ORM model
+        """
+        self.invalidate_test(resolve_test_id(model))
+
+
+def get_test(test_id):
+    """
+    Fetches a test for test pickers of forms by its primary key
+    (ids of chosen tests are validated without loading the whole "test" table).
+
+    :param int test_id: the primary key of an instance of "Test" ORM model
+    :return Row/NoneType: a row (id, uuid, title)/None if the test does not exist
+    """
+    if not test_id:
+        return None
+    return db.session.query(Test.id, Test.uuid, Test.title).filter_by(id=test_id).first()
+
+
+def search_tests(prefix, limit=10):
+    """
+    Finds tests for the typeahead of test pickers whose titles start with a prefix
+    (case-insensitive, by the "ix_test_title_lower" index); wildcards of the prefix are escaped.
+
+    :param str prefix: the beginning of a title
+    :param int limit: the maximal number of tests
+    :return list: rows (id, uuid, title) ordered by title
+    """
+    title = db.func.lower(Test.title)
+    return db.session.query(Test.id, Test.uuid, Test.title) \
+        .filter(title.startswith(prefix.strip().lower(), autoescape=True)) \
+        .order_by(title, Test.id).limit(limit).all()
+
+
+def resolve_test_id(model):
+    """
+    Finds the primary key of the test
+    a "Test", "Question" or "Option" ORM instance belongs to.
+
+    :param SQLAlchemy().Model model: an instance of an SQL ORM model
+    :return int/NoneType: the primary key of a test/None for other models
+    """
+    if isinstance(model, Test):
+        return model.id
+    if isinstance(model, Question):
+        return model.test_id
+    if isinstance(model, Option):
+        return db.session.query(Question.test_id).filter_by(id=model.question_id).scalar()
+    return None
+
+
+test_cache = TestSnapshotCache()  # pylint: disable=C0103
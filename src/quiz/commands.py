@@ -0,0 +1,133 @@
+"""
+The module registers CLI commands of the BP-registered application "quiz"
+(run as "flask quiz <command>").
+"""
+
+import click
+#
+from src import db
+from src.quiz import bp
+from src.quiz.analysis import analyse_test, reset_test_stats
+from src.quiz.cache import test_cache
+from src.quiz.grading import grade_sheet, rescore_results
+from src.quiz.models import LeaderboardEntry, Question, Result, ScoreBin, Test
+from src.quiz.summaries import find_test_id, rebuild_summary
+
+
+@bp.cli.command("check-counts")
+@click.option("--fix", is_flag=True, help="Overwrite wrong counters with actual values.")
+def check_counts(fix):
+    """
+    Compares the stored number of questions of every test
+    with the actual number of its questions.
+    """
+    actual = db.select(db.func.count(Question.id)).where(Question.test_id == Test.id) \
+        .scalar_subquery().label("actual")
+    mismatches = db.session.query(Test.id, Test.title, Test.num_questions, actual) \
+        .filter(Test.num_questions != actual).order_by(Test.id).all()
+    for test_id, title, stored, counted in mismatches:
+        click.echo(f"Test(id: #{test_id}, {title}): stored {stored}, actual {counted}")
+    if not mismatches:
+        click.echo("All question counters are consistent.")
+    elif fix:
+        Test.recount_questions([test_id for test_id, *_ in mismatches])
+        db.session.commit()
+        test_cache.invalidate()
+        click.echo(f"{len(mismatches)} counter(s) fixed.")
+    else:
+        raise click.exceptions.Exit(1)  # non-zero status for cron and CI checks
+
+
+@bp.cli.command("grade-batch")
+@click.argument("test_uuid", type=click.UUID)
+@click.argument("sheet", type=click.File(encoding="utf-8-sig"))
+@click.option("--chunk-size", default=1000, show_default=True,
+              help="The number of results per INSERT statement.")
+def grade_batch(test_uuid, sheet, chunk_size):
+    """
+    Grades a CSV answer sheet of a paper or offline test
+    and records finished results of its students.
+    """
+    test = test_cache.get(test_uuid)
+    if not test:
+        raise click.ClickException(f"Test {test_uuid} does not exist")
+    try:
+        report = grade_sheet(test, sheet, chunk_size,
+                             progress=lambda done, total: click.echo(f"{done}/{total} results recorded"))
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    for username in report.unknown_users:
+        click.echo(f"Unknown user skipped: {username}", err=True)
+    click.echo(f"{report.num_graded} result(s) recorded, {report.num_invalid} invalid answer(s), "
+               f"mean score {report.mean_correct:.2f} out of {test.num_questions}.")
+
+
+@bp.cli.command("rescore")
+@click.argument("test_uuid", type=click.UUID)
+@click.option("--batch-size", default=1000, show_default=True,
+              help="The number of results per UPDATE statement.")
+def rescore(test_uuid, batch_size):
+    """
+    Recomputes scores of all results of a test from their answer logs
+    (e.g. after a fix of the answer key).
+    """
+    test_cache.invalidate(test_uuid)  # the answer key may have been fixed by another process
+    test = test_cache.get(test_uuid)
+    if not test:
+        raise click.ClickException(f"Test {test_uuid} does not exist")
+    num_rescored, num_skipped = rescore_results(
+        test, batch_size, progress=lambda done: click.echo(f"{done} results rescored")
+    )
+    click.echo(f"{num_rescored} result(s) rescored, {num_skipped} result(s) without "
+               f"a complete answer log skipped.")
+    LeaderboardEntry.rebuild(test.id)
+    ScoreBin.rebuild(test.id)
+    db.session.commit()
+    reset_test_stats(test.id)  # item statistics depend on total scores
+    click.echo('Item statistics of the test are reset: run "flask quiz item-stats".')
+
+
+@bp.cli.command("item-stats")
+@click.option("--test", "test_uuid", type=click.UUID, help="Analyse a single test.")
+@click.option("--full", is_flag=True, help="Recalculate statistics from scratch.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="The number of results per batch.")
+def item_stats(test_uuid, full, batch_size):
+    """
+    Adds results finished since the previous run to item statistics
+    (difficulty, discrimination, option distribution) of questions.
+    Intended to be run periodically (e.g. by cron).
+    """
+    query = db.session.query(Test.id, Test.uuid)
+    if test_uuid:
+        query = query.filter(Test.uuid == test_uuid)
+    elif not full:  # tests with new finished results only
+        query = query.filter(Test.results.any(db.and_(Result.state == Result.State.FINISHED,
+                                                      Result.is_analysed.is_(False))))
+    for test_id, uuid in query.order_by(Test.id).all():
+        if full:
+            reset_test_stats(test_id)
+        test = test_cache.get(uuid)
+        num_counted, num_skipped = analyse_test(test, batch_size)
+        click.echo(f"Test(id: #{test_id}, {test.title}): {num_counted} result(s) analysed, "
+                   f"{num_skipped} result(s) without a complete answer log skipped")
+
+
+@bp.cli.command("rebuild-leaderboards")
+@click.option("--test", "test_uuid", type=click.UUID, help="Rebuild a single test.")
+@click.option("--check", is_flag=True, help="Report differences without writing them.")
+def rebuild_leaderboards(test_uuid, check):
+    """
+    Reconstructs leaderboards of tests from finished results.
+    """
+    rebuild_summary(LeaderboardEntry, find_test_id(test_uuid), check)
+
+
+@bp.cli.command("rebuild-histograms")
+@click.option("--test", "test_uuid", type=click.UUID, help="Rebuild a single test.")
+@click.option("--check", is_flag=True, help="Report differences without writing them.")
+def rebuild_histograms(test_uuid, check):
+    """
+    Reconstructs histograms of scores of tests from finished results.
+    """
+    rebuild_summary(ScoreBin, find_test_id(test_uuid), check)
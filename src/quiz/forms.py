@@ -6,14 +6,89 @@ in the process of updating of the "Result" ORM instance
 """
 
 from flask_wtf import FlaskForm
-from wtforms import RadioField, SubmitField
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import HiddenField, IntegerField, RadioField, SelectField, SubmitField
+from wtforms.validators import InputRequired, NumberRange
 
 
 class OptionMultiForm(FlaskForm):
     """
     A class which renders a form for "Option" display.
 
-    Fields: options(RadioMultiField)
+    Fields: options(RadioMultiField): pairs of option id and option text,
+            question number(hidden): the order number of the answered question
     """
-    options = RadioField("Option", choices=[])
+    options = RadioField("Option", choices=[], coerce=int)
+    question_number = HiddenField()  # detects repeated submissions of the same question
     submit = SubmitField('Submit')
+
+
+class OptionTokenForm(OptionMultiForm):
+    """
+    A class which renders a form for "Option" display
+    carrying the progress of a test in a signed token.
+
+    Fields: options(RadioMultiField), question number(hidden), progress(hidden): a signed token,
+            save: a button which saves the progress
+    """
+    progress = HiddenField()
+    save = SubmitField('Save and exit')
+
+
+class QuizSheetForm(FlaskForm):
+    """
+    A class which renders a form with all remaining questions
+    of a test on a single page (an answer sheet).
+
+    Fields: question_<id>(RadioMultiField) for each question: pairs of option id and option text,
+            question number(hidden): the order number of the first question on the sheet
+    Methods:
+        - for_questions
+        - get_answers
+    """
+    question_number = HiddenField()  # detects repeated submissions of the same sheet
+    submit = SubmitField('Submit all answers')
+
+    @classmethod
+    def for_questions(cls, questions):
+        """
+        Creates a form with a radio field for every question.
+
+        :param list questions: compiled questions (QuestionSnapshot) of a test
+        :return QuizSheetForm: an instance of the form
+        """
+        class SheetForm(cls):  # fields must be declared on a class, not an instance
+            """
+            An answer sheet for particular questions.
+            """
+        for question in questions:
+            setattr(SheetForm, f"question_{question.id}",
+                    RadioField(question.text,
+                               choices=[(option.id, option.text) for option in question.options],
+                               coerce=int,
+                               validators=[InputRequired(message="Pick an option")]))
+        return SheetForm()
+
+    def get_answers(self, questions):
+        """
+        Collects selected options.
+
+        :param list questions: compiled questions (QuestionSnapshot) of a test
+        :return dict: primary keys of selected options by primary keys of questions
+        """
+        return {question.id: self[f"question_{question.id}"].data for question in questions}
+
+
+class AnswerSheetForm(FlaskForm):
+    """
+    A class which renders a form for the upload
+    of a CSV answer sheet of a paper or offline test.
+
+    Fields: test(select): the graded test, sheet(file), chunk size: results per INSERT statement
+    """
+    test = SelectField('Test', choices=[])
+    sheet = FileField('Answer sheet (CSV)',
+                      validators=[FileRequired(), FileAllowed(['csv'])])
+    chunk_size = IntegerField('Results per INSERT statement', default=1000,
+                              validators=[NumberRange(min=1)])
+    submit = SubmitField('Grade')
@@ -0,0 +1,300 @@
+"""
+This module implements bulk grading of answer sheets of
+paper and offline tests: a CSV sheet of students' answers is graded
+against the answer key of a compiled test with NumPy array operations
+and the finished results are inserted in chunks.
+It also decodes answer logs of results ("result.answers": a byte
+per answered question in the order of questions) and logs of times to answer
+("result.answer_times": 2 bytes per answered question) into NumPy arrays
+and rescores results after a fix of the answer key.
+
+A sheet has a header "username,<order number>,<order number>,..."
+and a row per student. An answer is the position of the selected option
+of the question counted from 1 (or a letter counted from "A");
+an empty cell is an unanswered question.
+"""
+
+import csv
+from datetime import datetime
+from string import ascii_uppercase
+#
+import numpy as np
+#
+from src import db
+from src.auth.models import User
+from src.quiz.models import LeaderboardEntry, Result, ScoreBin
+
+_BLANK = 0
+_INVALID = -1
+
+
+class GradingReport:
+    """
+    A summary of a graded answer sheet.
+
+    Fields: number of inserted results, usernames of unknown users (their rows are skipped),
+            number of invalid answers (graded as incorrect), mean number of correct answers
+    """
+    __slots__ = ("num_graded", "unknown_users", "num_invalid", "mean_correct")
+
+    def __init__(self, num_graded, unknown_users, num_invalid, mean_correct):
+        self.num_graded = num_graded
+        self.unknown_users = unknown_users
+        self.num_invalid = num_invalid
+        self.mean_correct = mean_correct
+
+
+def _parse_cell(value):
+    """
+    Converts a cell of a sheet into the position of an option.
+
+    :param str value: the content of a cell
+    :return int: the position of an option (0 for a blank cell, -1 for an invalid one)
+    """
+    value = value.strip().upper()
+    if not value:
+        return _BLANK
+    if value.isdigit():
+        return int(value) or _INVALID
+    if len(value) == 1 and value in ascii_uppercase:
+        return ascii_uppercase.index(value) + 1
+    return _INVALID
+
+
+def read_sheet(stream):
+    """
+    Reads an answer sheet into a matrix of option positions.
+    Each distinct cell value is parsed once.
+
+    :param stream: a text stream of a CSV sheet
+    :return tuple: usernames, order numbers of questions (columns), answers (students x questions)
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header or header[0].strip().lower() != "username":
+        raise ValueError('The first column of the sheet must be "username"')
+    try:
+        order_numbers = [int(cell) for cell in header[1:]]
+    except ValueError:
+        raise ValueError("The header must contain order numbers of questions") from None
+    width = len(order_numbers)
+    usernames, rows = [], []
+    for row in reader:
+        if not row or not row[0].strip():
+            continue
+        usernames.append(row[0].strip())
+        rows.append((row[1:] + [""] * width)[:width])  # short rows are not answered to the end
+    cells = np.array(rows, dtype=str).reshape(len(rows), width)
+    values, inverse = np.unique(cells, return_inverse=True)
+    codes = np.array([_parse_cell(value) for value in values], dtype=np.int16)
+    return usernames, order_numbers, codes[inverse].reshape(cells.shape)
+
+
+def build_answer_mask(test_snapshot, order_numbers):
+    """
+    Builds a matrix of correctness of options: a cell (column, position)
+    is True if the option at the position of the question in the column is correct.
+    Position 0 (an unanswered question) is never correct.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the graded test
+    :param list order_numbers: order numbers of questions of the sheet columns
+    :return numpy.ndarray: a boolean matrix (questions x (options + 1))
+    """
+    questions = [test_snapshot.get_question(order_number) for order_number in order_numbers]
+    unknown = [number for number, question in zip(order_numbers, questions) if not question]
+    if unknown:
+        raise ValueError(f"The test has no questions with order numbers {unknown}")
+    width = max((len(question.options) for question in questions), default=0) + 1
+    mask = np.zeros((len(questions), width), dtype=bool)
+    for column, question in enumerate(questions):
+        mask[column, 1:len(question.options) + 1] = [option.is_correct
+                                                     for option in question.options]
+    return mask
+
+
+def grade_answers(answer_mask, answers):
+    """
+    Grades a matrix of answers against the answer mask.
+
+    :param numpy.ndarray answer_mask: a matrix built with "build_answer_mask"
+    :param numpy.ndarray answers: option positions (students x questions)
+    :return tuple: numbers of correct answers per student, number of invalid answers
+    """
+    invalid = (answers < 0) | (answers >= answer_mask.shape[1])
+    positions = np.where(invalid, _BLANK, answers)
+    graded = answer_mask[np.arange(answer_mask.shape[0]), positions]  # students x questions
+    return graded.sum(axis=1), int(invalid.sum())
+
+
+def pack_answers(test_snapshot, order_numbers, answers):
+    """
+    Arranges the answers of a sheet in the order of questions of the test
+    for answer logs. Unanswered, absent and invalid answers are logged as 0.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the graded test
+    :param list order_numbers: order numbers of questions of the sheet columns
+    :param numpy.ndarray answers: option positions (students x sheet columns)
+    :return numpy.ndarray: option positions (students x questions of the test) of unsigned bytes
+    """
+    columns = {question.order_number: column
+               for column, question in enumerate(test_snapshot.questions)}
+    packed = np.zeros((len(answers), test_snapshot.num_questions), dtype=np.uint8)
+    packed[:, [columns[number] for number in order_numbers]] = \
+        np.where((answers < 0) | (answers > 0xFF), _BLANK, answers)
+    return packed
+
+
+def unpack_answers(answer_logs, num_questions):
+    """
+    Decodes answer logs of results into a matrix.
+    Logs shorter than the number of questions are padded with 0 (unanswered),
+    longer ones are truncated.
+
+    :param list answer_logs: "answers" values of results
+    :param int num_questions: the number of questions (columns)
+    :return numpy.ndarray: option positions (results x questions) of unsigned bytes
+    """
+    if all(len(log or b"") == num_questions for log in answer_logs):  # finished results
+        return np.frombuffer(b"".join(answer_logs), dtype=np.uint8) \
+            .reshape(len(answer_logs), num_questions).copy()
+    matrix = np.zeros((len(answer_logs), num_questions), dtype=np.uint8)
+    for row, log in enumerate(answer_logs):
+        positions = np.frombuffer(log or b"", dtype=np.uint8)[:num_questions]
+        matrix[row, :len(positions)] = positions
+    return matrix
+
+
+def unpack_answer_times(time_logs, num_questions):
+    """
+    Decodes logs of times to answer of results into a matrix.
+    Logs shorter than the number of questions are padded with 0 (unknown),
+    longer ones are truncated.
+
+    :param list time_logs: "answer_times" values of results
+    :param int num_questions: the number of questions (columns)
+    :return numpy.ndarray: seconds (results x questions) of unsigned 16-bit integers
+    """
+    matrix = np.zeros((len(time_logs), num_questions), dtype=np.uint16)
+    for row, log in enumerate(time_logs):
+        log = (log or b"")[:num_questions * 2]
+        seconds = np.frombuffer(log[:len(log) // 2 * 2], dtype="<u2")
+        matrix[row, :len(seconds)] = seconds
+    return matrix
+
+
+def insert_results(test_snapshot, user_ids, num_correct, packed_answers,
+                   chunk_size=1000, progress=None):
+    """
+    Inserts finished results with multi-row INSERT statements
+    of at most "chunk_size" rows in a single transaction
+    and updates the leaderboard and the histogram of scores of the test.
+    Questions absent from the sheet are counted as incorrect answers.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the graded test
+    :param numpy.ndarray user_ids: primary keys of users
+    :param numpy.ndarray num_correct: numbers of correct answers of the users
+    :param numpy.ndarray packed_answers: answer logs built with "pack_answers"
+    :param int chunk_size: the number of rows per statement
+    :param callable progress: called with numbers of inserted and of all rows after each chunk
+    """
+    total, finished_at = len(user_ids), datetime.utcnow()
+    for start in range(0, total, chunk_size):
+        stop = start + chunk_size
+        db.session.execute(Result.__table__.insert(), [
+            {"user_id": user_id, "test_id": test_snapshot.id, "state": Result.State.FINISHED,
+             "last_question": test_snapshot.num_questions, "num_correct_answers": correct,
+             "num_incorrect_answers": test_snapshot.num_questions - correct,
+             "answers": log.tobytes(), "finished_at": finished_at}
+            for user_id, correct, log in zip(user_ids[start:stop].tolist(),
+                                             num_correct[start:stop].tolist(),
+                                             packed_answers[start:stop])
+        ])
+        if progress:
+            progress(min(start + chunk_size, total), total)
+    unique_user_ids = np.unique(user_ids).tolist()
+    for start in range(0, len(unique_user_ids), chunk_size):
+        LeaderboardEntry.rebuild(test_snapshot.id, unique_user_ids[start:start + chunk_size])
+    for score, amount in zip(*np.unique(num_correct, return_counts=True)):
+        ScoreBin.record(test_snapshot.id, int(score), int(amount))
+    db.session.commit()
+
+
+def grade_sheet(test_snapshot, stream, chunk_size=1000, progress=None):
+    """
+    Grades an answer sheet and records the results.
+    Raises ValueError if the sheet does not match the test.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the graded test
+    :param stream: a text stream of a CSV sheet
+    :param int chunk_size: the number of rows per INSERT statement
+    :param callable progress: called with numbers of inserted and of all rows after each chunk
+    :return GradingReport: a summary of the grading
+    """
+    usernames, order_numbers, answers = read_sheet(stream)
+    answer_mask = build_answer_mask(test_snapshot, order_numbers)
+    user_ids_by_name = dict(db.session.query(User.username, User.id)
+                            .filter(User.username.in_(list(set(usernames)))))
+    known = np.array([username in user_ids_by_name for username in usernames], dtype=bool)
+    user_ids = np.array([user_ids_by_name.get(username, 0) for username in usernames],
+                        dtype=np.int64)[known]
+    answers = answers[known]
+    num_correct, num_invalid = grade_answers(answer_mask, answers)
+    insert_results(test_snapshot, user_ids, num_correct,
+                   pack_answers(test_snapshot, order_numbers, answers), chunk_size, progress)
+    return GradingReport(
+        num_graded=len(user_ids),
+        unknown_users=[username for username, is_known in zip(usernames, known) if not is_known],
+        num_invalid=num_invalid,
+        mean_correct=float(num_correct.mean()) if len(num_correct) else 0.0,
+    )
+
+
+def rescore_results(test_snapshot, batch_size=1000, progress=None):
+    """
+    Recomputes numbers of correct and incorrect answers of results of a test
+    from their answer logs against the current answer key.
+    Results are read in batches by primary key and each batch is updated
+    with a single UPDATE statement and committed.
+    Results without a complete log (answered before the log was introduced) are skipped.
+
+    :param TestSnapshot test_snapshot: a compiled copy of the test
+    :param int batch_size: the number of results per batch
+    :param callable progress: called with the number of rescored results after each batch
+    :return tuple: numbers of rescored and of skipped results
+    """
+    table = Result.__table__
+    answer_mask = build_answer_mask(test_snapshot, [question.order_number
+                                                    for question in test_snapshot.questions])
+    is_logged = db.and_(table.c.answers.isnot(None),
+                        db.func.length(table.c.answers) == table.c.last_question)
+    num_rescored, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.answers)
+            .where(table.c.test_id == test_snapshot.id, table.c.id > last_id, is_logged)
+            .order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        num_answered = [len(row.answers) for row in rows]
+        num_correct, _ = grade_answers(
+            answer_mask, unpack_answers([row.answers for row in rows], test_snapshot.num_questions)
+        )
+        num_correct = num_correct.tolist()
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+            num_correct_answers=db.case(dict(zip(ids, num_correct)), value=table.c.id),
+            num_incorrect_answers=db.case(
+                {pk: answered - correct
+                 for pk, answered, correct in zip(ids, num_answered, num_correct)},
+                value=table.c.id,
+            ),
+        ))
+        db.session.commit()
+        num_rescored += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(num_rescored)
+    num_skipped = db.session.query(db.func.count(table.c.id)) \
+        .filter(table.c.test_id == test_snapshot.id, db.not_(is_logged)).scalar()
+    return num_rescored, num_skipped
@@ -1,31 +1,42 @@
 """
 This module contains SQL ORM models for
-"Test", "Question", "Options", "Result" instances.
+"Test", "Question", "Options", "Result", "QuestionStats", "LeaderboardEntry",
+"ScoreBin" instances.
 """
 
+import struct
+from datetime import datetime
 from enum import Enum
+from math import ceil
 from uuid import uuid4
 #
-from flask import flash
+from flask import current_app, flash
 from flask_login import current_user
+from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm.attributes import set_committed_value
 #
 from src import db
+from src.auth.models import User
+from src.main.service import upsert
 
 
 class Test(db.Model):
     """
     An ORM class which represents SQL table "test".
 
-    Fields: id, uuid, title, description, level, image,
-            related questions, related results, related posts
+    Fields: id, uuid, title, description, level, image, version stamp,
+            number of questions, related questions, related results, related posts
 
     class Level: Enum-based levels of the test
 
     Methods:
         - get_num_questions
+        - recount_questions
         - get_best_result
         - get_last_result
+        - get_leaderboard
+        - get_percentile
     """
 
     class Level(Enum):
@@ -44,6 +55,8 @@ class Test(db.Model):
     description = db.Column(db.Text())
     level = db.Column(db.Enum(Level), default=Level.BASIC, nullable=False)
     image = db.Column(db.String(20), default='default_test.png', nullable=False, unique=False)
+    version = db.Column(db.Integer, default=1, nullable=False)  # bumped on edits: see quiz.cache
+    num_questions = db.Column(db.Integer, default=0, nullable=False)  # maintained by Question events
     questions = db.relationship('Question', backref='test', cascade="all, delete-orphan",
                                 lazy=True, passive_deletes=True)
     results = db.relationship('Result', backref='test', cascade="all, delete-orphan",
@@ -53,39 +66,85 @@ class Test(db.Model):
 
     def get_num_questions(self):
         """
-        Calculates the number of questions of the test
+        Returns the stored number of questions of the test
+        (no question rows are loaded).
 
         :return int: the number of questions
         """
-        return len(self.questions)
+        return self.num_questions or 0
 
-    def get_best_result(self):
+    @classmethod
+    def recount_questions(cls, test_ids=None):
+        """
+        Recalculates the stored number of questions with a single UPDATE statement.
+        Must be called after bulk inserts or deletions of questions
+        which bypass ORM events (e.g. "session.execute(insert(Question), rows)").
+
+        :param list test_ids: primary keys of tests to recount, all tests by default
+        """
+        query = cls.query
+        if test_ids is not None:
+            query = query.filter(cls.id.in_(test_ids))
+        query.update(
+            {cls.num_questions: db.select(db.func.count(Question.id))
+             .where(Question.test_id == cls.id).scalar_subquery()},
+            synchronize_session=False,
+        )
+
+    def get_best_result(self, user_id=None):
         """
         Fetches the best result of the currently logged user
-        for the current test.
+        (or of another user) for the current test.
 
+        :param int user_id: the primary key of a user, the current user by default
         :return int: the maximal number of correct answers
         """
-        user_specific_results = filter(lambda result: result.user_id == current_user.id,
-                                       self.results)
-        correct_answers = sorted(map(lambda result: result.num_correct_answers,
-                                     user_specific_results))
-        return max(correct_answers) if correct_answers else 0
+        user_id = user_id or getattr(current_user, "id", None)
+        if user_id is None:  # anonymous user
+            return 0
+        best_result = db.session.query(db.func.max(Result.num_correct_answers)).filter(
+            Result.user_id == user_id,
+            Result.test_id == self.id,
+        ).scalar()
+        return best_result or 0
+
+    def get_last_result(self, user_id=None):
+        """
+        Fetches the last unfinished result of the currently logged user
+        (or of another user) for the current test or an indicator of its absence.
+
+        :param int user_id: the primary key of a user, the current user by default
+        :return Result/bool: the last result of the user/False flag
+        """
+        user_id = user_id or getattr(current_user, "id", None)
+        if user_id is None:  # anonymous user
+            return False
+        unfinished_result = Result.query.filter_by(
+            user_id=user_id,
+            test_id=self.id,
+            state=Result.State.NEW,
+        ).order_by(Result.id.desc()).first()
+        return unfinished_result or False
+
+    def get_leaderboard(self, limit=None):
+        """
+        Fetches the top of users by their best results for the current test
+        (ties are broken by the time of completion).
 
-    def get_last_result(self):
+        :param int limit: the number of places, "QUIZ_LEADERBOARD_SIZE" by default
+        :return list: rows of username, best score and time of completion
         """
-        Fetches the last result of the currently logged user
-        for the current test or an indicator of its absence.
+        return LeaderboardEntry.get_top(self.id, limit or current_app.config['QUIZ_LEADERBOARD_SIZE'])
 
-        :return Result/bool: the last result of the current user/False flag
+    def get_percentile(self, score):
         """
-        user_specific_results = filter(lambda result: result.user_id == current_user.id,
-                                       self.results)
-        unfinished_results = list(filter(lambda result: result.state == Result.State.NEW,
-                                         user_specific_results))
-        if unfinished_results:
-            return unfinished_results[-1]
-        return False
+        Computes the share of finished results of the test
+        which are lower than a score (from the histogram of scores).
+
+        :param int score: a number of correct answers
+        :return float/NoneType: the percentage/None if no result is finished
+        """
+        return ScoreBin.get_percentile(self.id, score)
 
     def __repr__(self):
         """
@@ -96,11 +155,16 @@ class Test(db.Model):
         return f"Test(id: #{self.id}, {self.title})"
 
 
+# prefix search of titles by test pickers ("quiz.cache.search_tests")
+db.Index("ix_test_title_lower", db.func.lower(Test.title).label("title_lower"),
+         postgresql_ops={"title_lower": "text_pattern_ops"})
+
+
 class Question(db.Model):
     """
     An ORM class which represents SQL table "question".
 
-    Fields: id, order number, text, related test, related options
+    Fields: id, order number, text, related test, related options, related statistics
     """
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.SmallInteger)
@@ -108,6 +172,8 @@ class Question(db.Model):
     test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), nullable=False)
     options = db.relationship('Option', backref='question', cascade="all, delete-orphan",
                               lazy=True, passive_deletes=True)
+    stats = db.relationship('QuestionStats', backref='question', cascade="all, delete-orphan",
+                            lazy=True, passive_deletes=True, uselist=False)
 
     def __repr__(self):
         """
@@ -118,6 +184,49 @@ class Question(db.Model):
         return f'Question({self.test.title}: №{self.order_number})'
 
 
+def _shift_num_questions(connection, test_id, delta):
+    """
+    Shifts the stored number of questions of a test
+    within the transaction of the current flush.
+
+    :param sqlalchemy.engine.Connection connection: the connection of the flush
+    :param int test_id: the primary key of a test
+    :param int delta: the number of added (positive) or removed (negative) questions
+    """
+    connection.execute(
+        Test.__table__.update()
+        .where(Test.__table__.c.id == test_id)
+        .values(num_questions=Test.__table__.c.num_questions + delta)
+    )
+
+
+@event.listens_for(Question, "after_insert")
+def question_inserted(mapper, connection, target):  # pylint: disable=W0613
+    """
+    Increments the number of questions of the related test.
+    """
+    _shift_num_questions(connection, target.test_id, 1)
+
+
+@event.listens_for(Question, "after_delete")
+def question_deleted(mapper, connection, target):  # pylint: disable=W0613
+    """
+    Decrements the number of questions of the related test.
+    """
+    _shift_num_questions(connection, target.test_id, -1)
+
+
+@event.listens_for(Question, "after_update")
+def question_updated(mapper, connection, target):  # pylint: disable=W0613
+    """
+    Moves a question between counters if it is reassigned to another test.
+    """
+    history = db.inspect(target).attrs.test_id.history
+    if history.deleted and history.added:
+        _shift_num_questions(connection, history.deleted[0], -1)
+        _shift_num_questions(connection, history.added[0], 1)
+
+
 class Option(db.Model):
     """
     An ORM class which represents SQL table "option".
@@ -146,7 +255,13 @@ class Result(db.Model):
     An ORM class which represents SQL table "result".
 
     Fields: id, uuid, state, text, last answered question, number of correct answers,
-    number of incorrect answers, related user, related test
+    number of incorrect answers, answer log, log of times to answer, time of the last answer,
+    flag of item analysis, time of completion, related user, related test
+
+    Methods:
+        - record_progress
+        - update_result
+        - update_result_batch
     """
 
     class State(Enum):
@@ -157,28 +272,364 @@ class Result(db.Model):
         NEW = "Unfinished"
         FINISHED = "Finished"
 
+    __table_args__ = (
+        db.Index("ix_result_user_id_test_id_state", "user_id", "test_id", "state"),  # user's results
+        db.Index("ix_result_test_id_is_analysed", "test_id", "is_analysed"),  # see quiz.analysis
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(UUID(as_uuid=True), default=uuid4, index=True, unique=True)
     state = db.Column(db.Enum(State), default=State.NEW, nullable=False)
     last_question = db.Column(db.SmallInteger, default=0)
     num_correct_answers = db.Column(db.SmallInteger, default=0)
     num_incorrect_answers = db.Column(db.SmallInteger, default=0)
+    # positions of selected options (a byte per answered question, 0 if unknown), see quiz.grading
+    answers = db.Column(db.LargeBinary, default=b"")  # NULL: answered before the log was introduced
+    # seconds spent on answered questions (2 bytes per question, 0 if unknown), see quiz.grading
+    answer_times = db.Column(db.LargeBinary, default=b"")  # NULL: answered before times were logged
+    answered_at = db.Column(db.DateTime, default=datetime.utcnow)  # the last answer (or the start)
+    is_analysed = db.Column(db.Boolean, default=False, nullable=False)  # counted in QuestionStats
+    finished_at = db.Column(db.DateTime)  # NULL: finished before the time was recorded
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete="CASCADE"), nullable=False)
     test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), nullable=False)
 
-    def update_result(self, model_option):
+    def record_progress(self, num_correct, num_incorrect, test_snapshot, positions=(),
+                        seconds=None):
+        """
+        Records answers to the next questions of the test
+        with a single conditional UPDATE statement which applies only
+        if no other answer has been recorded since the result was loaded
+        (optimistic concurrency: double clicks and parallel tabs are not double-counted).
+
+        :param int num_correct: the number of new correct answers
+        :param int num_incorrect: the number of new incorrect answers
+        :param TestSnapshot test_snapshot: a compiled copy of the related test
+        :param list positions: positions of selected options to append to the answer log
+        :param list seconds: times spent on the answers to append to the log of times
+                             (unknown by default)
+        :return bool: an indicator that the answers have been recorded
+        """
+        table = self.__table__
+        now = datetime.utcnow()
+        packed = bytes(position if position <= 0xFF else 0 for position in positions)
+        packed_times = _pack_seconds(seconds or [None] * len(positions))
+        last_question = table.c.last_question + num_correct + num_incorrect
+        is_finished = last_question >= test_snapshot.num_questions
+        statement = table.update().where(
+            table.c.id == self.id,
+            table.c.last_question == self.last_question,  # the expected progress
+            table.c.state == self.State.NEW,
+        ).values(
+            num_correct_answers=table.c.num_correct_answers + num_correct,
+            num_incorrect_answers=table.c.num_incorrect_answers + num_incorrect,
+            last_question=last_question,
+            # the cast keeps a blob in SQLite which concatenates blobs as text
+            answers=db.cast(table.c.answers.concat(packed), db.LargeBinary),
+            answer_times=db.cast(table.c.answer_times.concat(packed_times), db.LargeBinary),
+            answered_at=now,
+            state=db.case(
+                (is_finished, db.literal(self.State.FINISHED, table.c.state.type)),
+                else_=table.c.state,
+            ),
+            finished_at=db.case(
+                (is_finished, db.literal(now, table.c.finished_at.type)),
+                else_=table.c.finished_at,
+            ),
+        )
+        progress_columns = (table.c.state, table.c.last_question, table.c.num_correct_answers,
+                            table.c.num_incorrect_answers, table.c.finished_at,
+                            table.c.answered_at)
+        if db.engine.dialect.full_returning:  # PgSQL: a single round trip
+            progress = db.session.execute(statement.returning(*progress_columns)).first()
+        else:
+            is_updated = db.session.execute(statement).rowcount == 1
+            progress = db.session.execute(
+                db.select(*progress_columns).where(table.c.id == self.id)
+            ).first() if is_updated else None
+        if progress and progress.state == self.State.FINISHED:  # within the same transaction
+            LeaderboardEntry.record(self.test_id, self.user_id,
+                                    progress.num_correct_answers, progress.finished_at)
+            ScoreBin.record(self.test_id, progress.num_correct_answers)
+        db.session.commit()
+        if not progress:
+            return False
+        for column, value in zip(progress_columns, progress):
+            set_committed_value(self, column.key, value)  # no extra SELECT to read the progress
+        return True
+
+    def update_result(self, question_id, option_id, test_snapshot):
         """
         Updates fields of the result as test completion proceeds.
 
-        :param Option model_option: a selected by user option instance of a question
+        :param int question_id: the primary key of an answered question
+        :param int option_id: the primary key of a selected by user option
+        :param TestSnapshot test_snapshot: a compiled copy of the related test
+        :return bool: an indicator that the answer has been recorded
         """
-        if model_option.is_correct:
-            self.num_correct_answers += 1
+        is_correct = test_snapshot.is_correct(question_id, option_id)
+        seconds = (datetime.utcnow() - self.answered_at).total_seconds() \
+            if self.answered_at else None  # since the previous answer (or the start)
+        if not self.record_progress(int(is_correct), int(not is_correct), test_snapshot,
+                                    [test_snapshot.get_position(question_id, option_id)],
+                                    [seconds]):
+            return False
+        if is_correct:
             flash("Correct answer", category="info")
         else:
-            self.num_incorrect_answers += 1
             flash("Wrong answer", category="danger")
-        self.last_question += 1
-        if self.last_question == self.test.get_num_questions():
-            self.state = self.State.FINISHED
-        db.session.commit()
+        return True
+
+    def update_result_batch(self, answers, test_snapshot):
+        """
+        Grades answers to all remaining questions of the test in memory
+        and records them in a single transaction.
+
+        :param dict answers: primary keys of selected options by primary keys of questions
+        :param TestSnapshot test_snapshot: a compiled copy of the related test
+        :return bool: an indicator that the answers have been recorded
+        """
+        num_correct = sum(test_snapshot.is_correct(question_id, option_id)
+                          for question_id, option_id in answers.items())
+        positions = [test_snapshot.get_position(question.id, answers[question.id])
+                     for question in test_snapshot.questions if question.id in answers]
+        if not self.record_progress(num_correct, len(answers) - num_correct, test_snapshot,
+                                    positions):
+            return False
+        flash(f"Correct answers: {num_correct} out of {len(answers)}", category="info")
+        return True
+
+
+class QuestionStats(db.Model):
+    """
+    An ORM class which represents SQL table "question_stats":
+    item analysis of a question over finished results (see quiz.analysis).
+    Sums are kept so that new results are added without a full recalculation.
+
+    Fields: related question, number of responses, number of correct responses,
+            sum of total scores, sum of squared total scores,
+            sum of total scores of correct responses, numbers of selections of options
+            by position (0: unknown option), number of timed responses,
+            sum of times to answer (seconds), proportion correct (difficulty),
+            point-biserial correlation with the total score (discrimination),
+            average time to answer (seconds)
+    """
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete="CASCADE"),
+                            primary_key=True)
+    num_responses = db.Column(db.Integer, default=0, nullable=False)
+    num_correct = db.Column(db.Integer, default=0, nullable=False)
+    sum_scores = db.Column(db.BigInteger, default=0, nullable=False)
+    sum_scores_sq = db.Column(db.BigInteger, default=0, nullable=False)
+    sum_scores_correct = db.Column(db.BigInteger, default=0, nullable=False)
+    option_counts = db.Column(db.JSON, default=list, nullable=False)
+    num_timed = db.Column(db.Integer, default=0, nullable=False, server_default="0")
+    sum_answer_time = db.Column(db.BigInteger, default=0, nullable=False, server_default="0")
+    difficulty = db.Column(db.Float)
+    discrimination = db.Column(db.Float)  # NULL if undefined (no variance)
+    mean_answer_time = db.Column(db.Float)  # NULL if no response is timed
+
+    def __repr__(self):
+        """
+        Readable representation of an instance.
+
+        :return str: the id of the related question, its difficulty and discrimination
+        """
+        return f'QuestionStats(question id:{self.question_id}, ' \
+               f'p={self.difficulty}, r={self.discrimination})'
+
+
+def _pack_seconds(seconds):
+    """
+    Encodes times spent on answers for the log of times of a result:
+    2 bytes (little-endian) per answer, whole seconds rounded up
+    to the range 1-65535, 0 if unknown.
+
+    :param list seconds: times spent on answers, seconds (None if unknown)
+    :return bytes: a fragment of the log
+    """
+    values = [0 if value is None else min(max(ceil(value), 1), 0xFFFF) for value in seconds]
+    return struct.pack(f"<{len(values)}H", *values)
+
+
+class LeaderboardEntry(db.Model):
+    """
+    An ORM class which represents SQL table "leaderboard_entry":
+    the best finished result of a user for a test.
+    Entries are maintained as results are finished (see "Result.record_progress")
+    and may be rebuilt from the "result" table.
+
+    Fields: related test, related user, best score, time of completion of the best result
+
+    Methods:
+        - record
+        - rebuild
+        - get_top
+    """
+    __table_args__ = (
+        db.Index("ix_leaderboard_entry_test_id_best_score", "test_id", "best_score"),
+    )
+
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete="CASCADE"), primary_key=True)
+    best_score = db.Column(db.SmallInteger, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    @classmethod
+    def record(cls, test_id, user_id, score, finished_at):
+        """
+        Puts a finished result into the leaderboard with a single upsert
+        if it is better than the best result of the user (or if it is the first one).
+        The caller commits.
+
+        :param int test_id: the primary key of a test
+        :param int user_id: the primary key of a user
+        :param int score: the number of correct answers
+        :param datetime finished_at: the time of completion
+        """
+        table = cls.__table__
+        statement = upsert(table).values(test_id=test_id, user_id=user_id,
+                                          best_score=score, finished_at=finished_at)
+        excluded = statement.excluded
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.test_id, table.c.user_id],
+            set_={"best_score": excluded.best_score, "finished_at": excluded.finished_at},
+            where=db.or_(excluded.best_score > table.c.best_score,
+                         db.and_(excluded.best_score == table.c.best_score,
+                                 excluded.finished_at < table.c.finished_at)),
+        ))
+
+    @classmethod
+    def rebuild(cls, test_id=None, user_ids=None):
+        """
+        Recreates entries from finished results with two set-based statements.
+        The caller commits.
+
+        :param int test_id: the primary key of a test, all tests by default
+        :param list user_ids: primary keys of users, all users by default
+        """
+        table, results = cls.__table__, Result.__table__
+        place = db.func.row_number().over(
+            partition_by=(results.c.test_id, results.c.user_id),
+            order_by=(results.c.num_correct_answers.desc(), results.c.finished_at.asc().nulls_last(),
+                      results.c.id),
+        )
+        best = db.select(results.c.test_id, results.c.user_id,
+                         results.c.num_correct_answers.label("best_score"),
+                         results.c.finished_at, place.label("place")) \
+            .where(results.c.state == Result.State.FINISHED)
+        delete = table.delete()
+        if test_id is not None:
+            best = best.where(results.c.test_id == test_id)
+            delete = delete.where(table.c.test_id == test_id)
+        if user_ids is not None:
+            best = best.where(results.c.user_id.in_(user_ids))
+            delete = delete.where(table.c.user_id.in_(user_ids))
+        best = best.subquery()
+        db.session.execute(delete)
+        db.session.execute(table.insert().from_select(
+            ["test_id", "user_id", "best_score", "finished_at"],
+            db.select(best.c.test_id, best.c.user_id, best.c.best_score, best.c.finished_at)
+            .where(best.c.place == 1),
+        ))
+
+    @classmethod
+    def get_top(cls, test_id, limit):
+        """
+        Fetches the top of a test.
+
+        :param int test_id: the primary key of a test
+        :param int limit: the number of places
+        :return list: rows of username, best score and time of completion
+        """
+        return db.session.query(User.username, cls.best_score, cls.finished_at) \
+            .join(User, User.id == cls.user_id).filter(cls.test_id == test_id) \
+            .order_by(cls.best_score.desc(), cls.finished_at.asc().nulls_last(), cls.user_id) \
+            .limit(limit).all()
+
+    def __repr__(self):
+        """
+        Readable representation of an instance.
+
+        :return str: ids of the related test and user and the best score
+        """
+        return f'LeaderboardEntry(test id:{self.test_id}, user id:{self.user_id}, {self.best_score})'
+
+
+class ScoreBin(db.Model):
+    """
+    An ORM class which represents SQL table "score_bin":
+    a bin of the histogram of scores of finished results of a test
+    (at most one bin per possible score).
+    Bins are maintained as results are finished (see "Result.record_progress")
+    and may be rebuilt from the "result" table.
+
+    Fields: related test, score, number of results
+
+    Methods:
+        - record
+        - rebuild
+        - get_percentile
+    """
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id', ondelete="CASCADE"), primary_key=True)
+    score = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    num_results = db.Column(db.Integer, default=0, nullable=False)
+
+    @classmethod
+    def record(cls, test_id, score, amount=1):
+        """
+        Adds results to a bin with a single upsert.
+        The caller commits.
+
+        :param int test_id: the primary key of a test
+        :param int score: a number of correct answers
+        :param int amount: the number of results
+        """
+        table = cls.__table__
+        statement = upsert(table).values(test_id=test_id, score=score, num_results=amount)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.test_id, table.c.score],
+            set_={"num_results": table.c.num_results + statement.excluded.num_results},
+        ))
+
+    @classmethod
+    def rebuild(cls, test_id=None):
+        """
+        Recreates bins from finished results with two set-based statements.
+        The caller commits.
+
+        :param int test_id: the primary key of a test, all tests by default
+        """
+        table, results = cls.__table__, Result.__table__
+        bins = db.select(results.c.test_id, results.c.num_correct_answers,
+                         db.func.count(results.c.id)) \
+            .where(results.c.state == Result.State.FINISHED) \
+            .group_by(results.c.test_id, results.c.num_correct_answers)
+        delete = table.delete()
+        if test_id is not None:
+            bins = bins.where(results.c.test_id == test_id)
+            delete = delete.where(table.c.test_id == test_id)
+        db.session.execute(delete)
+        db.session.execute(table.insert().from_select(["test_id", "score", "num_results"], bins))
+
+    @classmethod
+    def get_percentile(cls, test_id, score):
+        """
+        Computes the share of finished results of a test lower than a score.
+
+        :param int test_id: the primary key of a test
+        :param int score: a number of correct answers
+        :return float/NoneType: the percentage/None if no result is finished
+        """
+        bins = db.session.query(cls.score, cls.num_results).filter_by(test_id=test_id).all()
+        total = sum(num_results for _, num_results in bins)
+        if not total:
+            return None
+        lower = sum(num_results for bin_score, num_results in bins if bin_score < score)
+        return lower * 100 / total
+
+    def __repr__(self):
+        """
+        Readable representation of an instance.
+
+        :return str: the id of the related test, the score and the number of results
+        """
+        return f'ScoreBin(test id:{self.test_id}, score:{self.score}, {self.num_results})'
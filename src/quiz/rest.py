@@ -0,0 +1,54 @@
+"""
+The module implements REST-friendly API
+for read-only access to leaderboards of "Test" ORM instances.
+"""
+
+from flask import abort, current_app
+from flask_restful import Resource, reqparse, marshal_with, fields
+from flask_login import current_user
+#
+from sqlalchemy.exc import DataError
+#
+from src.quiz.models import Test
+
+
+class LeaderboardAPI(Resource):
+    """
+    REST API class for the leaderboard of a test
+    (rows of the table "leaderboard_entry").
+
+    Fields:
+        - get_leaderboard: a request parser with args for GET method
+        - object_field: a hash table of object fields representable in API
+
+    methods: get
+    """
+    get_leaderboard = reqparse.RequestParser()
+    get_leaderboard.add_argument('limit', type=int, location='args',
+                                 help="the number of places (up to QUIZ_LEADERBOARD_SIZE)")
+
+    object_fields = {
+        "username": fields.String,
+        "best_score": fields.Integer,
+        "finished_at": fields.DateTime(dt_format="iso8601"),
+    }
+
+    @marshal_with(object_fields, envelope="leaderboard")
+    def get(self, test_uuid):
+        """
+        REST API GET method.
+
+        :param UUID test_uuid: UUID of a test
+        :return list: the top of users by their best results
+        """
+        if current_user.is_anonymous:
+            return abort(401, "Unauthorized. Log In")
+        try:
+            test = Test.query.filter_by(uuid=test_uuid).first()
+        except DataError:  # in case UUID is input in inept format
+            return abort(400, "Bad request. Inept UUID format")
+        if not test:
+            return abort(404, "A test with this UUID does not exist")
+        args = self.get_leaderboard.parse_args()
+        size = current_app.config['QUIZ_LEADERBOARD_SIZE']
+        return test.get_leaderboard(min(max(args["limit"] or size, 1), size))
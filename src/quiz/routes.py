@@ -4,13 +4,16 @@ of the BP-registered application "quiz"
 during client-server interaction through HTML templates.
 """
 
-from flask import current_app, redirect, render_template, request, url_for
+from flask import abort, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 #
 from src.main.service import session_create
 from src.quiz import bp
-from src.quiz.models import Result, Test, Question
-from src.quiz.forms import OptionMultiForm
+from src.quiz.cache import search_tests, test_cache
+from src.quiz.models import Result, Test
+from src.quiz.forms import OptionMultiForm, OptionTokenForm, QuizSheetForm
+from src.quiz.tokens import advance_progress, dump_progress, get_progress_positions, \
+    load_progress, progress_steps, start_progress
 
 
 @bp.route("/tests/")
@@ -27,6 +30,21 @@ def tests_list_page():
     return render_template("quiz/tests.html", tests=tests)
 
 
+@bp.route("/tests/typeahead")
+@login_required
+def test_typeahead():
+    """
+    The function suggests tests whose titles start with "q" argument
+    to test pickers of forms (a prefix search on an index of titles).
+
+    :return Response: a JSON list of tests (id, uuid, title)
+    """
+    tests = search_tests(request.args.get("q", ""),
+                         current_app.config['QUIZ_TYPEAHEAD_SIZE'])
+    return jsonify([{"id": test.id, "uuid": str(test.uuid), "title": test.title}
+                    for test in tests])
+
+
 @bp.route("/tests/<uuid:test_uuid>", methods=["GET", "POST"])
 @login_required
 def test_view_page(test_uuid):
@@ -36,8 +54,10 @@ def test_view_page(test_uuid):
     :param UUID test_uuid: the UUID of an instance of "Test" ORM model
     :return str: an HTML template for test details page
     """
+    from src.posts.models import FeedbackSummary  # cyclic import prevention
     test = Test.query.filter_by(uuid=test_uuid).first()
-    return render_template("quiz/test_details.html", test=test)
+    feedback = FeedbackSummary.query.get(test.id) if test else None  # no aggregation of posts
+    return render_template("quiz/test_details.html", test=test, feedback=feedback)
 
 
 @bp.route("/tests/<uuid:test_uuid>/results/", methods=["POST"])
@@ -45,16 +65,28 @@ def test_view_page(test_uuid):
 def result_create_view(test_uuid):
     """
     The function manages test result creation procedure.
+    The test is taken question by question (with the progress kept
+    in signed tokens if "QUIZ_STATELESS_PROGRESS" is set) or,
+    with the "mode=sheet" query parameter, on a single page.
 
     :param UUID test_uuid: the UUID of an instance of "Test" ORM model
     :return str: an HTML template for result update (test proceed) page
     """
+    test = test_cache.get(test_uuid)
+    if not test:
+        abort(404)
     result = Result(
         user_id=current_user.id,
-        test_id=Test.query.filter_by(uuid=test_uuid).first().id,
+        test_id=test.id,
     )
     session_create(result)
-    return redirect(url_for("quiz.result_update_question_view_page",
+    if request.args.get("mode") == "sheet":
+        view = "quiz.result_update_sheet_view_page"
+    elif current_app.config["QUIZ_STATELESS_PROGRESS"]:
+        view = "quiz.result_update_token_view_page"
+    else:
+        view = "quiz.result_update_question_view_page"
+    return redirect(url_for(view,
                             test_uuid=test_uuid,
                             result_uuid=result.uuid
                             )
@@ -71,32 +103,161 @@ def result_update_question_view_page(test_uuid, result_uuid):
     :param UUID result_uuid: the UUID of an instance of "Result" ORM model
     :return str: an HTML template for result update page/result view page
     """
-    result = Result.query.filter_by(uuid=result_uuid).first()
-    last_question = result.last_question
-    question = Question.query.filter_by(
-        test_id=Test.query.filter_by(uuid=test_uuid).first().id,
-        order_number=last_question + 1
-    ).first()
+    result = Result.query.filter_by(uuid=result_uuid).first_or_404()
+    test = test_cache.get(test_uuid)  # compiled questions and options: no queries on a cache hit
+    if not test or result.test_id != test.id:
+        abort(404)
+    if result.state == Result.State.FINISHED:  # e.g. the "Back" button after the last answer
+        return redirect(url_for("quiz.result_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    question = test.get_question(result.last_question + 1)
+    if not question:
+        abort(404)
     form = OptionMultiForm()
-    options = question.options
-    form.options.choices = [option.text for option in options]
-    if form.validate_on_submit():
-        answer = request.form.get('options')
-        model_option = list(filter(lambda option: option.text == answer, options))[0]
-        result = Result.query.filter_by(uuid=result_uuid).first()
-        result.update_result(model_option)
-        if result.state == Result.State.FINISHED:
+    form.options.choices = [(option.id, option.text) for option in question.options]
+    if form.is_submitted() and form.question_number.data != str(question.order_number):
+        flash("This answer has already been recorded", category="warning")  # e.g. a double click
+        return redirect(url_for("quiz.result_update_question_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    if form.validate_on_submit():  # the choice is validated against the ids of the question
+        if not result.update_result(question.id, form.options.data, test):  # a parallel answer won
+            flash("This answer has already been recorded", category="warning")
+        elif result.state == Result.State.FINISHED:
             return redirect(url_for("quiz.result_view_page",
                                     test_uuid=test_uuid,
                                     result_uuid=result_uuid)
                             )
+        return redirect(url_for("quiz.result_update_question_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid
+                                )
+                        )
+    form.question_number.data = question.order_number
+    return render_template("quiz/questions.html", form=form, question=question, test=test)
+
+
+@bp.route("/tests/<uuid:test_uuid>/results/<uuid:result_uuid>/progress", methods=["GET", "POST"])
+@login_required
+def result_update_token_view_page(test_uuid, result_uuid):
+    """
+    The function manages test proceeding (result update) procedure
+    keeping the progress in a signed token passed between requests in a hidden field
+    (the next question is the response to an answer: the token never appears in URLs):
+    the answers are written only when the test is finished or the progress is saved.
+
+    :param UUID test_uuid: the UUID of an instance of "Test" ORM model
+    :param UUID result_uuid: the UUID of an instance of "Result" ORM model
+    :return str: an HTML template for result update page/result view page/test details page
+    """
+    result = Result.query.filter_by(uuid=result_uuid).first_or_404()
+    test = test_cache.get(test_uuid)
+    if not test or result.test_id != test.id:
+        abort(404)
+    if result.state == Result.State.FINISHED:
+        return redirect(url_for("quiz.result_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    form = OptionTokenForm()
+    token = form.progress.data if form.is_submitted() else None
+    progress = load_progress(token, result) if token else start_progress(result)
+    if not progress:  # a forged, expired or replayed token
+        flash("The progress is outdated. The test continues from the last saved question",
+              category="danger")
+        return redirect(url_for("quiz.result_update_token_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    question = test.get_question(progress["q"] + 1)
+    if not question:
+        abort(404)
+    form.options.choices = [(option.id, option.text) for option in question.options]
+    if form.is_submitted() and form.save.data:
+        if progress["q"] == result.last_question or \
+                result.record_progress(progress["c"], progress["i"], test,
+                                       get_progress_positions(progress, test), progress["t"]):
+            flash("Your progress has been saved", category="info")
         else:
-            return redirect(url_for("quiz.result_update_question_view_page",
+            flash("This progress has already been recorded", category="warning")
+        return redirect(url_for("quiz.test_view_page", test_uuid=test_uuid))
+    if form.validate_on_submit():
+        if not progress_steps.claim(result.id, progress["b"], progress["s"]):  # a parallel answer
+            flash("This answer has already been recorded", category="warning")
+            return redirect(url_for("quiz.result_update_token_view_page",
                                     test_uuid=test_uuid,
-                                    result_uuid=result.uuid
-                                    )
+                                    result_uuid=result_uuid)
+                            )
+        progress = advance_progress(progress, form.options.data,
+                                    test.is_correct(question.id, form.options.data))
+        if progress["q"] >= test.num_questions:  # answers are not written until the end
+            if not result.record_progress(progress["c"], progress["i"], test,
+                                          get_progress_positions(progress, test),
+                                          progress["t"]):
+                flash("This progress has already been recorded", category="warning")
+                return redirect(url_for("quiz.test_view_page", test_uuid=test_uuid))
+            flash(f"Correct answers: {result.num_correct_answers} out of {test.num_questions}",
+                  category="info")
+            return redirect(url_for("quiz.result_view_page",
+                                    test_uuid=test_uuid,
+                                    result_uuid=result_uuid)
+                            )
+        token, question = dump_progress(progress), test.get_question(progress["q"] + 1)
+        form = OptionTokenForm(formdata=None)  # the next question
+        form.options.choices = [(option.id, option.text) for option in question.options]
+    form.progress.data = token or dump_progress(progress)
+    form.question_number.data = question.order_number
+    return render_template("quiz/questions.html", form=form, question=question, test=test)
+
+
+@bp.route("/tests/<uuid:test_uuid>/results/<uuid:result_uuid>/sheet", methods=["GET", "POST"])
+@login_required
+def result_update_sheet_view_page(test_uuid, result_uuid):
+    """
+    The function manages test proceeding (result update) procedure
+    with all remaining questions on a single page
+    graded and recorded in a single transaction.
+
+    :param UUID test_uuid: the UUID of an instance of "Test" ORM model
+    :param UUID result_uuid: the UUID of an instance of "Result" ORM model
+    :return str: an HTML template for answer sheet page/result view page
+    """
+    result = Result.query.filter_by(uuid=result_uuid).first_or_404()
+    test = test_cache.get(test_uuid)
+    if not test or result.test_id != test.id:
+        abort(404)
+    if result.state == Result.State.FINISHED:
+        return redirect(url_for("quiz.result_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    questions = [question for question in test.questions
+                 if question.order_number > result.last_question]  # resumes an unfinished test
+    if not questions:
+        abort(404)
+    form = QuizSheetForm.for_questions(questions)
+    if form.is_submitted() and form.question_number.data != str(questions[0].order_number):
+        flash("These answers have already been recorded", category="warning")
+        return redirect(url_for("quiz.result_update_sheet_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    if form.validate_on_submit():
+        if not result.update_result_batch(form.get_answers(questions), test):  # a parallel answer won
+            flash("These answers have already been recorded", category="warning")
+            return redirect(url_for("quiz.result_update_sheet_view_page",
+                                    test_uuid=test_uuid,
+                                    result_uuid=result_uuid)
                             )
-    return render_template("quiz/questions.html", form=form, question=question)
+        return redirect(url_for("quiz.result_view_page",
+                                test_uuid=test_uuid,
+                                result_uuid=result_uuid)
+                        )
+    form.question_number.data = questions[0].order_number
+    return render_template("quiz/sheet.html", form=form, questions=questions, test=test)
 
 
 @bp.route("/tests/<uuid:test_uuid>/results/<uuid:result_uuid>/details")
@@ -0,0 +1,49 @@
+"""
+The module implements helpers of CLI commands which rebuild summary tables
+of tests ("flask quiz rebuild-leaderboards", "flask posts rebuild-feedback"...).
+"""
+
+import click
+#
+from src import db
+from src.quiz.models import Test
+
+
+def find_test_id(test_uuid):
+    """
+    Finds the primary key of a test given to a command.
+
+    :param UUID test_uuid: the UUID of an instance of "Test" ORM model or None
+    :return int/NoneType: the primary key of the test/None if no UUID is given
+    """
+    if not test_uuid:
+        return None
+    test_id = db.session.query(Test.id).filter_by(uuid=test_uuid).scalar()
+    if test_id is None:
+        raise click.ClickException(f"Test {test_uuid} does not exist")
+    return test_id
+
+
+def rebuild_summary(model, test_id, check):
+    """
+    Rebuilds a summary table of tests ("LeaderboardEntry", "ScoreBin",
+    "posts.models.FeedbackSummary") from its source table and reports the number of rows which differed.
+
+    :param type model: the ORM model of the summary table
+    :param int test_id: the primary key of a test, all tests if None
+    :param bool check: report differences without writing them
+    """
+    query = db.session.query(*model.__table__.columns)
+    if test_id is not None:
+        query = query.filter(model.test_id == test_id)
+    stored = set(map(repr, query.all()))  # JSON columns (lists) are not hashable
+    model.rebuild(test_id)
+    differences = len(stored ^ set(map(repr, query.all())))
+    if check:
+        db.session.rollback()
+        click.echo(f"{differences} inconsistent row(s) of {model.__tablename__}.")
+        if differences:
+            raise click.exceptions.Exit(1)  # non-zero status for cron and CI checks
+        return
+    db.session.commit()
+    click.echo(f"{model.__tablename__} rebuilt, {differences} row(s) changed.")
@@ -0,0 +1,199 @@
+"""
+This module implements signed progress tokens for taking a test
+without writing to the DB on every answer: the progress travels
+between requests in a token and the answers are written to the "Result" row
+only when the test is finished or the progress is explicitly saved.
+Every token carries the step of the result it has been issued for:
+an accepted answer increments the step in a table shared by the worker processes
+of a node (see "ProgressSteps"), so every token is accepted once
+and no answer is written to the DB before the progress is.
+"""
+
+import struct
+from datetime import timezone
+from time import time
+#
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+#
+from src.main.mapped import MappedTable
+
+_SALT = "quiz-progress"  # separates these tokens from other signed data of the app
+_SLOT = struct.Struct("<QII")  # result id, base (persisted progress), step
+
+
+class ProgressSteps:
+    """
+    Steps of progress tokens of results in a fixed table of slots of a memory-mapped file
+    (an anonymous mapping if no file is configured or the app is tested):
+    a slot of a result (its id modulo the number of slots) holds the number of tokens
+    accepted since the persisted progress of the result (the base).
+    Processes of a node serialize updates with an exclusive lock of the file.
+    A result evicted by another one starts at step 0 again: its issued tokens are rejected
+    and the test continues from the persisted progress.
+
+    Methods:
+        - init_app
+        - get
+        - claim
+    """
+
+    def __init__(self, path=None, num_slots=65536):
+        self.num_slots = num_slots
+        self._table = MappedTable(path, num_slots * _SLOT.size)
+
+    def init_app(self, app):
+        """
+        Applies the configuration of a Flask App.
+
+        :param flask.Flask app: an instance of the Flask App
+        """
+        self.num_slots = app.config.get("QUIZ_PROGRESS_STEP_SLOTS", self.num_slots)
+        path = None if app.testing else app.config.get("QUIZ_PROGRESS_STEP_FILE",
+                                                       self._table.path)
+        self._table.configure(path, self.num_slots * _SLOT.size)
+
+    def _read(self, table, result_id, base):
+        """
+        Reads the step of a result.
+
+        :param mmap.mmap table: the table of steps
+        :param int result_id: the primary key of an instance of "Result" ORM model
+        :param int base: the persisted progress of the result
+        :return tuple: the offset of the slot, the step
+        """
+        offset = result_id % self.num_slots * _SLOT.size
+        stored_id, stored_base, step = _SLOT.unpack_from(table, offset)
+        return offset, step if (stored_id, stored_base) == (result_id, base) else 0
+
+    def get(self, result_id, base):
+        """
+        Reads the current step of a result.
+
+        :param int result_id: the primary key of an instance of "Result" ORM model
+        :param int base: the persisted progress of the result
+        :return int: the step
+        """
+        with self._table.locked() as table:
+            return self._read(table, result_id, base)[1]
+
+    def claim(self, result_id, base, step):
+        """
+        Accepts a token of a result if its step is the current one
+        and increments the step.
+
+        :param int result_id: the primary key of an instance of "Result" ORM model
+        :param int base: the persisted progress the token extends
+        :param int step: the step of the token
+        :return bool: an indicator that the token has been accepted
+        """
+        with self._table.locked() as table:
+            offset, current = self._read(table, result_id, base)
+            if current != step:
+                return False
+            _SLOT.pack_into(table, offset, result_id, base, step + 1)
+            return True
+
+
+progress_steps = ProgressSteps()
+
+
+def _get_serializer():
+    """
+    Creates a serializer signing tokens with the secret key of the app.
+
+    :return URLSafeTimedSerializer: a serializer of tokens
+    """
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=_SALT)
+
+
+def start_progress(result):
+    """
+    Creates the progress of a test from its persisted state.
+
+    :param Result result: an instance of "Result" ORM model
+    :return dict: the progress
+    """
+    answered_at = result.answered_at.replace(tzinfo=timezone.utc).timestamp() \
+        if result.answered_at else None
+    return {
+        "r": result.id,              # result
+        "b": result.last_question,   # base: the persisted progress the token extends
+        "s": progress_steps.get(result.id, result.last_question),  # step: tokens accepted
+        "q": result.last_question,   # last answered question
+        "c": 0,                      # new correct answers
+        "i": 0,                      # new incorrect answers
+        "o": [],                     # ids of options selected since the base
+        "t": [],                     # seconds spent on the answers since the base (None: unknown)
+        "a": answered_at,            # the time of the last answer (or of the start), Unix time
+    }
+
+
+def advance_progress(progress, option_id, is_correct):
+    """
+    Adds an answer accepted with "ProgressSteps.claim" to the progress.
+
+    :param dict progress: the progress
+    :param int option_id: the primary key of a selected by user option
+    :param bool is_correct: an indicator of correctness of the answer
+    :return dict: the new progress
+    """
+    now = time()
+    return dict(progress,
+                s=progress["s"] + 1,
+                q=progress["q"] + 1,
+                c=progress["c"] + int(is_correct),
+                i=progress["i"] + int(not is_correct),
+                o=progress["o"] + [option_id],
+                t=progress["t"] + [now - progress["a"] if progress["a"] else None],
+                a=now)
+
+
+def dump_progress(progress):
+    """
+    Signs the progress.
+
+    :param dict progress: the progress
+    :return str: a token (sent in a hidden field of a form)
+    """
+    return _get_serializer().dumps(progress)
+
+
+def load_progress(token, result):
+    """
+    Verifies a token and extracts the progress.
+    Returns None if the token is forged, altered, expired,
+    issued for another result or based on an outdated state of the result
+    (replayed after a newer token has been accepted, the progress has been saved
+    or the test finished).
+
+    :param str token: a token
+    :param Result result: an instance of "Result" ORM model
+    :return dict/NoneType: the progress/None
+    """
+    try:
+        progress = _get_serializer().loads(
+            token, max_age=current_app.config['QUIZ_PROGRESS_TOKEN_MAX_AGE']
+        )
+    except BadSignature:  # SignatureExpired is a subclass
+        return None
+    if progress.get("r") != result.id or progress.get("b") != result.last_question \
+            or result.state != result.State.NEW \
+            or progress.get("s") != progress_steps.get(result.id, result.last_question):
+        return None
+    return progress
+
+
+def get_progress_positions(progress, test_snapshot):
+    """
+    Converts the options selected since the base
+    into their positions for the answer log of the result.
+
+    :param dict progress: the progress
+    :param TestSnapshot test_snapshot: a compiled copy of the related test
+    :return list: positions of the options
+    """
+    questions = [test_snapshot.get_question(progress["b"] + number)
+                 for number in range(1, len(progress["o"]) + 1)]
+    return [test_snapshot.get_position(question.id, option_id) if question else 0
+            for question, option_id in zip(questions, progress["o"])]
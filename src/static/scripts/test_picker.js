@@ -0,0 +1,51 @@
+// Typeahead test picker of the post form and the feed filter: suggests tests
+// by the beginning of the title and stores the id (or the "data-key" field,
+// e.g. "uuid") of the chosen test in the hidden field.
+(function () {
+    const picker = document.getElementById("test-picker");
+    if (!picker) {
+        return;
+    }
+    const target = document.getElementById(picker.dataset.target);
+    const suggestions = document.getElementById("test-picker-suggestions");
+    const key = picker.dataset.key || "id";
+    let timer = null;
+
+    function clear() {
+        suggestions.replaceChildren();
+    }
+
+    function choose(test) {
+        picker.value = test.title;
+        target.value = test[key];
+        clear();
+    }
+
+    function suggest() {
+        const url = picker.dataset.typeaheadUrl + "?q=" + encodeURIComponent(picker.value);
+        fetch(url, {credentials: "same-origin"})
+            .then((response) => response.json())
+            .then((tests) => {
+                clear();
+                tests.forEach((test) => {
+                    const item = document.createElement("button");
+                    item.type = "button";
+                    item.className = "list-group-item list-group-item-action";
+                    item.textContent = test.title;
+                    item.addEventListener("click", () => choose(test));
+                    suggestions.appendChild(item);
+                });
+            });
+    }
+
+    picker.addEventListener("input", () => {
+        target.value = "";  // a typed title must be confirmed by a choice
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 200);
+    });
+    document.addEventListener("click", (event) => {
+        if (event.target !== picker) {
+            clear();
+        }
+    });
+})();
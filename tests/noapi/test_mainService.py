@@ -1,9 +1,11 @@
+import json
 import os
 import unittest
 #
 from src import instantiate_test_app, db
 from src.auth.models import User
-from src.main.service import session_create, session_update, session_delete
+from src.main.service import select_fields, session_create, session_update, session_delete, \
+    stream_rows
 from config import Config
 
 
@@ -43,6 +45,27 @@ class TestModelCase(unittest.TestCase):
         no_user = User.query.first()
         self.assertNotIn(no_user, User.query.all())
 
+    def test_select_fields(self):
+        object_fields = {"uuid": str, "username": str, "email": str}
+        self.assertIs(select_fields(object_fields), object_fields)
+        self.assertEqual(list(select_fields(object_fields, "email, uuid")), ["uuid", "email"])
+        with self.assertRaises(ValueError):
+            select_fields(object_fields, "username,password_hash")
+
+    def test_stream_rows(self):
+        db.session.add_all([User(username=f"test{number}", email=f"test{number}@mail",
+                                 password_hash="-") for number in range(5)])
+        db.session.commit()
+        query = db.session.query(User.username.label("username")).order_by(User.id)
+        chunks = list(stream_rows(query, chunk_size=2))
+        self.assertEqual(len(chunks), 5)  # "[", 3 chunks of rows, "]"
+        self.assertEqual(json.loads("".join(chunks)),
+                         [{"username": f"test{number}"} for number in range(5)])
+        lines = "".join(stream_rows(query, ndjson=True, chunk_size=2)).splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"username": f"test{number}"} for number in range(5)])
+        self.assertEqual(json.loads("".join(stream_rows(query.filter(db.false())))), [])
+
     def test_error_pages(self):
         get_404 = self.client.get("/notexists/page")
         self.assertEqual(get_404.status_code, 404)